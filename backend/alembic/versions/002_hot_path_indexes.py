@@ -0,0 +1,49 @@
+"""Composite and partial indexes for hot query paths
+
+Revision ID: 002
+Revises: 001
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '002'
+down_revision = '001'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    # test_results: best score / history per (user, test), admin date ranges
+    op.create_index('ix_test_results_user_test_created', 'test_results', ['user_id', 'test_id', 'created_at'], if_not_exists=True)
+    op.create_index('ix_test_results_created_at', 'test_results', ['created_at'], if_not_exists=True)
+
+    # test_sessions: only unfinished sessions are looked up by (user, test)
+    op.create_index('ix_test_sessions_active', 'test_sessions', ['user_id', 'test_id'], if_not_exists=True,
+                    postgresql_where=sa.text('completed = false'))
+
+    # questions: question pool of a test category
+    op.create_index('ix_questions_test_category', 'questions', ['test_category'], if_not_exists=True)
+
+    # notifications: list by user ordered by date, unread counter
+    op.create_index('ix_notifications_user_created', 'notifications', ['user_id', 'created_at'], if_not_exists=True)
+    op.create_index('ix_notifications_user_unread', 'notifications', ['user_id'], if_not_exists=True,
+                    postgresql_where=sa.text('read = false'))
+
+    # applications: user's applications by date, open application check, admin list by status
+    op.create_index('ix_applications_user_created', 'applications', ['user_id', 'created_at'], if_not_exists=True)
+    op.create_index('ix_applications_user_open', 'applications', ['user_id'], if_not_exists=True,
+                    postgresql_where=sa.text("status IN ('submitted', 'reviewing')"))
+    op.create_index('ix_applications_status_created', 'applications', ['status', 'created_at'], if_not_exists=True)
+
+def downgrade() -> None:
+    op.drop_index('ix_applications_status_created', table_name='applications', if_exists=True)
+    op.drop_index('ix_applications_user_open', table_name='applications', if_exists=True)
+    op.drop_index('ix_applications_user_created', table_name='applications', if_exists=True)
+    op.drop_index('ix_notifications_user_unread', table_name='notifications', if_exists=True)
+    op.drop_index('ix_notifications_user_created', table_name='notifications', if_exists=True)
+    op.drop_index('ix_questions_test_category', table_name='questions', if_exists=True)
+    op.drop_index('ix_test_sessions_active', table_name='test_sessions', if_exists=True)
+    op.drop_index('ix_test_results_created_at', table_name='test_results', if_exists=True)
+    op.drop_index('ix_test_results_user_test_created', table_name='test_results', if_exists=True)
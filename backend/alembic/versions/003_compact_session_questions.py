@@ -0,0 +1,41 @@
+"""Store question ids instead of full payloads in test_sessions.questions
+
+Revision ID: 003
+Revises: 002
+Create Date: 2026-10-19 14:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '003'
+down_revision = '002'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    # Old rows hold a JSON string with the serialized list of full questions:
+    # replace it with the ordered list of their ids. Space of the old tuples
+    # is reclaimed by autovacuum (or VACUUM FULL test_sessions after upgrade).
+    op.execute("""
+        UPDATE test_sessions
+        SET questions = (
+            SELECT COALESCE(json_agg(item.value ->> 'id' ORDER BY item.ordinality), '[]'::json)
+            FROM json_array_elements((test_sessions.questions #>> '{}')::json) WITH ORDINALITY AS item(value, ordinality)
+        )
+        WHERE json_typeof(questions) = 'string'
+    """)
+
+def downgrade() -> None:
+    # Rebuild the serialized payloads from the questions table
+    op.execute("""
+        UPDATE test_sessions
+        SET questions = to_json((
+            SELECT COALESCE(json_agg(json_build_object(
+                'id', q.id, 'text', q.text, 'options', q.options, 'type', q.question_type
+            ) ORDER BY item.ordinality), '[]'::json)::text
+            FROM json_array_elements_text(test_sessions.questions) WITH ORDINALITY AS item(value, ordinality)
+            JOIN questions q ON q.id = item.value
+        ))
+        WHERE json_typeof(questions) = 'array'
+    """)
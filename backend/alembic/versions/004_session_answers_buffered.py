@@ -0,0 +1,21 @@
+"""Mark test sessions whose answers went through the Redis buffer
+
+Revision ID: 004
+Revises: 003
+Create Date: 2026-10-19 16:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '004'
+down_revision = '003'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    # IF NOT EXISTS: init_db may already have added the column
+    op.execute("ALTER TABLE test_sessions ADD COLUMN IF NOT EXISTS answers_buffered BOOLEAN NOT NULL DEFAULT false")
+
+def downgrade() -> None:
+    op.execute("ALTER TABLE test_sessions DROP COLUMN IF EXISTS answers_buffered")
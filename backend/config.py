@@ -28,6 +28,11 @@ class Settings(BaseSettings):
     upload_dir: str = "uploads"
     max_file_size: int = 10 * 1024 * 1024  # 10MB
     
+    # Test answers write-behind buffer
+    answer_buffer_enabled: bool = False  # answers go to a Redis hash, Postgres is written on checkpoints and completion
+    answer_buffer_ttl: int = 6 * 3600  # seconds
+    answer_buffer_checkpoint_interval: int = 60  # seconds between Postgres checkpoints of a session
+    
     class Config:
         env_file = ".env"
         extra = "ignore"  # Игнорировать дополнительные поля
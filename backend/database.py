@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine, text  
+from sqlalchemy import create_engine, text, inspect  
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
@@ -115,8 +115,8 @@ class RedisProxy:
     def get(self, key):
         return self._execute_with_fallback('get', key)
     
-    def set(self, key, value, ex=None):
-        return self._execute_with_fallback('set', key, value, ex=ex)
+    def set(self, key, value, ex=None, nx=False):
+        return self._execute_with_fallback('set', key, value, ex=ex, nx=nx)
     
     def delete(self, *keys):
         return self._execute_with_fallback('delete', *keys)
@@ -135,6 +135,15 @@ class RedisProxy:
     
     def ttl(self, key):
         return self._execute_with_fallback('ttl', key)
+    
+    def hset(self, name, key, value):
+        return self._execute_with_fallback('hset', name, key, value)
+    
+    def hgetall(self, name):
+        return self._execute_with_fallback('hgetall', name)
+    
+    def hlen(self, name):
+        return self._execute_with_fallback('hlen', name)
 
 # Create smart Redis proxy
 redis_client = RedisProxy(redis_client)
@@ -146,11 +155,40 @@ async def get_db():
         finally:
             await session.close()
 
+def _create_missing_indexes(connection):
+    """create_all skips existing tables, so indexes added to models later are created here"""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+def _add_missing_columns(connection):
+    """create_all does not alter existing tables, so columns added to models later are created here"""
+    inspector = inspect(connection)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            if not column.nullable and column.server_default is None:
+                print(f"⚠️ Column {table.name}.{column.name} needs a migration")
+                continue
+            ddl = f"ALTER TABLE {table.name} ADD COLUMN IF NOT EXISTS {column.name} {column.type.compile(dialect=connection.dialect)}"
+            if column.server_default is not None:
+                ddl += f" DEFAULT {column.server_default.arg.text}"
+            if not column.nullable:
+                ddl += " NOT NULL"
+            connection.execute(text(ddl))
+            print(f"✅ Added column {table.name}.{column.name}")
+
 async def init_db():
     """Initialize database tables"""
     try:
         async with engine.begin() as conn:
             await conn.run_sync(Base.metadata.create_all)
+            await conn.run_sync(_add_missing_columns)
+            await conn.run_sync(_create_missing_indexes)
         print("✅ Database tables initialized")
     except Exception as e:
         print(f"❌ Database initialization failed: {e}")
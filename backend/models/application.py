@@ -1,10 +1,17 @@
-from sqlalchemy import Column, String, DateTime, JSON
+from sqlalchemy import Column, String, DateTime, JSON, Index, text
 from sqlalchemy.sql import func
 from database import Base
 import uuid
 
 class Application(Base):
     __tablename__ = "applications"
+    __table_args__ = (
+        Index("ix_applications_user_created", "user_id", "created_at"),
+        # Duplicate check for an open application on submit
+        Index("ix_applications_user_open", "user_id",
+              postgresql_where=text("status IN ('submitted', 'reviewing')")),
+        Index("ix_applications_status_created", "status", "created_at"),
+    )
 
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     user_id = Column(String, nullable=False)
@@ -1,10 +1,15 @@
-from sqlalchemy import Column, String, DateTime, Boolean, Text, JSON
+from sqlalchemy import Column, String, DateTime, Boolean, Text, JSON, Index, text
 from sqlalchemy.sql import func
 from database import Base
 import uuid
 
 class Notification(Base):
     __tablename__ = "notifications"
+    __table_args__ = (
+        Index("ix_notifications_user_created", "user_id", "created_at"),
+        # Unread count and mark-all-read touch only unread rows
+        Index("ix_notifications_user_unread", "user_id", postgresql_where=text("read = false")),
+    )
 
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     user_id = Column(String, nullable=False)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, JSON, Float
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, JSON, Float, Index, text
 from sqlalchemy.sql import func
 from database import Base
 from sqlalchemy.ext.mutable import MutableDict
@@ -19,6 +19,9 @@ class Test(Base):
 
 class Question(Base):
     __tablename__ = "questions"
+    __table_args__ = (
+        Index("ix_questions_test_category", "test_category"),
+    )
 
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     test_category = Column(String, nullable=False)
@@ -32,22 +35,31 @@ class Question(Base):
 
 class TestSession(Base):
     __tablename__ = "test_sessions"
+    __table_args__ = (
+        # Active session lookup in start_test; completed sessions are not indexed
+        Index("ix_test_sessions_active", "user_id", "test_id", postgresql_where=text("completed = false")),
+    )
 
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     user_id = Column(String, nullable=False)
     test_id = Column(String, nullable=False)
-    questions = Column(JSON)  # Selected questions for this session
+    questions = Column(JSON)  # Ordered ids of the selected questions
     answers = Column(MutableDict.as_mutable(JSON), default=lambda: {})  # 🔥 ИСПРАВЛЕНО: MutableDict с default factory
     score = Column(Float, nullable=True)
     total_questions = Column(Integer)
     correct_answers = Column(Integer, default=0)
     completed = Column(Boolean, default=False)
+    answers_buffered = Column(Boolean, default=False, server_default=text("false"), nullable=False)  # answers went through the Redis buffer
     started_at = Column(DateTime(timezone=True), server_default=func.now())
     completed_at = Column(DateTime(timezone=True), nullable=True)
     time_spent = Column(Integer, default=0)  # seconds
 
 class TestResult(Base):
     __tablename__ = "test_results"
+    __table_args__ = (
+        Index("ix_test_results_user_test_created", "user_id", "test_id", "created_at"),
+        Index("ix_test_results_created_at", "created_at"),
+    )
 
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     user_id = Column(String, nullable=False)
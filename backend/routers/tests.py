@@ -3,15 +3,15 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, and_
 from pydantic import BaseModel
 from typing import List, Optional
-import random
 from datetime import datetime, timedelta, timezone
 import json
 from database import get_db, redis_client
 from models.user import User
-from models.test import Test, Question, TestSession, TestResult
+from models.test import Test, TestSession, TestResult
 from routers.auth import get_current_user
-from services.test_service import TestService
+from services.test_service import TestService, question_pool_cache, session_question_ids
 from services.notification_service import NotificationService
+from services.answer_buffer import AnswerBuffer, AnswerBufferUnavailable
 from utils import calculate_level
 from sqlalchemy.orm.attributes import flag_modified
 router = APIRouter()
@@ -121,7 +121,9 @@ async def start_test(
     
     if active_session:
         # Return existing session
-        questions = json.loads(active_session.questions)
+        questions = await question_pool_cache.get_payloads(
+            db, test.category, session_question_ids(active_session)
+        )
         return {
             "session_id": active_session.id,
             "questions": questions,
@@ -129,42 +131,33 @@ async def start_test(
             "started_at": active_session.started_at,
         }
     
-    # Get random questions
-    questions_result = await db.execute(
-        select(Question).where(Question.test_category == test.category)
-    )
-    all_questions = questions_result.scalars().all()
+    # Get random questions from the cached category pool
+    pool = await question_pool_cache.get(db, test.category)
     
-    if len(all_questions) < test.questions_count:
+    if len(pool) < test.questions_count:
         raise HTTPException(status_code=400, detail="Not enough questions available")
     
-    selected_questions = random.sample(list(all_questions), test.questions_count)
+    selected_ids = pool.sample(test.questions_count)
     
     # Create session
     session = TestSession(
         user_id=current_user.id,
         test_id=test_id,
-        total_questions=len(selected_questions),
-        questions=json.dumps([
-            {
-                "id": q.id,
-                "text": q.text,
-                "options": q.options,
-                "type": q.question_type,
-            }
-            for q in selected_questions
-        ])
+        total_questions=len(selected_ids),
+        questions=selected_ids,
+        answers_buffered=AnswerBuffer.enabled()
     )
     
     db.add(session)
     await db.commit()
     await db.refresh(session)
     
-    questions = json.loads(session.questions)
+    if session.answers_buffered:
+        AnswerBuffer.register_session(session.id, current_user.id, session.total_questions)
     
     return {
         "session_id": session.id,
-        "questions": questions,
+        "questions": [pool.payloads[qid] for qid in selected_ids],
         "time_limit": test.time_limit,
         "started_at": session.started_at,
     }
@@ -181,6 +174,19 @@ async def submit_answer(
     print(f"❓ Question ID: {request.question_id}")
     print(f"💬 Answer: '{request.answer}'")
     
+    # Write-behind mode: answer goes to the Redis hash, Postgres is updated on checkpoints
+    if AnswerBuffer.enabled():
+        try:
+            buffered = await AnswerBuffer.add_answer(
+                session_id, current_user.id, request.question_id, request.answer, db
+            )
+        except LookupError:
+            raise HTTPException(status_code=404, detail="Session not found or completed")
+        if buffered:
+            count, total = buffered
+            return {"success": True, "progress": count / total * 100 if total else 0}
+        print("⚠️ Answer buffer unavailable, writing to database")
+    
     # 🔥 ИСПРАВЛЕНО: Используем SELECT FOR UPDATE для блокировки строки
     try:
         # Получаем сессию с блокировкой для записи
@@ -220,6 +226,10 @@ async def submit_answer(
         await db.commit()
         print("✅ Answer saved to database")
         
+        if session.answers_buffered:
+            # Keep the Redis hash in line with the row: it overrides the row on completion
+            AnswerBuffer.sync_answer(session_id, request.question_id, request.answer)
+        
         # 🔥 ДОБАВЛЕНО: Дополнительная проверка что действительно сохранилось
         await db.refresh(session)
         saved_answers = session.answers or {}
@@ -289,6 +299,16 @@ async def complete_test(
     
     # 🔥 ДОБАВЛЕНО: Принудительно обновляем сессию из базы
     await db.refresh(session)
+    
+    # Flush answers from the write-behind buffer
+    try:
+        buffered_answers = AnswerBuffer.pending_answers(session)
+    except AnswerBufferUnavailable:
+        await db.rollback()
+        raise HTTPException(status_code=503, detail="Answers are temporarily unavailable, try again")
+    if buffered_answers:
+        session.answers = {**(session.answers or {}), **buffered_answers}
+        flag_modified(session, 'answers')
     final_answers = session.answers or {}
     
     print(f"✅ Session found, final answers count: {len(final_answers)}")
@@ -369,6 +389,8 @@ async def complete_test(
     # Clear progress cache
     try:
         redis_client.delete(f"test_progress:{session_id}")
+        if session.answers_buffered:
+            AnswerBuffer.clear(session_id)
     except Exception as e:
         print(f"Redis error: {e}")
     
@@ -393,6 +415,10 @@ async def get_test_progress(
 ):
     """Get test progress"""
     try:
+        if AnswerBuffer.enabled():
+            progress = AnswerBuffer.get_progress(session_id, current_user.id)
+            if progress:
+                return progress
         cached_progress = redis_client.get(f"test_progress:{session_id}")
         if cached_progress:
             return json.loads(cached_progress)
@@ -0,0 +1,145 @@
+"""
+Check that hot queries use the indexes from migration 002.
+
+Seeds synthetic rows inside a transaction, runs ANALYZE and EXPLAIN for each
+query the API issues on a hot path, and verifies that the expected index
+appears in the plan. The transaction is rolled back, so the script is safe
+to run against a development database (PostgreSQL only).
+
+Usage: python scripts/check_query_plans.py [--rows N] [--force-index]
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import select, func, text, and_, update
+from database import engine
+from models.test import Question, TestSession, TestResult
+from models.notifications import Notification
+from models.application import Application
+
+USER_ID = "plan-check-user"
+TEST_ID = "plan-check-test"
+
+SEED_SQL = [
+    """
+    INSERT INTO test_results (id, user_id, test_id, session_id, score, percentage, passed, time_spent, created_at)
+    SELECT 'plan-tr-' || i, 'plan-user-' || (i % 1000), 'plan-test-' || (i % 20), 'plan-s-' || i,
+           i % 20, i % 100, i % 3 = 0, 600, now() - (i || ' minutes')::interval
+    FROM generate_series(1, :rows) AS i
+    """,
+    """
+    INSERT INTO test_sessions (id, user_id, test_id, completed, started_at)
+    SELECT 'plan-ts-' || i, 'plan-user-' || (i % 1000), 'plan-test-' || (i % 20), i % 50 <> 0, now()
+    FROM generate_series(1, :rows) AS i
+    """,
+    """
+    INSERT INTO questions (id, test_category, text, correct_answer)
+    SELECT 'plan-q-' || i, 'plan-category-' || (i % 50), 'Question ' || i, '"A"'
+    FROM generate_series(1, :rows) AS i
+    """,
+    """
+    INSERT INTO notifications (id, user_id, title, message, type, read, created_at)
+    SELECT 'plan-n-' || i, 'plan-user-' || (i % 1000), 'Title', 'Message', 'reminder',
+           i % 20 <> 0, now() - (i || ' minutes')::interval
+    FROM generate_series(1, :rows) AS i
+    """,
+    """
+    INSERT INTO applications (id, user_id, personal_data, education, status, created_at)
+    SELECT 'plan-a-' || i, 'plan-user-' || (i % 1000), '{}', '{}',
+           CASE WHEN i % 25 = 0 THEN 'submitted' ELSE 'approved' END,
+           now() - (i || ' minutes')::interval
+    FROM generate_series(1, :rows) AS i
+    """,
+]
+
+def hot_queries():
+    """(description, statement, expected index) for each hot path"""
+    return [
+        ("best result for user and test",
+         select(TestResult).where(and_(TestResult.user_id == USER_ID, TestResult.test_id == TEST_ID))
+         .order_by(TestResult.percentage.desc()).limit(1),
+         "ix_test_results_user_test_created"),
+        ("recent attempts for user and test",
+         select(TestResult).where(and_(TestResult.user_id == USER_ID, TestResult.test_id == TEST_ID))
+         .order_by(TestResult.created_at.desc()).limit(5),
+         "ix_test_results_user_test_created"),
+        ("results since date (admin stats)",
+         select(func.count(TestResult.id)).where(TestResult.created_at >= func.now() - text("interval '1 hour'")),
+         "ix_test_results_created_at"),
+        ("active session for user and test",
+         select(TestSession).where(and_(
+             TestSession.user_id == USER_ID, TestSession.test_id == TEST_ID, TestSession.completed == False
+         )),
+         "ix_test_sessions_active"),
+        ("question pool of a category",
+         select(Question).where(Question.test_category == "plan-category-1"),
+         "ix_questions_test_category"),
+        ("notifications list",
+         select(Notification).where(Notification.user_id == USER_ID)
+         .order_by(Notification.created_at.desc()).limit(50),
+         "ix_notifications_user_created"),
+        ("unread notifications count",
+         select(func.count(Notification.id)).where(and_(Notification.user_id == USER_ID, Notification.read == False)),
+         "ix_notifications_user_unread"),
+        ("mark all notifications read",
+         update(Notification).where(and_(Notification.user_id == USER_ID, Notification.read == False))
+         .values(read=True),
+         "ix_notifications_user_unread"),
+        ("open application check",
+         select(Application).where(and_(
+             Application.user_id == USER_ID, Application.status.in_(["submitted", "reviewing"])
+         )),
+         "ix_applications_user_open"),
+        ("applications of user",
+         select(Application).where(Application.user_id == USER_ID).order_by(Application.created_at.desc()),
+         "ix_applications_user_created"),
+        ("applications by status (admin)",
+         select(Application).where(Application.status == "reviewing").order_by(Application.created_at.desc()).limit(50),
+         "ix_applications_status_created"),
+    ]
+
+async def check_plans(rows: int, force_index: bool) -> bool:
+    ok = True
+    async with engine.connect() as conn:
+        transaction = await conn.begin()
+        try:
+            print(f"🌱 Seeding {rows} rows per table...")
+            for sql in SEED_SQL:
+                await conn.execute(text(sql), {"rows": rows})
+            for table in ("test_results", "test_sessions", "questions", "notifications", "applications"):
+                await conn.execute(text(f"ANALYZE {table}"))
+            if force_index:
+                # Small tables may legitimately get a seq scan; check that the index is usable
+                await conn.execute(text("SET LOCAL enable_seqscan = off"))
+
+            for description, statement, index_name in hot_queries():
+                sql = statement.compile(engine.sync_engine, compile_kwargs={"literal_binds": True})
+                result = await conn.execute(text(f"EXPLAIN {sql}"))
+                plan = "\n".join(row[0] for row in result)
+                if index_name in plan:
+                    print(f"✅ {description}: {index_name}")
+                else:
+                    ok = False
+                    print(f"❌ {description}: expected {index_name}\n{plan}")
+        finally:
+            await transaction.rollback()
+    await engine.dispose()
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description="Verify that hot queries use their indexes")
+    parser.add_argument("--rows", type=int, default=20000, help="synthetic rows per table")
+    parser.add_argument("--force-index", action="store_true", help="disable sequential scans")
+    args = parser.parse_args()
+
+    if not asyncio.run(check_plans(args.rows, args.force_index)):
+        print("❌ Some queries do not use the expected indexes")
+        sys.exit(1)
+    print("✅ All hot queries use their indexes")
+
+if __name__ == "__main__":
+    main()
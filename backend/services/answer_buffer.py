@@ -0,0 +1,166 @@
+from typing import Dict, Optional, Tuple
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, update, and_
+from models.test import TestSession
+from database import redis_client
+from config import settings
+
+class AnswerBufferUnavailable(Exception):
+    """Buffered answers exist but Redis cannot be read right now"""
+
+class AnswerBuffer:
+    """
+    Write-behind buffer for test answers.
+
+    Answers are stored in a Redis hash per session (HSET), progress is HLEN.
+    Postgres gets the answers on complete_test and on periodic checkpoints,
+    so losing Redis loses at most answer_buffer_checkpoint_interval seconds
+    of answers. When Redis is unavailable callers fall back to writing
+    the session row directly. Sessions that ever used the buffer are marked
+    with TestSession.answers_buffered, so completion knows whether Redis
+    has to be read.
+    """
+
+    @staticmethod
+    def enabled() -> bool:
+        return settings.answer_buffer_enabled and redis_client.is_connected
+
+    @staticmethod
+    def _answers_key(session_id: str) -> str:
+        return f"test_answers:{session_id}"
+
+    @staticmethod
+    def _meta_key(session_id: str) -> str:
+        return f"test_answers_meta:{session_id}"
+
+    @staticmethod
+    def _checkpoint_key(session_id: str) -> str:
+        return f"test_answers_checkpoint:{session_id}"
+
+    @classmethod
+    def register_session(cls, session_id: str, user_id: str, total_questions: int):
+        """
+        Remember session owner and size so answers can be accepted without reading the row.
+        The session must already be marked answers_buffered.
+        """
+        redis_client.setex(cls._meta_key(session_id), settings.answer_buffer_ttl, f"{user_id}:{total_questions}")
+
+    @classmethod
+    async def _session_meta(cls, session_id: str, user_id: str, db: AsyncSession) -> Optional[int]:
+        """Total questions of an active session of the user, or None"""
+        meta = redis_client.get(cls._meta_key(session_id))
+        if meta:
+            owner, _, total = meta.rpartition(":")
+            return int(total) if owner == user_id else None
+
+        # Session started before buffering was enabled or Redis lost the key
+        result = await db.execute(
+            select(TestSession.total_questions).where(
+                and_(
+                    TestSession.id == session_id,
+                    TestSession.user_id == user_id,
+                    TestSession.completed == False
+                )
+            )
+        )
+        total = result.scalar_one_or_none()
+        if total is None:
+            return None
+        # The row is marked before the first buffered answer is accepted
+        await db.execute(
+            update(TestSession).where(TestSession.id == session_id).values(answers_buffered=True)
+        )
+        await db.commit()
+        cls.register_session(session_id, user_id, total)
+        return total
+
+    @classmethod
+    async def add_answer(
+        cls, session_id: str, user_id: str, question_id: str, answer: str, db: AsyncSession
+    ) -> Optional[Tuple[int, int]]:
+        """
+        Buffer an answer. Returns (answers count, total questions),
+        raises LookupError for an unknown session and returns None
+        if Redis failed and the answer must be written to Postgres.
+        """
+        total = await cls._session_meta(session_id, user_id, db)
+        if total is None:
+            raise LookupError(session_id)
+
+        answers_key = cls._answers_key(session_id)
+        redis_client.hset(answers_key, question_id, answer)
+        redis_client.expire(answers_key, settings.answer_buffer_ttl)
+        count = redis_client.hlen(answers_key)
+        if count is None:
+            return None
+
+        # One checkpoint per interval across all workers
+        if redis_client.set(cls._checkpoint_key(session_id), "1", ex=settings.answer_buffer_checkpoint_interval, nx=True):
+            await cls.checkpoint(session_id, db)
+        return count, total
+
+    @classmethod
+    def get_answers(cls, session_id: str) -> Optional[Dict[str, str]]:
+        """Buffered answers; None if Redis could not be read"""
+        return redis_client.hgetall(cls._answers_key(session_id))
+
+    @classmethod
+    def pending_answers(cls, session: TestSession) -> Dict[str, str]:
+        """
+        Answers to flush on completion. Raises AnswerBufferUnavailable if the
+        session was buffered but the hash cannot be read: finalizing without
+        those answers would lose them for good.
+        """
+        if not session.answers_buffered:
+            return {}
+        answers = cls.get_answers(session.id)
+        if answers is None:
+            raise AnswerBufferUnavailable(session.id)
+        return answers
+
+    @classmethod
+    def sync_answer(cls, session_id: str, question_id: str, answer: str):
+        """Mirror an answer written directly to Postgres, so an older buffered one cannot override it"""
+        answers_key = cls._answers_key(session_id)
+        redis_client.hset(answers_key, question_id, answer)
+        redis_client.expire(answers_key, settings.answer_buffer_ttl)
+
+    @classmethod
+    def get_progress(cls, session_id: str, user_id: str) -> Optional[Dict[str, float]]:
+        """Progress derived from HLEN, or None if the session is not buffered"""
+        meta = redis_client.get(cls._meta_key(session_id))
+        if not meta:
+            return None
+        owner, _, total = meta.rpartition(":")
+        if owner != user_id:
+            return None
+        count = redis_client.hlen(cls._answers_key(session_id)) or 0
+        return {"progress": count / int(total) * 100 if int(total) else 0, "answers": count}
+
+    @classmethod
+    async def checkpoint(cls, session_id: str, db: AsyncSession):
+        """Merge buffered answers into the session row (no-op once the session is completed)"""
+        buffered = cls.get_answers(session_id)
+        if not buffered:
+            # Nothing buffered or Redis unavailable: the next checkpoint retries
+            return
+        # Same row lock as submit_answer and complete_test: no lost updates
+        result = await db.execute(
+            select(TestSession.answers)
+            .where(and_(TestSession.id == session_id, TestSession.completed == False))
+            .with_for_update()
+        )
+        row = result.one_or_none()
+        if row is None:
+            await db.rollback()
+            return
+        await db.execute(
+            update(TestSession)
+            .where(TestSession.id == session_id)
+            .values(answers={**(row[0] or {}), **buffered})
+        )
+        await db.commit()
+
+    @classmethod
+    def clear(cls, session_id: str):
+        redis_client.delete(cls._answers_key(session_id), cls._meta_key(session_id), cls._checkpoint_key(session_id))
@@ -1,12 +1,164 @@
 import json
+import time
 import random
-from typing import Dict, List, Any
+import asyncio
+from abc import ABC, abstractmethod
+from typing import Dict, List, Any, Optional, Iterable
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from models.test import Test, Question, TestSession
 from database import redis_client
 from database import get_db
 
+# Question data is static between imports, so it is kept in process memory
+# per category. Another process (init_data, another worker) bumps the version
+# in Redis after changing questions; the local copy re-checks it every
+# CATEGORY_CACHE_CHECK_INTERVAL seconds and is dropped after
+# CATEGORY_CACHE_MAX_AGE even if Redis is unavailable.
+QUESTIONS_VERSION_KEY = "test:questions_version:"
+CATEGORY_CACHE_CHECK_INTERVAL = 30
+CATEGORY_CACHE_MAX_AGE = 3600
+
+def normalize_answer(value: Any) -> str:
+    """Answer form used for comparison: trimmed and case insensitive"""
+    return str(value).strip().lower()
+
+def questions_version(category: str) -> Optional[str]:
+    return redis_client.get(f"{QUESTIONS_VERSION_KEY}{category}")
+
+class CategoryCache(ABC):
+    """Per-category in-memory data loaded with one query and checked against the Redis version"""
+
+    def __init__(self):
+        # category -> {"data": ..., "version": ..., "loaded_at": ..., "checked_at": ...}
+        self._categories: Dict[str, Dict[str, Any]] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    @abstractmethod
+    async def _fetch(self, db: AsyncSession, category: str) -> Any:
+        """Loads the data of one category"""
+
+    def _fresh(self, category: str) -> Any:
+        entry = self._categories.get(category)
+        if entry is None:
+            return None
+        now = time.monotonic()
+        if now - entry["loaded_at"] > CATEGORY_CACHE_MAX_AGE:
+            return None
+        if now - entry["checked_at"] > CATEGORY_CACHE_CHECK_INTERVAL:
+            if questions_version(category) != entry["version"]:
+                return None
+            entry["checked_at"] = now
+        return entry["data"]
+
+    async def get(self, db: AsyncSession, category: str) -> Any:
+        data = self._fresh(category)
+        if data is not None:
+            return data
+
+        lock = self._locks.setdefault(category, asyncio.Lock())
+        async with lock:
+            data = self._fresh(category)
+            if data is not None:
+                return data
+
+            version = questions_version(category)
+            data = await self._fetch(db, category)
+            now = time.monotonic()
+            self._categories[category] = {
+                "data": data, "version": version, "loaded_at": now, "checked_at": now
+            }
+            return data
+
+    def drop(self, category: str):
+        self._categories.pop(category, None)
+
+class AnswerKeyCache(CategoryCache):
+    """question_id -> normalized correct answer"""
+
+    async def _fetch(self, db: AsyncSession, category: str) -> Dict[str, str]:
+        result = await db.execute(
+            select(Question.id, Question.correct_answer).where(Question.test_category == category)
+        )
+        return {question_id: normalize_answer(answer) for question_id, answer in result.all()}
+
+    async def get_keys(self, db: AsyncSession, category: Optional[str],
+                       question_ids: Iterable[str]) -> Dict[str, str]:
+        """Answer keys for the given questions; unknown ids are fetched with one IN query"""
+        question_ids = list(question_ids)
+        keys: Dict[str, str] = {}
+        if category:
+            category_keys = await self.get(db, category)
+            keys = {qid: category_keys[qid] for qid in question_ids if qid in category_keys}
+
+        missing = [qid for qid in question_ids if qid not in keys]
+        if missing:
+            result = await db.execute(
+                select(Question.id, Question.correct_answer).where(Question.id.in_(missing))
+            )
+            keys.update({question_id: normalize_answer(answer) for question_id, answer in result.all()})
+        return keys
+
+def session_question_ids(session: TestSession) -> List[str]:
+    """Ordered question ids of a session (older rows store full payloads as a JSON string)"""
+    questions = session.questions or []
+    if isinstance(questions, str):
+        questions = json.loads(questions)
+    return [q["id"] if isinstance(q, dict) else q for q in questions]
+
+def question_payload(question_id: str, text: str, options: Any, question_type: str) -> Dict[str, Any]:
+    """Question as sent to the client (without the correct answer)"""
+    return {"id": question_id, "text": text, "options": options, "type": question_type}
+
+class QuestionPool:
+    """Question ids of a category and their client payloads"""
+
+    def __init__(self, payloads: List[Dict[str, Any]]):
+        self.ids = [payload["id"] for payload in payloads]
+        self.payloads = {payload["id"]: payload for payload in payloads}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def sample(self, count: int) -> List[str]:
+        return random.sample(self.ids, count)
+
+class QuestionPoolCache(CategoryCache):
+    """Question pool used by start_test to sample a session and serve question bodies"""
+
+    async def _fetch(self, db: AsyncSession, category: str) -> QuestionPool:
+        result = await db.execute(
+            select(Question.id, Question.text, Question.options, Question.question_type)
+            .where(Question.test_category == category)
+        )
+        return QuestionPool([question_payload(*row) for row in result.all()])
+
+    async def get_payloads(self, db: AsyncSession, category: Optional[str],
+                           question_ids: List[str]) -> List[Dict[str, Any]]:
+        """Payloads in the given order; ids missing from the pool are fetched with one IN query"""
+        payloads: Dict[str, Dict[str, Any]] = {}
+        if category:
+            pool = await self.get(db, category)
+            payloads = {qid: pool.payloads[qid] for qid in question_ids if qid in pool.payloads}
+
+        missing = [qid for qid in question_ids if qid not in payloads]
+        if missing:
+            result = await db.execute(
+                select(Question.id, Question.text, Question.options, Question.question_type)
+                .where(Question.id.in_(missing))
+            )
+            payloads.update({row[0]: question_payload(*row) for row in result.all()})
+        return [payloads[qid] for qid in question_ids if qid in payloads]
+
+answer_key_cache = AnswerKeyCache()
+question_pool_cache = QuestionPoolCache()
+
+def invalidate_questions(category: str):
+    """Drop cached question data of a category here and in other processes (call after changing questions)"""
+    answer_key_cache.drop(category)
+    question_pool_cache.drop(category)
+    redis_client.incr(f"{QUESTIONS_VERSION_KEY}{category}")
+
 class TestService:
     def __init__(self):
         self.cache_prefix = "test:"
@@ -99,82 +251,34 @@ class TestService:
                     db.add(question)
             
             await db.commit()
+            invalidate_questions(category)
             break
 
-    # В backend/services/test_service.py, замените метод calculate_score:
-
     async def calculate_score(self, session: TestSession, db: AsyncSession) -> Dict[str, Any]:
         """Calculate test score"""
-        print(f"🧮 TestService.calculate_score started")
-        
-        questions = json.loads(session.questions)
+        question_ids = session_question_ids(session)
         answers = session.answers or {}
-        
-        print(f"📝 Total questions in test: {len(questions)}")
-        print(f"💬 Answers received from user: {len(answers)}")
-        print(f"📋 Question IDs in test: {[q['id'] for q in questions]}")
-        print(f"🔑 Answer keys submitted: {list(answers.keys())}")
-        
-        # Check which questions are missing answers
-        missing_questions = []
-        answered_questions = []
-        for q in questions:
-            if q['id'] in answers:
-                answered_questions.append(q['id'])
-            else:
-                missing_questions.append(q['id'])
-        
-        print(f"✅ Questions WITH answers: {answered_questions}")
-        print(f"❌ Questions WITHOUT answers: {missing_questions}")
-        
-        correct_count = 0
-        total_questions = len(questions)
-        
-        for question_data in questions:
-            question_id = question_data["id"]
-            user_answer = answers.get(question_id)
-            
-            print(f"\n🔍 Checking question {question_id[:8]}...")
-            print(f"👤 User answer: '{user_answer}'")
-            
-            if user_answer:
-                # Get correct answer from database
-                result = await db.execute(select(Question).where(Question.id == question_id))
-                question = result.scalar_one_or_none()
-                
-                if question:
-                    correct_answer = question.correct_answer
-                    print(f"✅ Correct answer: '{correct_answer}'")
-                    
-                    # Compare answers (case insensitive)
-                    user_clean = user_answer.strip().lower()
-                    correct_clean = correct_answer.strip().lower()
-                    
-                    if user_clean == correct_clean:
-                        correct_count += 1
-                        print(f"🎯 CORRECT! Running total: {correct_count}")
-                    else:
-                        print(f"❌ WRONG. User: '{user_clean}' vs Correct: '{correct_clean}'")
-                else:
-                    print(f"❌ Question not found in database!")
-            else:
-                print(f"⭕ No answer provided")
-        
-        percentage = (correct_count / total_questions) * 100 if total_questions > 0 else 0
-        print(f"\n📊 FINAL CALCULATION:")
-        print(f"   Correct answers: {correct_count}")
-        print(f"   Total questions: {total_questions}")
-        print(f"   Percentage: {percentage:.1f}%")
-        
-        # Get test to check passing score
+
+        # Get test to check passing score and find the answer key category
         result = await db.execute(select(Test).where(Test.id == session.test_id))
         test = result.scalar_one_or_none()
         passing_score = test.passing_score if test else 70
-        print(f"   Passing score required: {passing_score}%")
-        
+
+        keys = await answer_key_cache.get_keys(db, test.category if test else None, question_ids)
+
+        correct_count = 0
+        total_questions = len(question_ids)
+
+        for question_id in question_ids:
+            user_answer = answers.get(question_id)
+            correct_answer = keys.get(question_id)
+            # Compare answers (case insensitive)
+            if user_answer and correct_answer is not None and normalize_answer(user_answer) == correct_answer:
+                correct_count += 1
+
+        percentage = (correct_count / total_questions) * 100 if total_questions > 0 else 0
         passed = percentage >= passing_score
-        print(f"   Test passed: {passed}")
-        
+
         # Calculate points earned
         if passed:
             base_points = 50
@@ -183,10 +287,8 @@ class TestService:
         else:
             # Give some points even for failed attempts based on percentage
             points_earned = max(0, int(percentage * 0.5))
-        
-        print(f"   Points earned: {points_earned}")
-        
-        result_data = {
+
+        return {
             "score": correct_count,
             "total": total_questions,
             "correct": correct_count,
@@ -194,11 +296,6 @@ class TestService:
             "passed": passed,
             "points_earned": points_earned
         }
-        
-        print(f"🎯 TestService returning: {result_data}")
-        return result_data
-
-
 
     async def get_leaderboard(self, db: AsyncSession, limit: int = 100) -> List[Dict]:
         """Get user leaderboard"""
@@ -8,24 +8,20 @@ from app.history import ChatHistoryResponse, ChatDeleteResponse
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
-# Импортируем assistant'ов из других модулей
-from api_endpoints.teacher import teacher_assistant
-from api_endpoints.student import student_assistant
-
 class ChatClearRequest(BaseModel):
     session_id: str = "default"
 
+def _get_session_store(role: str, request: Request):
+    """Хранилище истории для роли (общее с чат-ассистентами)"""
+    store = request.state.chat_sessions.get(role.lower())
+    if store is None:
+        raise HTTPException(status_code=404, detail="Role not found")
+    return store
+
 @router.get("/{role}/chat/clear")
 async def clear_chat(role: str, request: Request, session_id: str = "default"):
     """Очистить историю чата"""
-    if role.lower() == "teacher":
-        if teacher_assistant:
-            teacher_assistant.clear_history(session_id)
-    elif role.lower() == "student":
-        if student_assistant:
-            student_assistant.clear_history(session_id)
-    else:
-        raise HTTPException(status_code=404, detail="Role not found")
+    await _get_session_store(role, request).clear(session_id)
     
     # Очищаем кеш
     cache_manager = request.state.cache
@@ -35,14 +31,9 @@ async def clear_chat(role: str, request: Request, session_id: str = "default"):
     return {"message": "История чата очищена"}
 
 @router.get("/{role}/chat/history", response_model=ChatHistoryResponse)
-async def get_chat_history(role: str, session_id: str = "default"):
+async def get_chat_history(role: str, request: Request, session_id: str = "default"):
     """Получить историю чата"""
-    if role.lower() == "teacher":
-        hist = teacher_assistant.histories.get(session_id, []) if teacher_assistant else []
-    elif role.lower() == "student":
-        hist = student_assistant.histories.get(session_id, []) if student_assistant else []
-    else:
-        raise HTTPException(status_code=404, detail="Role not found")
+    hist = await _get_session_store(role, request).get(session_id)
     
     conversation = [
         {
@@ -60,21 +51,16 @@ async def get_chat_history(role: str, session_id: str = "default"):
 @router.delete("/{role}/chat/history", response_model=ChatDeleteResponse)
 async def delete_chat_message(
     role: str,
+    request: Request,
     session_id: str = "default",
     message_id: int = None
 ):
     """Удалить сообщение из истории"""
-    if role.lower() == "teacher":
-        hist = teacher_assistant.histories.get(session_id, []) if teacher_assistant else []
-    elif role.lower() == "student":
-        hist = student_assistant.histories.get(session_id, []) if student_assistant else []
-    else:
-        raise HTTPException(status_code=404, detail="Role not found")
+    store = _get_session_store(role, request)
     
-    if message_id is None or message_id < 0 or message_id >= len(hist):
+    if message_id is None or not await store.delete_message(session_id, message_id):
         raise HTTPException(status_code=400, detail="Invalid message_id")
     
-    hist.pop(message_id)
     return {"message": f"Deleted message {message_id} from session {session_id}"}
 
 @router.get("/endpoints")
@@ -84,17 +70,20 @@ async def list_endpoints():
         "chat": {
             "teacher": {
                 "chat": "POST /api/teacher/chat",
+                "chat_stream": "POST /api/teacher/chat/stream (SSE)",
                 "history": "GET /api/teacher/chat/history",
                 "clear": "GET /api/teacher/chat/clear"
             },
             "student": {
                 "chat": "POST /api/student/chat",
+                "chat_stream": "POST /api/student/chat/stream (SSE)",
                 "history": "GET /api/student/chat/history",
                 "clear": "GET /api/student/chat/clear"
             }
         },
         "documents": {
             "list": "GET /api/{role}/docs",
+            "search": "GET /api/{role}/docs/search?q=...",
             "upload": "POST /api/{role}/docs/upload",
             "check_similarity": "POST /api/{role}/docs/check_similarity",
             "analyze": "POST /api/{role}/docs/analyze"
@@ -1,14 +1,14 @@
 from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Request
 from fastapi.responses import JSONResponse
 import os
-import aiofiles
+import uuid
 from pathlib import Path
 import logging
-from typing import Optional
+from typing import Optional, Tuple
 
 from data_management.document_manager import DocumentManager
-from core.async_processor import AsyncDocumentProcessor
-from app.utils import find_similar_files_async
+from app.utils import stream_upload_to_file, FileTooLargeError, extract_sources_list
+from data_management.document_processor import extract_document_text, create_chunks_by_sentence
 from config import settings
 
 logger = logging.getLogger(__name__)
@@ -18,6 +18,18 @@ router = APIRouter()
 teacher_doc_manager = DocumentManager(settings.data_folder)
 student_doc_manager = DocumentManager(settings.data_folder_stud)
 
+def _too_large(e: FileTooLargeError) -> HTTPException:
+    return HTTPException(status_code=413, detail=str(e))
+
+async def _save_temp_upload(file: UploadFile) -> Tuple[Path, str]:
+    """Потоково сохраняет загружаемый файл во временную папку, возвращает путь и md5"""
+    temp_dir = Path("temp")
+    temp_dir.mkdir(exist_ok=True)
+    # uuid-префикс: параллельные запросы с одинаковым именем файла не пересекаются
+    temp_path = temp_dir / f"{uuid.uuid4().hex}_{Path(file.filename).name}"
+    file_hash, _ = await stream_upload_to_file(file, temp_path, settings.max_file_size)
+    return temp_path, file_hash
+
 @router.get("/teacher/docs")
 async def list_teacher_docs():
     """Список документов для преподавателей"""
@@ -28,6 +40,26 @@ async def list_student_docs():
     """Список документов для студентов"""
     return student_doc_manager.get_active_documents()
 
+@router.get("/{role}/docs/search")
+async def search_docs(role: str, request: Request, q: str, limit: int = 20):
+    """Полнотекстовый поиск по каталогу и содержимому документов"""
+    if role not in ["teacher", "student"]:
+        raise HTTPException(status_code=400, detail="Invalid role")
+    if not q.strip():
+        raise HTTPException(status_code=400, detail="Query is required")
+    
+    doc_manager = teacher_doc_manager if role == "teacher" else student_doc_manager
+    processor = request.state.processor
+    try:
+        # Подхватываем файлы, положенные в папку в обход загрузки
+        await processor.run_in_thread(doc_manager.sync_content_indexes)
+        results = await processor.run_in_thread(doc_manager.search_documents, q, min(max(limit, 1), 100))
+    except Exception as e:
+        logger.error(f"Document search error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    return {"query": q, "results": results}
+
 @router.post("/{role}/docs/upload")
 async def upload_doc(
     role: str,
@@ -40,38 +72,46 @@ async def upload_doc(
         if role not in ["teacher", "student"]:
             raise HTTPException(status_code=400, detail="Invalid role")
         
-        # Проверка размера файла
+        # Проверка размера файла (если клиент его сообщил)
         if file.size and file.size > settings.max_file_size:
-            raise HTTPException(
-                status_code=413,
-                detail=f"File too large. Max size: {settings.max_file_size / (1024*1024):.1f}MB"
-            )
+            raise _too_large(FileTooLargeError(settings.max_file_size))
         
         # Выбираем менеджеры
         doc_manager = teacher_doc_manager if role == "teacher" else student_doc_manager
         vectorstore_manager = request.state.teacher_vectorstore if role == "teacher" else request.state.student_vectorstore
         
-        # Сохраняем файл асинхронно
-        data_folder = settings.data_folder if role == "teacher" else settings.data_folder_stud
-        temp_path = Path(data_folder) / file.filename
-        
-        content = await file.read()
-        async with aiofiles.open(temp_path, 'wb') as f:
-            await f.write(content)
+        # Потоково пишем файл сразу в итоговое место, считая хеш и размер на лету
+        original_filename = Path(file.filename).name
+        stored_filename = doc_manager.make_stored_filename(original_filename)
+        try:
+            file_hash, file_size = await stream_upload_to_file(
+                file,
+                doc_manager.data_folder / stored_filename,
+                settings.max_file_size
+            )
+        except FileTooLargeError as e:
+            raise _too_large(e)
         
-        # Управление документами
+        # Управление документами (в thread pool: обновляет индекс почти-дубликатов)
+        processor = request.state.processor
+        if replace_doc_id:
+            await processor.run_in_thread(doc_manager.delete_document_by_id, replace_doc_id)
+        new_doc = await processor.run_in_thread(
+            doc_manager.register_stored_document,
+            stored_filename, original_filename, file_hash, file_size
+        )
         if replace_doc_id:
-            doc_manager.delete_document_by_id(replace_doc_id)
-            new_doc = doc_manager.add_document(str(temp_path))
             action = f"Replaced {replace_doc_id} → {new_doc['id']}"
         else:
-            new_doc = doc_manager.add_document(str(temp_path))
             action = f"Added new document {new_doc['id']}"
         
         # Асинхронная переиндексация
         logger.info(f"Triggering reindex for {role} after upload")
         await vectorstore_manager.rebuild_index()
         
+        # Индекс изменился — пересчитываем готовые ответы FAQ в фоне
+        request.state.faq_warmer.schedule(role)
+        
         # Очищаем кеш
         cache_manager = request.state.cache
         if cache_manager:
@@ -84,6 +124,8 @@ async def upload_doc(
             "document_id": new_doc['id']
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Upload error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -92,41 +134,79 @@ async def upload_doc(
 async def check_doc_similarity(
     role: str,
     request: Request,
-    file: UploadFile = File(...)
+    file: UploadFile = File(...),
+    mode: str = Form("minhash")
 ):
-    """Асинхронная проверка на дубликаты"""
+    """
+    Асинхронная проверка на дубликаты.
+    mode=minhash — почти-дубликаты целого документа по LSH-индексу;
+    mode=semantic — частичные пересечения по чанкам через FAISS-индекс коллекции.
+    """
     try:
         if role not in ["teacher", "student"]:
             raise HTTPException(status_code=400, detail="Invalid role")
+        if mode not in ["minhash", "semantic"]:
+            raise HTTPException(status_code=400, detail="Invalid mode")
         
-        # Сохраняем временный файл
-        temp_dir = Path("temp")
-        temp_dir.mkdir(exist_ok=True)
-        temp_path = temp_dir / file.filename
-        
-        content = await file.read()
-        async with aiofiles.open(temp_path, 'wb') as f:
-            await f.write(content)
-        
-        # Извлекаем текст асинхронно
-        processor = AsyncDocumentProcessor()
-        chunks = await processor.process_document(temp_path)
-        
-        if not chunks:
-            return {"possible_duplicates": []}
-        
-        # Объединяем текст из чанков
-        full_text = " ".join(chunk["text"] for chunk in chunks[:10])  # Берем первые 10 чанков
-        
-        # Ищем похожие файлы
-        folder = settings.data_folder if role == "teacher" else settings.data_folder_stud
-        duplicates = await find_similar_files_async(full_text, folder, threshold=0.7)
+        doc_manager = teacher_doc_manager if role == "teacher" else student_doc_manager
+        processor = request.state.processor
         
-        # Удаляем временный файл
-        temp_path.unlink()
+        # Сохраняем временный файл
+        try:
+            temp_path, file_hash = await _save_temp_upload(file)
+        except FileTooLargeError as e:
+            raise _too_large(e)
+        
+        # Точный дубликат определяется по хешу, посчитанному при загрузке
+        exact = await processor.run_in_thread(doc_manager.find_active_by_hash, file_hash)
+        if exact:
+            temp_path.unlink(missing_ok=True)
+            return {"mode": mode, "possible_duplicates": [{
+                "file": exact["stored_filename"],
+                "document_id": exact["id"],
+                "similarity": 100.0
+            }]}
+        
+        try:
+            # Извлекаем текст через общий сервис обработки
+            text = await processor.run_in_thread(extract_document_text, str(temp_path))
+        finally:
+            # Удаляем временный файл
+            temp_path.unlink(missing_ok=True)
+        
+        if not text or not text.strip():
+            return {"mode": mode, "possible_duplicates": []}
+        
+        if mode == "semantic":
+            vectorstore_manager = request.state.teacher_vectorstore if role == "teacher" else request.state.student_vectorstore
+            # Без нижнего порога размера: короткие файлы тоже должны проверяться
+            chunks = await processor.run_in_thread(
+                create_chunks_by_sentence,
+                text,
+                {},
+                settings.chunk_size,
+                1,
+                settings.chunk_overlap
+            )
+            duplicates = await vectorstore_manager.find_overlapping_documents(
+                [chunk["text"] for chunk in chunks],
+                threshold=settings.overlap_similarity_threshold
+            )
+            return {"mode": mode, "possible_duplicates": duplicates}
+        
+        # Добавляем в индекс файлы, появившиеся в папке в обход DocumentManager,
+        # и проверяем загруженный текст по LSH-бакетам
+        await processor.run_in_thread(doc_manager.sync_content_indexes)
+        duplicates = await processor.run_in_thread(
+            doc_manager.find_near_duplicates,
+            text,
+            settings.duplicate_threshold
+        )
         
-        return {"possible_duplicates": duplicates}
+        return {"mode": mode, "possible_duplicates": duplicates}
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Similarity check error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -144,42 +224,48 @@ async def analyze_doc(
             raise HTTPException(status_code=400, detail="Invalid role")
         
         # Обрабатываем файл
-        processor = AsyncDocumentProcessor()
-        temp_path = Path("temp") / file.filename
-        
-        content = await file.read()
-        async with aiofiles.open(temp_path, 'wb') as f:
-            await f.write(content)
+        processor = request.state.processor
+        try:
+            temp_path, _ = await _save_temp_upload(file)
+        except FileTooLargeError as e:
+            raise _too_large(e)
         
         # Извлекаем текст
-        chunks = await processor.process_document(temp_path)
-        temp_path.unlink()
+        try:
+            chunks = await processor.process_document(temp_path)
+        finally:
+            temp_path.unlink(missing_ok=True)
         
         if not chunks:
             return {"answer": "Не удалось извлечь текст из файла"}
         
         file_text = "\n".join(chunk["text"] for chunk in chunks)
         
-        # Используем chat assistant для анализа
-        from app.chat_assistant import ChatAssistant
+        # Один поиск и один вызов LLM через общий шлюз, без отдельного ChatAssistant и истории
         from app.prompts import get_teacher_prompt_template, get_student_prompt_template
+        from app.token_budget import TokenCounter, pack_context
         
         vectorstore_manager = request.state.teacher_vectorstore if role == "teacher" else request.state.student_vectorstore
         prompt = get_teacher_prompt_template() if role == "teacher" else get_student_prompt_template()
         
-        assistant = ChatAssistant(
-            vectorstore_manager=vectorstore_manager,
-            prompt_template=prompt,
-            cache_manager=request.state.cache
-        )
-        
         # Формируем запрос
         full_query = f"Проанализируй следующий документ:\n\n{file_text[:3000]}...\n\n{question if question else 'Дай краткое описание документа.'}"
         
-        answer, sources = await assistant.get_answer_async(full_query, "temp_analysis")
+        relevant_docs = await vectorstore_manager.search(full_query, k=settings.vector_search_k)
+        context, used_docs = pack_context(
+            relevant_docs, TokenCounter(settings.openai_model), settings.context_token_budget
+        )
+        
+        response = await request.state.llm.ainvoke(
+            prompt.format(chat_history="", context=context, question=full_query)
+        )
+        answer = response.content
+        sources = extract_sources_list(used_docs)
         
         return {"answer": answer, "sources": sources}
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Document analysis error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -195,11 +281,14 @@ async def delete_doc(role: str, doc_id: str, request: Request):
         vectorstore_manager = request.state.teacher_vectorstore if role == "teacher" else request.state.student_vectorstore
         
         # Удаляем документ
-        doc_manager.delete_document_by_id(doc_id)
+        await request.state.processor.run_in_thread(doc_manager.delete_document_by_id, doc_id)
         
         # Переиндексируем
         await vectorstore_manager.rebuild_index()
         
+        # Индекс изменился — пересчитываем готовые ответы FAQ в фоне
+        request.state.faq_warmer.schedule(role)
+        
         # Очищаем кеш
         cache_manager = request.state.cache
         if cache_manager:
@@ -9,7 +9,6 @@ import logging
 from docx import Document
 from docxtpl import DocxTemplate
 
-from config import settings
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -49,22 +48,14 @@ async def generate_file(request: Request):
                 
                 return {"download_url": f"/api/download/{filename}"}
         
-        # Генерация через OpenAI
-        from langchain_openai import ChatOpenAI
-        
-        llm = ChatOpenAI(
-            openai_api_key=settings.openai_api_key,
-            temperature=0.7,
-            model_name=settings.openai_model
-        )
-        
+        # Генерация через общий LLM шлюз
         prompt = f"""Сгенерируй подробный отчет по следующему описанию задачи. 
         Ответ дай в виде связного текста на русском языке.
         Структурируй ответ с заголовками и подразделами.
         
         Описание: {description}"""
         
-        response = await llm.ainvoke(prompt)
+        response = await request.state.llm.ainvoke(prompt, temperature=0.7)
         content = response.content.strip()
         
         # Кешируем результат
@@ -98,6 +89,8 @@ async def generate_file(request: Request):
         logger.info(f"Generated document: {filename}")
         return {"download_url": f"/api/download/{filename}"}
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Generation error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -5,6 +5,7 @@ import logging
 
 from app.chat_assistant import ChatAssistant
 from app.utils import extract_sources_list
+from app.streaming import chat_stream_response, cached_stream_response
 from app.prompts import get_student_prompt_template
 from config import settings
 
@@ -22,6 +23,23 @@ class ChatResponse(BaseModel):
     answer: str
     sources: list = []
 
+def _get_assistant(request: Request) -> ChatAssistant:
+    """Общий assistant роли (создается при первом запросе)"""
+    global student_assistant
+    if not student_assistant:
+        vectorstore_manager = request.state.student_vectorstore
+        cache_manager = request.state.cache
+        student_assistant = ChatAssistant(
+            vectorstore_manager=vectorstore_manager,
+            prompt_template=get_student_prompt_template(),
+            cache_manager=cache_manager,
+            session_store=request.state.chat_sessions["student"],
+            llm_gateway=request.state.llm,
+            single_flight=request.state.single_flight,
+            faq_store=request.state.faq_stores["student"]
+        )
+    return student_assistant
+
 @router.post("/chat", response_model=ChatResponse)
 async def student_chat(payload: ChatRequest, request: Request):
     """Оптимизированный chat endpoint для студентов"""
@@ -33,27 +51,24 @@ async def student_chat(payload: ChatRequest, request: Request):
         if not vectorstore_manager:
             raise HTTPException(status_code=503, detail="Vectorstore not initialized")
         
-        # Проверяем кеш
+        assistant = _get_assistant(request)
+        
+        # Кеш ответа эндпоинта и кеш ответа ассистента — одним запросом
         cache_key = f"student_chat:{payload.session_id}:{payload.query[:100]}"
-        cached_response = await cache_manager.get(cache_key) if cache_manager else None
+        prefetched = await cache_manager.get_many(
+            [cache_key, assistant.answer_cache_key(payload.query)]
+        ) if cache_manager else None
+        cached_response = prefetched.get(cache_key) if prefetched else None
         
         if cached_response:
             logger.info(f"Cache hit for student chat query")
             return ChatResponse(**cached_response)
         
-        # Инициализируем assistant если нужно
-        global student_assistant
-        if not student_assistant:
-            student_assistant = ChatAssistant(
-                vectorstore_manager=vectorstore_manager,
-                prompt_template=get_student_prompt_template(),
-                cache_manager=cache_manager
-            )
-        
         # Получаем ответ
-        answer, sources = await student_assistant.get_answer_async(
+        answer, sources = await assistant.get_answer_async(
             payload.query,
-            payload.session_id
+            payload.session_id,
+            prefetched
         )
         
         response = ChatResponse(answer=answer, sources=sources)
@@ -64,26 +79,58 @@ async def student_chat(payload: ChatRequest, request: Request):
         
         return response
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in student chat: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/chat/stream")
+async def student_chat_stream(payload: ChatRequest, request: Request):
+    """Потоковый chat endpoint (Server-Sent Events)"""
+    vectorstore_manager = request.state.student_vectorstore
+    cache_manager = request.state.cache
+    
+    if not vectorstore_manager:
+        raise HTTPException(status_code=503, detail="Vectorstore not initialized")
+    
+    assistant = _get_assistant(request)
+    
+    # Готовый ответ из кеша отдаем одним событием (оба ключа кеша — одним запросом)
+    cache_key = f"student_chat:{payload.session_id}:{payload.query[:100]}"
+    prefetched = await cache_manager.get_many(
+        [cache_key, assistant.answer_cache_key(payload.query)]
+    ) if cache_manager else None
+    cached_response = prefetched.get(cache_key) if prefetched else None
+    if cached_response:
+        logger.info(f"Cache hit for student chat stream query")
+        return cached_stream_response(cached_response)
+    
+    # При переполненной очереди к LLM отвечаем 429 до начала потока
+    request.state.llm.check_admission()
+    
+    return chat_stream_response(
+        assistant,
+        payload.query,
+        payload.session_id,
+        cache_manager=cache_manager,
+        cache_key=cache_key,
+        prefetched=prefetched
+    )
+
 @router.get("/history/{session_id}")
-async def get_history(session_id: str):
+async def get_history(session_id: str, request: Request):
     """Получить историю чата"""
-    if student_assistant:
-        return {"history": student_assistant.get_history(session_id)}
-    return {"history": []}
+    return {"history": await request.state.chat_sessions["student"].get(session_id)}
 
 @router.delete("/history/{session_id}")
 async def clear_history(session_id: str, request: Request):
     """Очистить историю чата"""
-    if student_assistant:
-        student_assistant.clear_history(session_id)
-        
-        # Очищаем кеш
-        cache_manager = request.state.cache
-        if cache_manager:
-            await cache_manager.clear_pattern(f"student_chat:{session_id}:*")
+    await request.state.chat_sessions["student"].clear(session_id)
+    
+    # Очищаем кеш
+    cache_manager = request.state.cache
+    if cache_manager:
+        await cache_manager.clear_pattern(f"student_chat:{session_id}:*")
     
-    return {"message": "История чата очищена"}
\ No newline at end of file
+    return {"message": "История чата очищена"}
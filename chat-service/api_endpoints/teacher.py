@@ -5,6 +5,7 @@ import logging
 
 from app.chat_assistant import ChatAssistant
 from app.utils import extract_sources_list
+from app.streaming import chat_stream_response, cached_stream_response
 from app.prompts import get_teacher_prompt_template
 from config import settings
 
@@ -28,6 +29,23 @@ async def initialize():
     global teacher_assistant
     # Assistant будет инициализирован в main.py через middleware
 
+def _get_assistant(request: Request) -> ChatAssistant:
+    """Общий assistant роли (создается при первом запросе)"""
+    global teacher_assistant
+    if not teacher_assistant:
+        vectorstore_manager = request.state.teacher_vectorstore
+        cache_manager = request.state.cache
+        teacher_assistant = ChatAssistant(
+            vectorstore_manager=vectorstore_manager,
+            prompt_template=get_teacher_prompt_template(),
+            cache_manager=cache_manager,
+            session_store=request.state.chat_sessions["teacher"],
+            llm_gateway=request.state.llm,
+            single_flight=request.state.single_flight,
+            faq_store=request.state.faq_stores["teacher"]
+        )
+    return teacher_assistant
+
 @router.post("/chat", response_model=ChatResponse)
 async def teacher_chat(payload: ChatRequest, request: Request):
     """Оптимизированный chat endpoint с кешированием"""
@@ -39,27 +57,24 @@ async def teacher_chat(payload: ChatRequest, request: Request):
         if not vectorstore_manager:
             raise HTTPException(status_code=503, detail="Vectorstore not initialized")
         
-        # Проверяем кеш для полного ответа
+        assistant = _get_assistant(request)
+        
+        # Кеш ответа эндпоинта и кеш ответа ассистента — одним запросом
         cache_key = f"teacher_chat:{payload.session_id}:{payload.query[:100]}"
-        cached_response = await cache_manager.get(cache_key) if cache_manager else None
+        prefetched = await cache_manager.get_many(
+            [cache_key, assistant.answer_cache_key(payload.query)]
+        ) if cache_manager else None
+        cached_response = prefetched.get(cache_key) if prefetched else None
         
         if cached_response:
             logger.info(f"Cache hit for teacher chat query")
             return ChatResponse(**cached_response)
         
-        # Если assistant не инициализирован, создаем его
-        global teacher_assistant
-        if not teacher_assistant:
-            teacher_assistant = ChatAssistant(
-                vectorstore_manager=vectorstore_manager,
-                prompt_template=get_teacher_prompt_template(),
-                cache_manager=cache_manager
-            )
-        
         # Получаем ответ асинхронно
-        answer, sources = await teacher_assistant.get_answer_async(
+        answer, sources = await assistant.get_answer_async(
             payload.query,
-            payload.session_id
+            payload.session_id,
+            prefetched
         )
         
         response = ChatResponse(answer=answer, sources=sources)
@@ -70,26 +85,58 @@ async def teacher_chat(payload: ChatRequest, request: Request):
         
         return response
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in teacher chat: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/chat/stream")
+async def teacher_chat_stream(payload: ChatRequest, request: Request):
+    """Потоковый chat endpoint (Server-Sent Events)"""
+    vectorstore_manager = request.state.teacher_vectorstore
+    cache_manager = request.state.cache
+    
+    if not vectorstore_manager:
+        raise HTTPException(status_code=503, detail="Vectorstore not initialized")
+    
+    assistant = _get_assistant(request)
+    
+    # Готовый ответ из кеша отдаем одним событием (оба ключа кеша — одним запросом)
+    cache_key = f"teacher_chat:{payload.session_id}:{payload.query[:100]}"
+    prefetched = await cache_manager.get_many(
+        [cache_key, assistant.answer_cache_key(payload.query)]
+    ) if cache_manager else None
+    cached_response = prefetched.get(cache_key) if prefetched else None
+    if cached_response:
+        logger.info(f"Cache hit for teacher chat stream query")
+        return cached_stream_response(cached_response)
+    
+    # При переполненной очереди к LLM отвечаем 429 до начала потока
+    request.state.llm.check_admission()
+    
+    return chat_stream_response(
+        assistant,
+        payload.query,
+        payload.session_id,
+        cache_manager=cache_manager,
+        cache_key=cache_key,
+        prefetched=prefetched
+    )
+
 @router.get("/history/{session_id}")
-async def get_history(session_id: str):
+async def get_history(session_id: str, request: Request):
     """Получить историю чата"""
-    if teacher_assistant:
-        return {"history": teacher_assistant.get_history(session_id)}
-    return {"history": []}
+    return {"history": await request.state.chat_sessions["teacher"].get(session_id)}
 
 @router.delete("/history/{session_id}")
 async def clear_history(session_id: str, request: Request):
     """Очистить историю чата"""
-    if teacher_assistant:
-        teacher_assistant.clear_history(session_id)
-        
-        # Очищаем кеш для этой сессии
-        cache_manager = request.state.cache
-        if cache_manager:
-            await cache_manager.clear_pattern(f"teacher_chat:{session_id}:*")
+    await request.state.chat_sessions["teacher"].clear(session_id)
+    
+    # Очищаем кеш для этой сессии
+    cache_manager = request.state.cache
+    if cache_manager:
+        await cache_manager.clear_pattern(f"teacher_chat:{session_id}:*")
     
-    return {"message": "История чата очищена"}
\ No newline at end of file
+    return {"message": "История чата очищена"}
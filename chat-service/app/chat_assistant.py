@@ -1,14 +1,21 @@
-from typing import List, Dict, Tuple, Optional
+from typing import List, Dict, Tuple, Optional, AsyncIterator, Any
 from datetime import datetime
 import asyncio
+import hashlib
 import logging
-from langchain_openai import ChatOpenAI
-from langchain.chains import ConversationalRetrievalChain
+from langchain.chains.conversational_retrieval.prompts import CONDENSE_QUESTION_PROMPT
 from langchain.prompts import PromptTemplate
 
 from config import settings
 from core.vectorstore_manager import VectorstoreManager
 from core.cache_manager import CacheManager
+from core.session_store import ChatSessionStore
+from core.llm_gateway import LLMGateway
+from core.single_flight import SingleFlight
+from app.token_budget import TokenCounter, pack_context, pack_history, format_turn
+from app.prompts import get_history_summary_prompt
+from app.faq_warmer import record_question_background
+from data_management.faq_store import FaqAnswerStore
 
 logger = logging.getLogger(__name__)
 
@@ -17,136 +24,284 @@ class ChatAssistant:
         self,
         vectorstore_manager: VectorstoreManager,
         prompt_template: str,
-        cache_manager: Optional[CacheManager] = None
+        cache_manager: Optional[CacheManager] = None,
+        session_store: Optional[ChatSessionStore] = None,
+        llm_gateway: Optional[LLMGateway] = None,
+        single_flight: Optional[SingleFlight] = None,
+        faq_store: Optional[FaqAnswerStore] = None
     ):
         self.vectorstore_manager = vectorstore_manager
         self.cache_manager = cache_manager
-        self.histories: Dict[str, List[Dict]] = {}
+        # История сессий хранится в Redis и общая для всех воркеров
+        self.sessions = session_store or ChatSessionStore(cache_manager)
         
-        # Initialize LLM
-        self.llm = ChatOpenAI(
-            openai_api_key=settings.openai_api_key,
-            temperature=settings.openai_temperature,
-            model_name=settings.openai_model
-        )
+        # LLM вызывается через общий шлюз (лимит параллельных вызовов)
+        self.llm_gateway = llm_gateway or LLMGateway()
+        # Объединение одинаковых одновременных вопросов
+        self.single_flight = single_flight or SingleFlight(cache_manager)
+        # Заранее посчитанные ответы на частые вопросы (см. app/faq_warmer.py)
+        self.faq_store = faq_store
         
         # Create prompt
         self.prompt = PromptTemplate(
             template=prompt_template,
             input_variables=["chat_history", "context", "question"]
         )
+        self.token_counter = TokenCounter(settings.openai_model)
+        # Фоновые задачи обновления сводок истории (по session_id)
+        self._summary_tasks: Dict[str, asyncio.Task] = {}
         
-        # QA chain будет создаваться динамически
-        self._qa_chain = None
-    
-    def _get_qa_chain(self):
-        """Ленивая инициализация QA chain"""
-        if not self._qa_chain and self.vectorstore_manager.vectorstore:
-            self._qa_chain = ConversationalRetrievalChain.from_llm(
-                llm=self.llm,
-                retriever=self.vectorstore_manager.vectorstore.as_retriever(
-                    search_kwargs={"k": settings.vector_search_k}
-                ),
-                return_source_documents=True,
-                combine_docs_chain_kwargs={"prompt": self.prompt}
-            )
-        return self._qa_chain
+    async def _condense_question(self, user_query: str, chat_history: str) -> str:
+        """Переформулирует вопрос в самостоятельный; без истории LLM не вызывается"""
+        if not chat_history:
+            return user_query
+        
+        response = await self.llm_gateway.ainvoke(
+            CONDENSE_QUESTION_PROMPT.format(chat_history=chat_history, question=user_query)
+        )
+        return response.content.strip() or user_query
     
-    async def get_answer_async(self, user_query: str, session_id: str = "default") -> Tuple[str, List[str]]:
-        """Асинхронное получение ответа с кешированием"""
-        if session_id not in self.histories:
-            self.histories[session_id] = []
+    async def _prepare_prompt(self, user_query: str, session_id: Optional[str],
+                              query_vector: Optional[List[float]] = None) -> Tuple[str, list]:
+        """
+        Общая часть RAG-пайплайна: (при наличии истории) сжатие вопроса,
+        один поиск через кешируемый VectorstoreManager.search и сборка промпта
+        в пределах бюджета токенов. Возвращает промпт и вошедшие в него документы (для источников).
+        Без session_id вопрос обрабатывается без истории.
+        query_vector — эмбеддинг user_query, если он уже посчитан (поиск FAQ).
+        """
+        chat_history = await self._build_history(session_id) if session_id else ""
+        question = await self._condense_question(user_query, chat_history)
         
-        # Проверяем кеш для похожих вопросов
-        if self.cache_manager:
-            cache_key = f"answer:{user_query[:100]}"
-            cached_answer = await self.cache_manager.get(cache_key)
-            if cached_answer and isinstance(cached_answer, dict):
-                logger.debug(f"Using cached answer for similar query")
-                answer = cached_answer.get("answer", "")
-                sources = cached_answer.get("sources", [])
-                
-                # Добавляем в историю
-                self._add_to_history(session_id, user_query, answer, sources)
-                return answer, sources
-        
-        # Используем оптимизированный векторный поиск
         relevant_docs = await self.vectorstore_manager.search(
-            user_query,
-            k=settings.vector_search_k
+            question,
+            k=settings.vector_search_k,
+            query_vector=query_vector if question == user_query else None
         )
-        
-        # Конвертируем историю
-        chat_history = self._convert_history(session_id)
-        
-        # Запускаем chain в executor для избежания блокировки
-        qa_chain = self._get_qa_chain()
-        if not qa_chain:
-            logger.error("QA chain not initialized")
-            return "Извините, сервис временно недоступен.", []
-        
-        loop = asyncio.get_event_loop()
-        result = await loop.run_in_executor(
-            None,
-            lambda: qa_chain({
-                "question": user_query,
-                "chat_history": chat_history
-            })
+        context, used_docs = pack_context(relevant_docs, self.token_counter, settings.context_token_budget)
+        prompt_text = self.prompt.format(
+            chat_history=chat_history,
+            context=context,
+            question=question
         )
+        return prompt_text, used_docs
+    
+    async def _build_history(self, session_id: str) -> str:
+        """История для промпта: сводка ранних реплик и последние пары в пределах бюджета"""
+        history = await self.sessions.get(session_id)
+        if not history:
+            return ""
         
-        answer = result.get("answer", "")
-        source_docs = result.get("source_documents", [])
-        sources = self._extract_sources(source_docs)
-        
-        # Кешируем ответ
+        summary = await self.sessions.get_summary(session_id)
+        chat_history, overflow = pack_history(
+            history, summary, self.token_counter, settings.history_token_budget
+        )
+        if overflow and session_id not in self._summary_tasks:
+            # Сводка обновляется в фоне и используется со следующего вопроса
+            task = asyncio.create_task(self._update_summary(session_id, summary, overflow))
+            self._summary_tasks[session_id] = task
+            task.add_done_callback(lambda _: self._summary_tasks.pop(session_id, None))
+        return chat_history
+    
+    async def _update_summary(self, session_id: str, summary: Optional[Dict], overflow: List[Tuple[str, str, str]]):
+        """Добавляет вытесненные из бюджета реплики в сводку сессии"""
+        try:
+            budget = settings.history_token_budget
+            turns = self.token_counter.truncate(
+                "\n".join(format_turn(human, ai) for human, ai, _ in overflow),
+                budget * 4
+            )
+            response = await self.llm_gateway.ainvoke(get_history_summary_prompt().format(
+                max_words=budget // 4,
+                summary=summary.get("text", "") if summary else "—",
+                turns=turns
+            ))
+            text = self.token_counter.truncate(response.content.strip(), budget // 2)
+            await self.sessions.set_summary(session_id, {"text": text, "until": overflow[-1][2]})
+        except Exception as e:
+            logger.error(f"Error updating history summary for {session_id}: {e}")
+    
+    def _answer_key(self, user_query: str) -> str:
+        """Ключ ответа: коллекция, поколение индекса и нормализованный вопрос"""
+        normalized = " ".join(user_query.lower().split())
+        digest = hashlib.md5(normalized.encode()).hexdigest()
+        return f"{self.vectorstore_manager.collection}:{self.vectorstore_manager.generation}:{digest}"
+    
+    def answer_cache_key(self, user_query: str) -> str:
+        """Ключ кеша ответа (эндпоинты читают его вместе со своими ключами через get_many)"""
+        return f"answer:{self._answer_key(user_query)}"
+    
+    async def _get_cached_answer(self, cache_key: str,
+                                 prefetched: Optional[Dict[str, Any]] = None) -> Optional[Tuple[str, List[str]]]:
+        if not self.cache_manager:
+            return None
+        if prefetched is not None:
+            cached_answer = prefetched.get(cache_key)
+        else:
+            cached_answer = await self.cache_manager.get(cache_key)
+        if cached_answer and isinstance(cached_answer, dict):
+            return cached_answer.get("answer", ""), cached_answer.get("sources", [])
+        return None
+    
+    async def _cache_answer(self, cache_key: str, answer: str, sources: List[str]):
         if self.cache_manager:
             await self.cache_manager.set(
                 cache_key,
                 {"answer": answer, "sources": sources},
                 ttl=settings.cache_ttl
             )
+    
+    async def _compute_answer(self, user_query: str, session_id: str, cache_key: str,
+                              query_vector: Optional[List[float]] = None) -> Tuple[str, List[str]]:
+        """Один поиск, один вызов LLM (плюс сжатие вопроса, если есть история)"""
+        prompt_text, relevant_docs = await self._prepare_prompt(user_query, session_id, query_vector)
+        response = await self.llm_gateway.ainvoke(prompt_text)
+        
+        answer = response.content
+        sources = self._extract_sources(relevant_docs)
+        
+        # Кешируем ответ (его же подхватывают ожидающие в других процессах)
+        await self._cache_answer(cache_key, answer, sources)
+        return answer, sources
+    
+    async def _lookup_faq(self, user_query: str) -> Tuple[Optional[Tuple[str, List[str]]], Optional[List[float]]]:
+        """
+        Готовый ответ из таблицы FAQ для текущего поколения индекса.
+        Вторым элементом возвращается эмбеддинг вопроса, если он понадобился
+        (его переиспользует поиск по индексу, без второго вызова модели).
+        """
+        if not self.faq_store:
+            return None, None
+        generation = self.vectorstore_manager.generation
+        query_vector = None
+        try:
+            hit = self.faq_store.lookup_exact(user_query, generation)
+            if not hit and settings.faq_semantic_lookup and self.faq_store.is_current(generation):
+                loop = asyncio.get_running_loop()
+                vector = await loop.run_in_executor(None, self.faq_store.embeddings.embed_query, user_query)
+                # Индекс и таблица FAQ построены одной моделью — вектор годится и для поиска
+                if self.faq_store.embeddings is self.vectorstore_manager.embeddings:
+                    query_vector = vector
+                hit = await loop.run_in_executor(
+                    None, self.faq_store.lookup, user_query, generation,
+                    settings.faq_similarity_threshold, vector
+                )
+        except Exception as e:
+            logger.error(f"FAQ lookup error: {e}")
+            return None, query_vector
+        if not hit:
+            return None, query_vector
+        logger.debug(f"FAQ hit ({hit['score']}): {hit['question'][:50]}")
+        return (hit["answer"], hit["sources"]), None
+    
+    async def _find_ready_answer(
+        self, user_query: str, cache_key: str, prefetched: Optional[Dict[str, Any]] = None
+    ) -> Tuple[Optional[Tuple[str, List[str]]], Optional[List[float]]]:
+        """
+        Ответ без вызова LLM: кеш ответов, затем таблица FAQ.
+        prefetched — результат get_many, уже включавший cache_key (без повторного запроса в Redis).
+        Возвращает ответ (или None) и эмбеддинг вопроса, если он был посчитан.
+        """
+        record_question_background(self.cache_manager, self.vectorstore_manager.collection, user_query)
+        cached = await self._get_cached_answer(cache_key, prefetched)
+        if cached:
+            return cached, None
+        return await self._lookup_faq(user_query)
+    
+    async def generate_answer(self, question: str) -> Tuple[str, List[str]]:
+        """Ответ на вопрос без истории, кеша и FAQ (для пакетного прогрева)"""
+        prompt_text, relevant_docs = await self._prepare_prompt(question, None)
+        response = await self.llm_gateway.ainvoke(prompt_text)
+        return response.content, self._extract_sources(relevant_docs)
+    
+    async def get_answer_async(self, user_query: str, session_id: str = "default",
+                               prefetched: Optional[Dict[str, Any]] = None) -> Tuple[str, List[str]]:
+        """Асинхронное получение ответа с кешированием"""
+        # Проверяем кеш для похожих вопросов и таблицу FAQ
+        flight_key = self._answer_key(user_query)
+        cache_key = f"answer:{flight_key}"
+        cached, query_vector = await self._find_ready_answer(user_query, cache_key, prefetched)
+        if cached:
+            logger.debug(f"Using cached answer for similar query")
+            answer, sources = cached
+            
+            # Добавляем в историю
+            await self._add_to_history(session_id, user_query, answer, sources)
+            return answer, sources
+        
+        if not self.vectorstore_manager.vectorstore:
+            logger.error("Vectorstore not initialized")
+            return "Извините, сервис временно недоступен.", []
+        
+        # Одинаковые одновременные вопросы ждут одно вычисление
+        answer, sources = await self.single_flight.do(
+            flight_key,
+            lambda: self._compute_answer(user_query, session_id, cache_key, query_vector),
+            load=lambda: self._get_cached_answer(cache_key)
+        )
         
         # Добавляем в историю
-        self._add_to_history(session_id, user_query, answer, sources)
+        await self._add_to_history(session_id, user_query, answer, sources)
         
         return answer, sources
     
-    def _add_to_history(self, session_id: str, query: str, answer: str, sources: List[str]):
+    async def stream_answer_async(self, user_query: str, session_id: str = "default",
+                                  prefetched: Optional[Dict[str, Any]] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Потоковый ответ: события {"type": "token", "text": ...}, затем {"type": "sources", ...}.
+        История и кеш записываются только после полной генерации ответа
+        (если клиент отключился раньше, ничего не сохраняется).
+        Если такой же вопрос уже вычисляется в этом процессе, ответ берется из него целиком.
+        """
+        flight_key = self._answer_key(user_query)
+        cache_key = f"answer:{flight_key}"
+        cached, query_vector = await self._find_ready_answer(user_query, cache_key, prefetched)
+        
+        pending = self.single_flight.pending(flight_key)
+        if not cached and pending is not None:
+            cached = await asyncio.shield(pending)
+        
+        if cached:
+            answer, sources = cached
+            yield {"type": "token", "text": answer}
+            yield {"type": "sources", "sources": sources}
+            await self._add_to_history(session_id, user_query, answer, sources)
+            return
+        
+        # Ретривал один раз, документы переиспользуются для источников
+        prompt_text, relevant_docs = await self._prepare_prompt(user_query, session_id, query_vector)
+        
+        parts: List[str] = []
+        async for chunk in self.llm_gateway.astream(prompt_text):
+            if chunk.content:
+                parts.append(chunk.content)
+                yield {"type": "token", "text": chunk.content}
+        
+        answer = "".join(parts)
+        sources = self._extract_sources(relevant_docs)
+        yield {"type": "sources", "sources": sources}
+        
+        await self._cache_answer(cache_key, answer, sources)
+        await self._add_to_history(session_id, user_query, answer, sources)
+    
+    async def _add_to_history(self, session_id: str, query: str, answer: str, sources: List[str]):
         """Добавляет запись в историю"""
         timestamp = datetime.now().isoformat()
         
-        self.histories[session_id].append({
-            "role": "user",
-            "content": query,
-            "timestamp": timestamp
-        })
-        
-        self.histories[session_id].append({
-            "role": "assistant",
-            "content": answer,
-            "sources": sources,
-            "timestamp": timestamp
-        })
-        
-        # Ограничиваем размер истории
-        max_history = 100
-        if len(self.histories[session_id]) > max_history * 2:
-            self.histories[session_id] = self.histories[session_id][-max_history * 2:]
-    
-    def _convert_history(self, session_id: str) -> List[Tuple[str, str]]:
-        """Конвертирует историю в формат LangChain"""
-        history = self.histories.get(session_id, [])
-        pairs = []
-        last_user = None
-        
-        for entry in history[-20:]:  # Берем последние 10 пар
-            if entry["role"] == "user":
-                last_user = entry["content"]
-            elif entry["role"] == "assistant" and last_user:
-                pairs.append((last_user, entry["content"]))
-                last_user = None
-        
-        return pairs
+        await self.sessions.append(
+            session_id,
+            {
+                "role": "user",
+                "content": query,
+                "timestamp": timestamp
+            },
+            {
+                "role": "assistant",
+                "content": answer,
+                "sources": sources,
+                "timestamp": timestamp
+            }
+        )
     
     def _extract_sources(self, source_docs) -> List[str]:
         """Извлекает уникальные источники"""
@@ -161,11 +316,10 @@ class ChatAssistant:
         
         return sources[:5]  # Ограничиваем количество источников
     
-    def get_history(self, session_id: str) -> List[Dict]:
+    async def get_history(self, session_id: str) -> List[Dict]:
         """Получает историю чата"""
-        return self.histories.get(session_id, [])
+        return await self.sessions.get(session_id)
     
-    def clear_history(self, session_id: str):
+    async def clear_history(self, session_id: str):
         """Очищает историю чата"""
-        if session_id in self.histories:
-            self.histories[session_id] = []
\ No newline at end of file
+        await self.sessions.clear(session_id)
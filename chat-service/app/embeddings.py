@@ -3,16 +3,21 @@ from langchain.embeddings.base import Embeddings
 from typing import List
 import logging
 import os
+import time
+
+from config import settings
+from core.metrics import EMBEDDING_LATENCY, EMBEDDING_TEXTS
 
 logger = logging.getLogger(__name__)
 
 # Вариант 1: Использование OpenAI embeddings
 class OpenAIEmbeddingsWrapper(Embeddings):
-    def __init__(self):
+    def __init__(self, **kwargs):
         """Инициализация OpenAI embeddings"""
         self.embeddings = OpenAIEmbeddings(
             openai_api_key=os.getenv("OPENAI_API_KEY"),
-            model="text-embedding-ada-002"
+            model="text-embedding-ada-002",
+            **kwargs
         )
         logger.info("Initialized OpenAI embeddings")
     
@@ -97,11 +102,40 @@ class HuggingFaceEmbeddingsLocal(Embeddings):
         """Встраивание одного запроса"""
         return self.embed_texts([text])[0]
 
+class InstrumentedEmbeddings(Embeddings):
+    """Обертка над любой реализацией: задержка и число текстов в метриках"""
+    def __init__(self, embeddings: Embeddings):
+        self.embeddings = embeddings
+    
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        started = time.perf_counter()
+        try:
+            return self.embeddings.embed_documents(texts)
+        finally:
+            EMBEDDING_LATENCY.observe(time.perf_counter() - started, op="documents")
+            EMBEDDING_TEXTS.inc(len(texts), op="documents")
+    
+    def embed_query(self, text: str) -> List[float]:
+        started = time.perf_counter()
+        try:
+            return self.embeddings.embed_query(text)
+        finally:
+            EMBEDDING_LATENCY.observe(time.perf_counter() - started, op="query")
+            EMBEDDING_TEXTS.inc(op="query")
+
 # Выбираем реализацию в зависимости от настроек
 def get_embeddings():
     """Фабрика для создания embeddings"""
     use_openai = os.getenv("USE_OPENAI_EMBEDDINGS", "false").lower() == "true"
     
+    if settings.llm_backend == "stub":
+        # Заглушка принимает текст, а не токены tiktoken
+        logger.info(f"Using stub embeddings at {settings.llm_stub_url}")
+        return OpenAIEmbeddingsWrapper(
+            openai_api_base=settings.llm_stub_url,
+            check_embedding_ctx_length=False
+        )
+    
     if use_openai:
         logger.info("Using OpenAI embeddings")
         return OpenAIEmbeddingsWrapper()
@@ -116,4 +150,4 @@ def get_embeddings():
             return OpenAIEmbeddingsWrapper()
 
 # Глобальный экземпляр
-embeddings = get_embeddings()
\ No newline at end of file
+embeddings = InstrumentedEmbeddings(get_embeddings())
\ No newline at end of file
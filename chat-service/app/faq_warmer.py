@@ -0,0 +1,185 @@
+import asyncio
+import random
+from pathlib import Path
+from typing import Dict, List, Optional
+import logging
+
+from config import settings
+from core.cache_manager import CacheManager
+from data_management.faq_store import FaqAnswerStore, normalize_question
+
+logger = logging.getLogger(__name__)
+
+def _candidates_key(cache_manager: CacheManager, collection: str) -> str:
+    return cache_manager._make_key(f"faq_candidates:{collection}")
+
+# Незавершенные фоновые записи (ссылки, чтобы задачи не собрал GC)
+_pending_records: set = set()
+
+async def record_question(cache_manager: Optional[CacheManager], collection: str, question: str):
+    """Считает частоту вопросов коллекции (источник «добытых» FAQ)"""
+    if not cache_manager or not cache_manager.enabled or not cache_manager.redis_client:
+        return
+    normalized = normalize_question(question)
+    if not normalized or len(normalized) > 300:
+        return
+    key = _candidates_key(cache_manager, collection)
+    try:
+        async with cache_manager.redis_client.pipeline(transaction=False) as pipe:
+            pipe.zincrby(key, 1, normalized)
+            pipe.expire(key, settings.faq_candidates_ttl)
+            # Изредка обрезаем до самых частых, чтобы редкие вопросы не копились
+            if random.random() < settings.faq_candidates_trim_probability:
+                pipe.zremrangebyrank(key, 0, -(settings.faq_candidates_max + 1))
+            await pipe.execute()
+    except Exception as e:
+        logger.error(f"FAQ candidate record error: {e}")
+
+def record_question_background(cache_manager: Optional[CacheManager], collection: str, question: str):
+    """Учет вопроса вне пути запроса: ответ не ждет записи в Redis"""
+    if not cache_manager or not cache_manager.enabled or not cache_manager.redis_client:
+        return
+    task = asyncio.create_task(record_question(cache_manager, collection, question))
+    _pending_records.add(task)
+    task.add_done_callback(_pending_records.discard)
+
+def load_curated_questions(role: str) -> List[str]:
+    """Вопросы из курируемого списка faq/{role}.txt (по одному на строку, # — комментарий)"""
+    faq_file = Path(settings.faq_folder) / f"{role}.txt"
+    if not faq_file.exists():
+        return []
+    with open(faq_file, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+async def collect_faq_questions(cache_manager: Optional[CacheManager], role: str, collection: str) -> List[str]:
+    """Курируемые вопросы плюс самые частые из статистики, без дублей"""
+    questions = load_curated_questions(role)
+    limit = settings.faq_max_questions
+
+    if cache_manager and cache_manager.enabled and cache_manager.redis_client:
+        try:
+            mined = await cache_manager.redis_client.zrevrangebyscore(
+                _candidates_key(cache_manager, collection),
+                "+inf", settings.faq_min_count,
+                start=0, num=limit
+            )
+            questions += [item.decode("utf-8") if isinstance(item, bytes) else item for item in mined]
+        except Exception as e:
+            logger.error(f"FAQ candidates read error: {e}")
+
+    seen = set()
+    unique = []
+    for question in questions:
+        normalized = normalize_question(question)
+        if normalized and normalized not in seen:
+            seen.add(normalized)
+            unique.append(question)
+    return unique[:limit]
+
+async def warm_faq_answers(assistant, store: FaqAnswerStore, questions: List[str],
+                           concurrency: Optional[int] = None) -> int:
+    """
+    Отвечает на вопросы пакетом через RAG-пайплайн (без истории) и сохраняет
+    таблицу ответов для текущего поколения индекса. Возвращает число ответов.
+    """
+    vectorstore_manager = assistant.vectorstore_manager
+    generation = vectorstore_manager.generation
+    semaphore = asyncio.Semaphore(concurrency or settings.faq_warm_concurrency)
+
+    async def answer(question: str):
+        async with semaphore:
+            try:
+                return question, await assistant.generate_answer(question)
+            except Exception as e:
+                logger.error(f"FAQ warm-up failed for '{question[:50]}': {e}")
+                return question, None
+
+    results = [item for item in await asyncio.gather(*(answer(q) for q in questions)) if item[1]]
+    if not results:
+        return 0
+
+    loop = asyncio.get_running_loop()
+    embeddings = await loop.run_in_executor(None, store.embed_questions, [q for q, _ in results])
+    entries = [
+        {"question": question, "answer": answer, "sources": sources, "embedding": list(map(float, embedding))}
+        for (question, (answer, sources)), embedding in zip(results, embeddings)
+    ]
+
+    if vectorstore_manager.generation != generation:
+        logger.info(f"Index of {vectorstore_manager.collection} changed during FAQ warm-up, results dropped")
+        return 0
+
+    await loop.run_in_executor(None, store.replace, generation, entries)
+    logger.info(f"FAQ answers warmed for {vectorstore_manager.collection}: {len(entries)}")
+    return len(entries)
+
+class FaqWarmer:
+    """Фоновый прогрев FAQ после изменения индекса; одновременно не больше одного прогрева на роль"""
+    def __init__(self, assistants: Dict[str, object], stores: Dict[str, FaqAnswerStore],
+                 cache_manager: Optional[CacheManager] = None):
+        self.assistants = assistants
+        self.stores = stores
+        self.cache_manager = cache_manager
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._rerun: set = set()
+
+    def schedule(self, role: str):
+        """Запускает прогрев в фоне (повторно — после текущего, если он уже идет)"""
+        if role not in self.assistants:
+            return
+        task = self._tasks.get(role)
+        if task and not task.done():
+            self._rerun.add(role)
+            return
+        self._tasks[role] = asyncio.create_task(self._run(role))
+
+    async def _run(self, role: str):
+        while True:
+            self._rerun.discard(role)
+            try:
+                await self.warm(role)
+            except Exception as e:
+                logger.error(f"FAQ warm-up error for {role}: {e}")
+            if role not in self._rerun:
+                break
+
+    async def shutdown(self):
+        """Отменяет незавершенные прогревы"""
+        tasks = [task for task in self._tasks.values() if not task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def warm(self, role: str, force: bool = False) -> int:
+        assistant = self.assistants[role]
+        store = self.stores[role]
+        vectorstore_manager = assistant.vectorstore_manager
+        if not vectorstore_manager.vectorstore:
+            return 0
+        if not force and store.is_current(vectorstore_manager.generation):
+            return 0
+
+        # Прогревает один воркер на поколение индекса
+        redis_client = (self.cache_manager.redis_client
+                        if self.cache_manager and self.cache_manager.enabled else None)
+        lock_key = None
+        if redis_client and not force:
+            lock_key = self.cache_manager._make_key(
+                f"faq_warm:{vectorstore_manager.collection}:{vectorstore_manager.generation}"
+            )
+            if not await redis_client.set(lock_key, "1", nx=True, ex=settings.faq_warm_lock_ttl):
+                return 0
+
+        stored = 0
+        try:
+            questions = await collect_faq_questions(self.cache_manager, role, vectorstore_manager.collection)
+            if questions:
+                stored = await warm_faq_answers(assistant, store, questions)
+            return stored
+        finally:
+            # Лок остается только после успешного прогрева: иначе поколение можно прогреть снова
+            if lock_key and not stored:
+                try:
+                    await redis_client.delete(lock_key)
+                except Exception as e:
+                    logger.error(f"FAQ warm lock release error: {e}")
@@ -109,4 +109,16 @@ def get_student_flowchart_prompt():
         "- Для ветвлений, то есть условии, применяй ромбовидные узлы, фигура - ромб.\n"
         "- Для всех стрелок указывай текст условия или действия.\n\n"
         "Ответ (ТОЛЬКО Mermaid):"
-    )
\ No newline at end of file
+    )
+
+
+def get_history_summary_prompt():
+    return (
+        "Обнови краткое содержание диалога пользователя с университетским ассистентом. "
+        "Сохрани важные факты: о чем спрашивал пользователь, названия программ, даты, сроки, "
+        "номера документов и данные, которые пользователь сообщил о себе. "
+        "Пиши сжато, не длиннее {max_words} слов, на языке диалога.\n\n"
+        "Текущее краткое содержание:\n{summary}\n\n"
+        "Новые реплики:\n{turns}\n\n"
+        "Обновленное краткое содержание:"
+    )
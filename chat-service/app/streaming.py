@@ -0,0 +1,61 @@
+import json
+import logging
+from typing import Any, AsyncIterator, Optional
+
+from fastapi.responses import StreamingResponse
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+def sse_event(event: str, data: Any) -> str:
+    """Форматирует одно событие Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def _chat_event_stream(assistant, query: str, session_id: str,
+                             cache_manager=None, cache_key: Optional[str] = None,
+                             prefetched: Optional[dict] = None) -> AsyncIterator[str]:
+    answer_parts = []
+    try:
+        async for event in assistant.stream_answer_async(query, session_id, prefetched):
+            if event["type"] == "token":
+                answer_parts.append(event["text"])
+                yield sse_event("token", {"text": event["text"]})
+            elif event["type"] == "sources":
+                yield sse_event("sources", {"sources": event["sources"]})
+                # Ответ сгенерирован полностью — кешируем как обычный /chat
+                if cache_manager and cache_key:
+                    await cache_manager.set(
+                        cache_key,
+                        {"answer": "".join(answer_parts), "sources": event["sources"]},
+                        ttl=settings.cache_ttl
+                    )
+        yield sse_event("done", {})
+    except Exception as e:
+        logger.error(f"Error in chat stream: {e}")
+        yield sse_event("error", {"detail": str(e)})
+
+def chat_stream_response(assistant, query: str, session_id: str,
+                         cache_manager=None, cache_key: Optional[str] = None,
+                         prefetched: Optional[dict] = None) -> StreamingResponse:
+    """SSE-ответ чата: события token, затем sources и done (или error)"""
+    return StreamingResponse(
+        _chat_event_stream(assistant, query, session_id, cache_manager, cache_key, prefetched),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # nginx не должен буферизовать поток
+        }
+    )
+
+def cached_stream_response(cached: dict) -> StreamingResponse:
+    """SSE-ответ из готового кешированного ответа"""
+    async def events():
+        yield sse_event("token", {"text": cached.get("answer", "")})
+        yield sse_event("sources", {"sources": cached.get("sources", [])})
+        yield sse_event("done", {})
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -0,0 +1,146 @@
+from typing import List, Dict, Tuple, Optional
+import logging
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken ставится вместе с langchain-openai
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# Максимальная длина перекрытия соседних чанков (в словах), которую ищем
+MAX_OVERLAP_WORDS = 200
+
+class TokenCounter:
+    """Подсчет токенов для модели; без tiktoken — грубая оценка по символам"""
+    def __init__(self, model_name: str):
+        self._encoding = None
+        if tiktoken is None:
+            return
+        try:
+            self._encoding = tiktoken.encoding_for_model(model_name)
+        except KeyError:
+            self._encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            logger.warning(f"Tokenizer unavailable, using estimate: {e}")
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        return len(text) // 4 + 1
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Обрезает текст до max_tokens токенов"""
+        if max_tokens <= 0:
+            return ""
+        if self._encoding is not None:
+            tokens = self._encoding.encode(text, disallowed_special=())
+            return text if len(tokens) <= max_tokens else self._encoding.decode(tokens[:max_tokens])
+        return text[:max_tokens * 4]
+
+def _overlap_words(left: List[str], right: List[str]) -> int:
+    """Длина самого длинного суффикса left, совпадающего с префиксом right (в словах)"""
+    for size in range(min(len(left), len(right), MAX_OVERLAP_WORDS), 0, -1):
+        if left[-size:] == right[:size]:
+            return size
+    return 0
+
+def _chunk_position(doc) -> Tuple[Optional[str], Optional[int]]:
+    chunk_id = doc.metadata.get("chunk_id")
+    return doc.metadata.get("file_name"), chunk_id if isinstance(chunk_id, int) else None
+
+def pack_context(docs: list, counter: TokenCounter, budget: int) -> Tuple[str, list]:
+    """
+    Собирает контекст из найденных чанков в пределах бюджета токенов.
+    Чанки берутся по убыванию релевантности (в порядке выдачи поиска);
+    текст, повторяющийся на стыке соседних чанков одного файла, включается один раз.
+    Возвращает текст контекста и вошедшие в него документы.
+    """
+    selected: Dict[Tuple, Dict] = {}
+    order: List[Tuple] = []
+    used = 0
+
+    for rank, doc in enumerate(docs):
+        file_name, chunk_id = _chunk_position(doc)
+        words = doc.page_content.split()
+        start, end = 0, len(words)
+
+        if chunk_id is not None:
+            prev_item = selected.get((file_name, chunk_id - 1))
+            if prev_item:
+                start = _overlap_words(prev_item["words"], words)
+            next_item = selected.get((file_name, chunk_id + 1))
+            if next_item:
+                end = max(start, end - _overlap_words(words, next_item["words"]))
+
+        text = " ".join(words[start:end])
+        if not text:
+            continue
+
+        tokens = counter.count(text)
+        if used + tokens > budget:
+            if selected:
+                continue
+            # Самый релевантный чанк берем всегда, при необходимости обрезая
+            text = counter.truncate(text, budget)
+            tokens = counter.count(text)
+
+        key = (file_name, chunk_id) if chunk_id is not None else ("#", rank)
+        selected[key] = {"doc": doc, "words": words, "text": text, "rank": rank}
+        order.append(key)
+        used += tokens
+
+    # Файлы в порядке лучшего совпадения, чанки внутри файла — по порядку в документе
+    best_rank: Dict[str, int] = {}
+    for key in order:
+        best_rank.setdefault(key[0], selected[key]["rank"])
+    order.sort(key=lambda key: (best_rank[key[0]], key[1]))
+
+    context = "\n\n".join(selected[key]["text"] for key in order)
+    used_docs = [selected[key]["doc"] for key in sorted(order, key=lambda key: selected[key]["rank"])]
+    return context, used_docs
+
+def _pair_turns(history: List[Dict]) -> List[Tuple[str, str, str]]:
+    """Пары (вопрос, ответ, время ответа) из истории сессии"""
+    pairs = []
+    last_user = None
+    for entry in history:
+        if entry["role"] == "user":
+            last_user = entry["content"]
+        elif entry["role"] == "assistant" and last_user:
+            pairs.append((last_user, entry["content"], entry.get("timestamp", "")))
+            last_user = None
+    return pairs
+
+def format_turn(human: str, ai: str) -> str:
+    return f"Human: {human}\nAssistant: {ai}"
+
+def pack_history(history: List[Dict], summary: Optional[Dict], counter: TokenCounter,
+                 budget: int) -> Tuple[str, List[Tuple[str, str, str]]]:
+    """
+    Собирает историю для промпта: сводка ранних реплик плюс последние пары,
+    которые помещаются в бюджет. Возвращает текст и старые пары, не вошедшие
+    в бюджет и еще не попавшие в сводку (их нужно добавить в сводку).
+    """
+    summary_text = summary.get("text", "") if summary else ""
+    covered_until = summary.get("until", "") if summary else ""
+    pairs = [pair for pair in _pair_turns(history) if pair[2] > covered_until]
+
+    header = f"Краткое содержание предыдущего диалога: {summary_text}" if summary_text else ""
+    available = budget - counter.count(header)
+
+    kept: List[str] = []
+    split = len(pairs)
+    for index in range(len(pairs) - 1, -1, -1):
+        turn = format_turn(pairs[index][0], pairs[index][1])
+        tokens = counter.count(turn) + 1
+        if tokens > available:
+            break
+        kept.append(turn)
+        available -= tokens
+        split = index
+
+    parts = ([header] if header else []) + list(reversed(kept))
+    return "\n".join(parts), pairs[:split]
@@ -1,10 +1,9 @@
 import os
 import re
-import asyncio
+import hashlib
 import aiofiles
-import numpy as np
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Tuple
 from sentence_transformers import SentenceTransformer
 import logging
 
@@ -20,6 +19,44 @@ def get_sentence_model():
         _sentence_model = SentenceTransformer('all-MiniLM-L12-v2')
     return _sentence_model
 
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1MB
+
+class FileTooLargeError(Exception):
+    """Загружаемый файл превышает допустимый размер"""
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        super().__init__(f"File too large. Max size: {max_size / (1024*1024):.1f}MB")
+
+async def stream_upload_to_file(upload, dest_path: Path, max_size: int, chunk_size: int = UPLOAD_CHUNK_SIZE) -> Tuple[str, int]:
+    """
+    Потоково сохраняет UploadFile в dest_path, считая md5 и размер на лету.
+    Файл пишется во временный '<name>.part' и атомарно переименовывается,
+    поэтому незавершенная загрузка никогда не попадает в индексацию.
+    При превышении max_size частичный файл удаляется и выбрасывается FileTooLargeError.
+    """
+    dest_path = Path(dest_path)
+    part_path = dest_path.with_name(dest_path.name + ".part")
+    hash_md5 = hashlib.md5()
+    size = 0
+    
+    try:
+        async with aiofiles.open(part_path, 'wb') as f:
+            while True:
+                chunk = await upload.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_size:
+                    raise FileTooLargeError(max_size)
+                hash_md5.update(chunk)
+                await f.write(chunk)
+        os.replace(part_path, dest_path)
+    except BaseException:
+        part_path.unlink(missing_ok=True)
+        raise
+    
+    return hash_md5.hexdigest(), size
+
 def extract_sources_list(source_docs) -> List[str]:
     """Извлекает список уникальных источников"""
     seen = set()
@@ -31,29 +68,6 @@ def extract_sources_list(source_docs) -> List[str]:
             sources.append(file_name)
     return sources
 
-async def extract_text_from_file_async(filepath: str) -> str:
-    """Асинхронное извлечение текста из файла"""
-    ext = os.path.splitext(filepath)[1].lower()
-    
-    if ext == '.txt':
-        # Простой текстовый файл читаем асинхронно
-        import chardet
-        
-        # Определяем кодировку
-        async with aiofiles.open(filepath, 'rb') as f:
-            raw_data = await f.read(10000)
-        
-        detected = chardet.detect(raw_data)
-        encoding = detected['encoding'] or 'utf-8'
-        
-        async with aiofiles.open(filepath, 'r', encoding=encoding, errors='ignore') as f:
-            return await f.read()
-    
-    else:
-        # Для остальных форматов используем синхронную версию в executor
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(None, extract_text_from_file, filepath)
-
 def extract_text_from_file(filepath: str) -> str:
     """Синхронное извлечение текста (для executor)"""
     ext = os.path.splitext(filepath)[1].lower()
@@ -86,13 +100,16 @@ def extract_text_from_file(filepath: str) -> str:
             
         elif ext in ['.xlsx', '.xls']:
             import openpyxl
-            wb = openpyxl.load_workbook(filepath, data_only=True)
+            wb = openpyxl.load_workbook(filepath, read_only=True, data_only=True)
             text = []
-            for sheet in wb.worksheets:
-                for row in sheet.iter_rows(values_only=True):
-                    row_text = [str(cell) for cell in row if cell is not None]
-                    if row_text:
-                        text.append(' | '.join(row_text))
+            try:
+                for sheet in wb.worksheets:
+                    for row in sheet.iter_rows(values_only=True):
+                        row_text = [str(cell) for cell in row if cell is not None]
+                        if row_text:
+                            text.append(' | '.join(row_text))
+            finally:
+                wb.close()
             return '\n'.join(text)
             
         elif ext == '.pptx':
@@ -113,83 +130,8 @@ def extract_text_from_file(filepath: str) -> str:
     
     return ''
 
-def cosine_similarity(a: np.ndarray, b: np.ndarray) -> float:
-    """Вычисляет косинусное сходство"""
-    if not a.any() or not b.any():
-        return 0.0
-    return float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b)))
-
 def normalize_text(text: str) -> str:
     """Нормализует текст"""
     text = text.lower().strip()
     text = re.sub(r'\s+', ' ', text)
     return text
-
-async def find_similar_files_async(uploaded_text: str, folder: str, threshold: float = 0.7) -> List[Dict]:
-    """Асинхронный поиск похожих файлов"""
-    model = get_sentence_model()
-    uploaded_text_norm = normalize_text(uploaded_text)
-    
-    # Получаем embedding в executor
-    loop = asyncio.get_event_loop()
-    uploaded_emb = await loop.run_in_executor(
-        None,
-        lambda: model.encode([uploaded_text_norm], convert_to_numpy=True)[0]
-    )
-    
-    similar = []
-    folder_path = Path(folder)
-    
-    # Собираем все файлы
-    files = [f for f in folder_path.glob("**/*") 
-             if f.is_file() and f.suffix.lower() in [".docx", ".pdf", ".txt", ".xlsx", ".pptx"]]
-    
-    # Обрабатываем файлы параллельно
-    tasks = []
-    for file_path in files:
-        tasks.append(process_file_similarity(file_path, model, uploaded_emb, threshold))
-    
-    results = await asyncio.gather(*tasks, return_exceptions=True)
-    
-    for result in results:
-        if isinstance(result, dict) and result['similarity'] >= threshold:
-            similar.append(result)
-    
-    # Сортируем по схожести
-    similar.sort(key=lambda x: x['similarity'], reverse=True)
-    
-    # Возвращаем точные совпадения или топ-3
-    exact_matches = [f for f in similar if f['similarity'] == 100.0]
-    if exact_matches:
-        return exact_matches
-    
-    return similar[:3]
-
-async def process_file_similarity(file_path: Path, model, uploaded_emb: np.ndarray, threshold: float) -> Dict:
-    """Обрабатывает один файл для проверки схожести"""
-    try:
-        # Извлекаем текст
-        text = await extract_text_from_file_async(str(file_path))
-        if not text.strip():
-            return {'file': file_path.name, 'similarity': 0}
-        
-        text_norm = normalize_text(text)
-        
-        # Получаем embedding
-        loop = asyncio.get_event_loop()
-        emb = await loop.run_in_executor(
-            None,
-            lambda: model.encode([text_norm], convert_to_numpy=True)[0]
-        )
-        
-        # Вычисляем схожесть
-        sim = cosine_similarity(uploaded_emb, emb)
-        
-        return {
-            'file': file_path.name,
-            'similarity': round(sim * 100, 2)
-        }
-        
-    except Exception as e:
-        logger.error(f"Error processing {file_path}: {e}")
-        return {'file': file_path.name, 'similarity': 0}
\ No newline at end of file
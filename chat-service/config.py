@@ -7,6 +7,9 @@ class Settings(BaseSettings):
     openai_api_key: str
     openai_model: str = "gpt-4o-mini"
     openai_temperature: float = 0.0
+    # openai | stub — локальная заглушка API (scripts/llm_stub_server.py) для нагрузочных тестов
+    llm_backend: str = "openai"
+    llm_stub_url: str = "http://localhost:8099/v1"
     
     # Paths
     data_folder: str = "/app/data"
@@ -22,9 +25,53 @@ class Settings(BaseSettings):
     # Performance
     enable_cache: bool = True
     cache_ttl: int = 3600  # 1 hour
+    cache_local_enabled: bool = True  # in-process кеш (L1) перед Redis
+    cache_local_max_entries: int = 2000
+    cache_local_max_bytes: int = 64 * 1024 * 1024  # 64MB на процесс
+    cache_local_max_item_bytes: int = 1024 * 1024  # крупные значения только в Redis
+    cache_local_ttl: int = 60  # секунд: страховка на случай пропущенной инвалидации
+    cache_invalidation_channel: str = "chat_service:invalidate"
+    cache_compress_threshold: int = 1024  # байт: значения крупнее сжимаются zstd
+    cache_lock_ttl: int = 30  # секунд: блокировка пересчета ключа в get_or_compute
+    cache_lock_poll_interval: float = 0.2
+    cache_stale_ttl: int = 300  # секунд после истечения, когда еще отдается старое значение
+    cache_xfetch_beta: float = 1.0  # >1 — пересчет раньше, 0 — без раннего пересчета
+    stats_folder_ttl: int = 300  # секунд: кеш подсчета файлов для /api/stats
     max_workers: int = 4
+    process_workers: int = 2
     request_timeout: int = 300
     
+    # LLM gateway
+    llm_max_concurrency: int = 8  # одновременных вызовов одной модели
+    llm_max_queue: int = 32  # запросов в очереди, сверх этого сразу 429
+    llm_queue_timeout: float = 30.0  # секунд ожидания места в очереди
+    llm_retry_after: int = 5  # минимальный Retry-After (секунды)
+    llm_max_retries: int = 2
+    single_flight_lock_ttl: int = 30  # секунд: блокировка вычисления одинакового вопроса в Redis
+    single_flight_poll_interval: float = 0.2
+    
+    # Chat history
+    chat_history_max_messages: int = 100  # сообщений (вопросы и ответы) на сессию
+    chat_history_ttl: int = 7 * 24 * 3600  # неактивные сессии удаляются через неделю
+    chat_history_local_sessions: int = 500  # горячих сессий в памяти процесса
+    chat_history_local_ttl: int = 30  # секунд жизни локальной копии при работе через Redis
+    
+    # Prompt budget (токены)
+    context_token_budget: int = 4000  # найденные чанки
+    history_token_budget: int = 1000  # история диалога вместе со сводкой
+    
+    # FAQ: заранее посчитанные ответы на частые вопросы
+    faq_folder: str = "/app/faq"  # курируемые списки вопросов {role}.txt
+    faq_max_questions: int = 200
+    faq_min_count: int = 3  # сколько раз вопрос должен встретиться, чтобы попасть в FAQ
+    faq_candidates_ttl: int = 30 * 24 * 3600
+    faq_candidates_max: int = 5000  # сколько самых частых вопросов хранить в статистике
+    faq_candidates_trim_probability: float = 0.01  # доля записей, после которых статистика обрезается
+    faq_similarity_threshold: float = 0.93
+    faq_semantic_lookup: bool = True
+    faq_warm_concurrency: int = 4
+    faq_warm_lock_ttl: int = 3600
+    
     # Vector Search
     vector_search_k: int = 5
     chunk_size: int = 512
@@ -34,6 +81,9 @@ class Settings(BaseSettings):
     # Document Processing
     max_file_size: int = 50 * 1024 * 1024  # 50MB
     ocr_enabled: bool = True
+    document_store_backend: str = "sqlite"  # sqlite | json
+    duplicate_threshold: float = 0.5  # минимальная оценка Жаккара для почти-дубликатов
+    overlap_similarity_threshold: float = 0.85  # cosine для совпадения чанков в семантической проверке
     
     class Config:
         env_file = ".env"
@@ -1,8 +1,9 @@
 import asyncio
-from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
-from typing import List, Dict, Any, Optional
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, Executor
+from typing import List, Dict, Any, Optional, Callable
 from pathlib import Path
 import logging
+import time
 import aiofiles
 from functools import partial
 
@@ -10,60 +11,204 @@ from data_management.document_processor import (
     extract_text_from_docx,
     extract_text_from_pdf,
     extract_text_from_txt,
-    create_chunks_by_sentence
+    create_chunks_by_sentence,
+    create_tabular_chunks,
+    TABULAR_EXTENSIONS
 )
 from config import settings
 
 logger = logging.getLogger(__name__)
 
+def _preload_parsers():
+    """Инициализатор воркеров: заранее импортирует тяжелые парсеры"""
+    import docx  # noqa: F401
+    import pdfplumber  # noqa: F401
+    import chardet  # noqa: F401
+    import data_management.document_processor  # noqa: F401
+
+def _noop() -> None:
+    return None
+
+def _timed_call(func: Callable, *args) -> tuple:
+    """Выполняет функцию в воркере и возвращает (время работы, результат)"""
+    started = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - started, result
+
+def _ocr_pdf(file_path: str) -> str:
+    """OCR обработка в отдельном процессе"""
+    # Импорты внутри функции для process pool
+    from data_management.document_processor import extract_text_from_pdf_with_ocr
+    return extract_text_from_pdf_with_ocr(file_path)
+
+class _PoolStats:
+    """Счетчики загрузки одного пула"""
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.in_flight = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.busy_time = 0.0
+
+    def as_dict(self, uptime: float) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "in_flight": self.in_flight,
+            "queue_depth": max(self.in_flight - self.workers, 0),
+            "utilization": round(min(self.in_flight, self.workers) / self.workers, 2) if self.workers else 0.0,
+            "avg_utilization": round(self.busy_time / (uptime * self.workers), 4) if uptime > 0 and self.workers else 0.0,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+        }
+
 class AsyncDocumentProcessor:
-    def __init__(self):
+    """
+    Сервис обработки документов с общими пулами потоков и процессов.
+    Создается один раз в lifespan приложения (см. main.py) и
+    переиспользуется всеми запросами.
+    """
+    def __init__(self, thread_workers: Optional[int] = None, process_workers: Optional[int] = None):
+        self.thread_workers = thread_workers or settings.max_workers
+        self.process_workers = process_workers or settings.process_workers
         # Thread pool для I/O операций
-        self.thread_executor = ThreadPoolExecutor(max_workers=settings.max_workers)
+        self.thread_executor = ThreadPoolExecutor(
+            max_workers=self.thread_workers,
+            thread_name_prefix="doc-io",
+            initializer=_preload_parsers
+        )
         # Process pool для CPU-intensive операций (OCR)
-        self.process_executor = ProcessPoolExecutor(max_workers=2)
+        self.process_executor = ProcessPoolExecutor(
+            max_workers=self.process_workers,
+            initializer=_preload_parsers
+        )
         self._semaphore = asyncio.Semaphore(settings.max_workers)
+        self._waiting_documents = 0
+        self._active_documents = 0
+        self._thread_stats = _PoolStats(self.thread_workers)
+        self._process_stats = _PoolStats(self.process_workers)
+        self._started_at = time.monotonic()
+        self._closed = False
+    
+    async def start(self):
+        """Прогревает пулы: поднимает воркеры и загружает парсеры"""
+        loop = asyncio.get_running_loop()
+        warmups = [loop.run_in_executor(self.thread_executor, _noop) for _ in range(self.thread_workers)]
+        warmups += [loop.run_in_executor(self.process_executor, _noop) for _ in range(self.process_workers)]
+        results = await asyncio.gather(*warmups, return_exceptions=True)
+        failed = [r for r in results if isinstance(r, Exception)]
+        if failed:
+            logger.warning(f"Document processor warm-up finished with {len(failed)} errors: {failed[0]}")
+        self._started_at = time.monotonic()
+        logger.info(
+            f"Document processor ready: {self.thread_workers} threads, {self.process_workers} processes"
+        )
+    
+    async def shutdown(self):
+        """Корректно останавливает пулы, дожидаясь текущих задач"""
+        if self._closed:
+            return
+        self._closed = True
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, partial(self.thread_executor.shutdown, wait=True, cancel_futures=True))
+        await loop.run_in_executor(None, partial(self.process_executor.shutdown, wait=True, cancel_futures=True))
+        logger.info("Document processor stopped")
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Глубина очередей и загрузка воркеров"""
+        uptime = time.monotonic() - self._started_at
+        return {
+            "documents_waiting": self._waiting_documents,
+            "documents_active": self._active_documents,
+            "thread_pool": self._thread_stats.as_dict(uptime),
+            "process_pool": self._process_stats.as_dict(uptime),
+        }
+    
+    async def _run(self, executor: Executor, stats: _PoolStats, func: Callable, *args) -> Any:
+        """Запускает задачу в пуле с учетом метрик"""
+        loop = asyncio.get_running_loop()
+        stats.in_flight += 1
+        stats.submitted += 1
+        try:
+            elapsed, result = await loop.run_in_executor(executor, _timed_call, func, *args)
+            stats.busy_time += elapsed
+            return result
+        except Exception:
+            stats.failed += 1
+            raise
+        finally:
+            stats.in_flight -= 1
+            stats.completed += 1
+    
+    async def run_in_thread(self, func: Callable, *args) -> Any:
+        """Выполняет функцию в общем thread pool"""
+        return await self._run(self.thread_executor, self._thread_stats, func, *args)
+    
+    async def run_in_process(self, func: Callable, *args) -> Any:
+        """Выполняет функцию в общем process pool"""
+        return await self._run(self.process_executor, self._process_stats, func, *args)
     
     async def process_document(self, file_path: Path) -> List[Dict[str, Any]]:
         """Асинхронно обрабатывает один документ"""
-        async with self._semaphore:  # Ограничиваем параллельную обработку
-            try:
-                logger.info(f"Processing document: {file_path.name}")
-                
-                # Определяем тип файла
-                file_ext = file_path.suffix.lower()
-                
-                # Извлекаем текст асинхронно
-                if file_ext == '.docx':
-                    text, metadata = await self._process_docx(file_path)
-                elif file_ext == '.pdf':
-                    text, metadata = await self._process_pdf(file_path)
-                elif file_ext == '.txt':
-                    text, metadata = await self._process_txt(file_path)
-                else:
-                    logger.warning(f"Unsupported file type: {file_ext}")
-                    return []
-                
-                if not text or len(text.strip()) < 50:
-                    logger.warning(f"Document {file_path.name} has insufficient text")
-                    return []
-                
-                # Создаем метаданные файла
-                file_metadata = {
-                    "file_name": file_path.name,
-                    "file_path": str(file_path),
-                    **metadata
-                }
-                
-                # Создаем чанки асинхронно
-                chunks = await self._create_chunks_async(text, file_metadata)
-                
+        self._waiting_documents += 1
+        try:
+            await self._semaphore.acquire()  # Ограничиваем параллельную обработку
+        finally:
+            self._waiting_documents -= 1
+        
+        self._active_documents += 1
+        try:
+            logger.info(f"Processing document: {file_path.name}")
+            
+            # Определяем тип файла
+            file_ext = file_path.suffix.lower()
+            
+            # Таблицы и презентации читаются потоково и сразу режутся на чанки
+            if file_ext in TABULAR_EXTENSIONS:
+                chunks = await self.run_in_thread(
+                    create_tabular_chunks,
+                    str(file_path),
+                    {"file_name": file_path.name, "file_path": str(file_path)},
+                    settings.chunk_size
+                )
                 logger.info(f"Document {file_path.name} processed: {len(chunks)} chunks")
                 return chunks
-                
-            except Exception as e:
-                logger.error(f"Error processing {file_path}: {e}")
+            
+            # Извлекаем текст асинхронно
+            if file_ext == '.docx':
+                text, metadata = await self._process_docx(file_path)
+            elif file_ext == '.pdf':
+                text, metadata = await self._process_pdf(file_path)
+            elif file_ext == '.txt':
+                text, metadata = await self._process_txt(file_path)
+            else:
+                logger.warning(f"Unsupported file type: {file_ext}")
+                return []
+            
+            if not text or len(text.strip()) < 50:
+                logger.warning(f"Document {file_path.name} has insufficient text")
                 return []
+            
+            # Создаем метаданные файла
+            file_metadata = {
+                "file_name": file_path.name,
+                "file_path": str(file_path),
+                **metadata
+            }
+            
+            # Создаем чанки асинхронно
+            chunks = await self._create_chunks_async(text, file_metadata)
+            
+            logger.info(f"Document {file_path.name} processed: {len(chunks)} chunks")
+            return chunks
+            
+        except Exception as e:
+            logger.error(f"Error processing {file_path}: {e}")
+            return []
+        finally:
+            self._active_documents -= 1
+            self._semaphore.release()
     
     async def process_documents_batch(self, file_paths: List[Path]) -> List[Dict[str, Any]]:
         """Обрабатывает батч документов параллельно"""
@@ -81,17 +226,12 @@ class AsyncDocumentProcessor:
     
     async def _process_docx(self, file_path: Path) -> tuple[str, dict]:
         """Асинхронная обработка DOCX"""
-        loop = asyncio.get_event_loop()
-        
         # Читаем файл асинхронно
         async with aiofiles.open(file_path, 'rb') as f:
             content = await f.read()
         
         # Обрабатываем в thread pool
-        text = await loop.run_in_executor(
-            self.thread_executor,
-            partial(self._extract_docx_sync, content)
-        )
+        text = await self.run_in_thread(self._extract_docx_sync, content)
         
         metadata = {"file_type": "docx"}
         return text, metadata
@@ -118,11 +258,8 @@ class AsyncDocumentProcessor:
     
     async def _process_pdf(self, file_path: Path) -> tuple[str, dict]:
         """Асинхронная обработка PDF"""
-        loop = asyncio.get_event_loop()
-        
         # Обрабатываем в thread pool
-        result = await loop.run_in_executor(
-            self.thread_executor,
+        result = await self.run_in_thread(
             extract_text_from_pdf,
             str(file_path),
             50  # min_words_per_page
@@ -133,20 +270,10 @@ class AsyncDocumentProcessor:
         # Если нужен OCR, используем process pool
         if metadata.get('ocr_used', False):
             logger.info(f"Using OCR for {file_path.name}")
-            text = await loop.run_in_executor(
-                self.process_executor,
-                self._ocr_pdf,
-                str(file_path)
-            )
+            text = await self.run_in_process(_ocr_pdf, str(file_path))
         
         return text, metadata
     
-    def _ocr_pdf(self, file_path: str) -> str:
-        """OCR обработка в отдельном процессе"""
-        # Импорты внутри функции для process pool
-        from data_management.document_processor import extract_text_from_pdf_with_ocr
-        return extract_text_from_pdf_with_ocr(file_path)
-    
     async def _process_txt(self, file_path: Path) -> tuple[str, dict]:
         """Асинхронная обработка TXT"""
         import chardet
@@ -167,11 +294,8 @@ class AsyncDocumentProcessor:
     
     async def _create_chunks_async(self, text: str, file_metadata: dict) -> List[Dict[str, Any]]:
         """Асинхронное создание чанков"""
-        loop = asyncio.get_event_loop()
-        
         # Выполняем в thread pool
-        chunks = await loop.run_in_executor(
-            self.thread_executor,
+        chunks = await self.run_in_thread(
             create_chunks_by_sentence,
             text,
             file_metadata,
@@ -181,8 +305,3 @@ class AsyncDocumentProcessor:
         )
         
         return chunks
-    
-    def __del__(self):
-        """Закрываем executors при удалении"""
-        self.thread_executor.shutdown(wait=False)
-        self.process_executor.shutdown(wait=False)
\ No newline at end of file
@@ -1,19 +1,65 @@
 import redis.asyncio as redis
-import pickle
+import asyncio
 import json
 import hashlib
-from typing import Any, Optional, Union
+import math
+import random
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Union
 from datetime import timedelta
 import logging
 
 from config import settings
+from core.local_cache import LocalCache
+from core import serializer
+from core.metrics import CACHE_REQUESTS, CACHE_LATENCY
 
 logger = logging.getLogger(__name__)
 
+# Снимаем блокировку, только если она все еще наша
+RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+# Признак записи get_or_compute: значение плюс время вычисления и логический срок жизни
+_ENTRY_MARKER = "__cached_entry__"
+
 class CacheManager:
+    """
+    Кеш в Redis с необязательным первым уровнем в памяти процесса (L1).
+    L1 — LRU с коротким TTL; изменения ключей и смена поколения индекса
+    рассылаются другим процессам через Redis pub/sub, и те сбрасывают свои L1.
+    """
     def __init__(self):
         self.redis_client: Optional[redis.Redis] = None
         self.enabled = settings.enable_cache
+        self.local: Optional[LocalCache] = None
+        if settings.cache_local_enabled:
+            self.local = LocalCache(
+                settings.cache_local_max_entries,
+                settings.cache_local_max_bytes,
+                settings.cache_local_max_item_bytes
+            )
+        # Идентификатор процесса: свои сообщения об инвалидации уже применены
+        self._origin = uuid.uuid4().hex
+        self._listener_task: Optional[asyncio.Task] = None
+        self._generation_listeners: List[Callable[[str, str], Awaitable[None]]] = []
+        self._listener_jobs: set = set()
+        self.l1_hits = 0
+        self.l2_hits = 0
+        self.misses = 0
+        self.decode_errors = 0
+        # Вычисления get_or_compute, идущие в этом процессе
+        self._computing: Dict[str, asyncio.Task] = {}
+        self._refreshing: Dict[str, asyncio.Task] = {}
+        self.computes = 0
+        self.lock_waits = 0
+        self.early_refreshes = 0
+        self.stale_served = 0
         
     async def initialize(self):
         """Инициализация Redis подключения"""
@@ -25,7 +71,7 @@ class CacheManager:
             self.redis_client = redis.from_url(
                 settings.redis_url,
                 encoding="utf-8",
-                decode_responses=False,  # Для pickle
+                decode_responses=False,  # Значения в бинарном формате core.serializer
                 password=settings.redis_password if settings.redis_password else None
             )
             # Проверяем подключение
@@ -34,62 +80,258 @@ class CacheManager:
         except Exception as e:
             logger.error(f"Failed to connect to Redis: {e}")
             self.enabled = False
+            return
+        
+        if self.local is not None:
+            self._listener_task = asyncio.create_task(self._listen_invalidations())
     
     async def close(self):
         """Закрытие соединения"""
+        if self._listener_task:
+            self._listener_task.cancel()
+            await asyncio.gather(self._listener_task, return_exceptions=True)
         if self.redis_client:
             await self.redis_client.close()
     
+    # --- инвалидация между процессами ---
+    
+    def add_generation_listener(self, callback: Callable[[str, str], Awaitable[None]]):
+        """callback(collection, generation) вызывается, когда другой процесс сменил поколение индекса"""
+        self._generation_listeners.append(callback)
+    
+    async def _publish(self, message: Dict[str, Any], pipe=None):
+        """Рассылает событие другим процессам (в pipeline, если он передан)"""
+        if self.local is None:
+            return
+        message["origin"] = self._origin
+        payload = json.dumps(message)
+        if pipe is not None:
+            pipe.publish(settings.cache_invalidation_channel, payload)
+        else:
+            await self.redis_client.publish(settings.cache_invalidation_channel, payload)
+    
+    async def publish_generation(self, collection: str, generation: str):
+        """Сообщает другим процессам о новом поколении индекса коллекции"""
+        if self.local is not None:
+            self.local.delete_pattern(self._make_key(f"search_{collection}_*"))
+        if not self.enabled or not self.redis_client:
+            return
+        try:
+            await self._publish({"collection": collection, "generation": generation})
+        except Exception as e:
+            logger.error(f"Cache publish error: {e}")
+    
+    async def _listen_invalidations(self):
+        """Подписка на события инвалидации; после переподключения L1 сбрасывается целиком"""
+        while True:
+            pubsub = self.redis_client.pubsub()
+            try:
+                await pubsub.subscribe(settings.cache_invalidation_channel)
+                while True:
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                    if message and message.get("type") == "message":
+                        await self._apply_invalidation(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Cache invalidation listener error: {e}")
+                # Пока подписки не было, могли пропустить сообщения
+                self.local.clear()
+                await asyncio.sleep(1)
+            finally:
+                try:
+                    await pubsub.close()
+                except Exception:
+                    pass
+    
+    async def _apply_invalidation(self, data: bytes):
+        try:
+            message = json.loads(data)
+        except Exception as e:
+            logger.error(f"Bad cache invalidation message: {e}")
+            return
+        if message.get("origin") == self._origin:
+            return
+        
+        self.local.delete(message.get("keys", []))
+        for pattern in message.get("patterns", []):
+            self.local.delete_pattern(pattern)
+        
+        collection = message.get("collection")
+        if collection:
+            self.local.delete_pattern(self._make_key(f"search_{collection}_*"))
+            # Перезагрузка индекса долгая — не задерживаем обработку следующих сообщений
+            for callback in self._generation_listeners:
+                task = asyncio.create_task(self._notify_generation(callback, collection, message.get("generation", "")))
+                self._listener_jobs.add(task)
+                task.add_done_callback(self._listener_jobs.discard)
+    
+    async def _notify_generation(self, callback, collection: str, generation: str):
+        try:
+            await callback(collection, generation)
+        except Exception as e:
+            logger.error(f"Generation listener error: {e}")
+    
     def _make_key(self, key: str) -> str:
         """Создает ключ с префиксом"""
         return f"chat_service:{key}"
     
-    async def get(self, key: str) -> Optional[Any]:
-        """Получить значение из кеша"""
+    @staticmethod
+    def _namespace(key: str) -> str:
+        """Пространство ключа для метрик: answer:..., teacher_chat:..., search_... -> answer, teacher_chat, search"""
+        if ":" in key:
+            return key.split(":", 1)[0]
+        return key.split("_", 1)[0]
+    
+    def _count(self, key: str, result: str):
+        if result == "l1_hit":
+            self.l1_hits += 1
+        elif result == "l2_hit":
+            self.l2_hits += 1
+        else:
+            self.misses += 1
+        CACHE_REQUESTS.inc(namespace=self._namespace(key), result=result)
+    
+    def _decode(self, value: bytes) -> Optional[Any]:
+        """Десериализует значение; значение в старом или чужом формате считается промахом"""
+        try:
+            return serializer.loads(value)
+        except Exception as e:
+            self.decode_errors += 1
+            logger.debug(f"Cache decode error: {e}")
+            return None
+    
+    async def get(self, key: str, use_local: bool = True) -> Optional[Any]:
+        """Получить значение из кеша (сначала L1, затем Redis)"""
         if not self.enabled or not self.redis_client:
             return None
         
+        full_key = self._make_key(key)
+        use_local = use_local and self.local is not None
+        if use_local:
+            value = self.local.get(full_key)
+            if value is not None:
+                self._count(key, "l1_hit")
+                return self._decode(value)
+        
+        started = time.perf_counter()
         try:
-            full_key = self._make_key(key)
-            value = await self.redis_client.get(full_key)
+            if use_local:
+                # Значение и оставшийся TTL за один запрос: в L1 запись живет не дольше, чем в Redis
+                async with self.redis_client.pipeline(transaction=False) as pipe:
+                    pipe.get(full_key)
+                    pipe.ttl(full_key)
+                    value, ttl = await pipe.execute()
+            else:
+                value = await self.redis_client.get(full_key)
+            CACHE_LATENCY.observe(time.perf_counter() - started, namespace=self._namespace(key), op="get")
             
-            if value:
-                # Пробуем десериализовать
-                try:
-                    return pickle.loads(value)
-                except:
-                    # Если не pickle, возвращаем как строку
-                    return value.decode('utf-8') if isinstance(value, bytes) else value
+            decoded = self._decode(value) if value else None
+            if decoded is None:
+                self._count(key, "miss")
+                return None
             
-            return None
+            self._count(key, "l2_hit")
+            if use_local and ttl and ttl > 0:
+                self.local.set(full_key, value, min(ttl, settings.cache_local_ttl))
+            return decoded
         except Exception as e:
             logger.error(f"Cache get error: {e}")
             return None
     
-    async def set(self, key: str, value: Any, ttl: Optional[int] = None) -> bool:
-        """Сохранить значение в кеш"""
-        if not self.enabled or not self.redis_client:
-            return False
+    async def get_many(self, keys: List[str], use_local: bool = True) -> Dict[str, Any]:
+        """Получить несколько значений за один запрос (MGET); в ответе только найденные ключи"""
+        if not self.enabled or not self.redis_client or not keys:
+            return {}
         
-        try:
+        use_local = use_local and self.local is not None
+        found: Dict[str, Any] = {}
+        remote: Dict[str, str] = {}
+        for key in dict.fromkeys(keys):
             full_key = self._make_key(key)
-            ttl = ttl or settings.cache_ttl
-            
-            # Сериализуем значение
-            if isinstance(value, (str, int, float)):
-                serialized = str(value).encode('utf-8')
+            value = self.local.get(full_key) if use_local else None
+            if value is not None:
+                self._count(key, "l1_hit")
+                found[key] = self._decode(value)
             else:
-                serialized = pickle.dumps(value)
-            
-            await self.redis_client.setex(
-                full_key,
-                timedelta(seconds=ttl),
-                serialized
-            )
-            return True
+                remote[key] = full_key
+        
+        if not remote:
+            return found
+        
+        started = time.perf_counter()
+        try:
+            full_keys = list(remote.values())
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                pipe.mget(full_keys)
+                if use_local:
+                    for full_key in full_keys:
+                        pipe.ttl(full_key)
+                values, *ttls = await pipe.execute()
+            CACHE_LATENCY.observe(time.perf_counter() - started, namespace=self._namespace(keys[0]), op="get_many")
+        except Exception as e:
+            logger.error(f"Cache get_many error: {e}")
+            return found
+        
+        for index, (key, full_key) in enumerate(remote.items()):
+            value = values[index]
+            decoded = self._decode(value) if value else None
+            if decoded is None:
+                self._count(key, "miss")
+                continue
+            self._count(key, "l2_hit")
+            found[key] = decoded
+            if use_local and ttls[index] and ttls[index] > 0:
+                self.local.set(full_key, value, min(ttls[index], settings.cache_local_ttl))
+        return found
+    
+    def pipeline(self) -> "CachePipeline":
+        """
+        Пакет записей, выполняемый одним запросом при выходе из контекста:
+            async with cache_manager.pipeline() as pipe:
+                pipe.set("a", 1)
+                pipe.delete("b")
+        """
+        return CachePipeline(self)
+    
+    async def _execute_batch(self, sets: Dict[str, Tuple[bytes, int]], deletes: List[str]) -> bool:
+        """SETEX и DEL одним pipeline плюс одно сообщение об инвалидации"""
+        if not self.enabled or not self.redis_client or not (sets or deletes):
+            return False
+        
+        started = time.perf_counter()
+        try:
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                for full_key, (serialized, ttl) in sets.items():
+                    pipe.setex(full_key, timedelta(seconds=ttl), serialized)
+                if deletes:
+                    pipe.delete(*deletes)
+                # Другие процессы сбрасывают свои (теперь устаревшие) копии
+                await self._publish({"keys": list(sets) + deletes}, pipe)
+                await pipe.execute()
+            first_key = next(iter(sets), None) or deletes[0]
+            CACHE_LATENCY.observe(time.perf_counter() - started,
+                                  namespace=self._namespace(first_key[len(self._make_key("")):]), op="write")
         except Exception as e:
-            logger.error(f"Cache set error: {e}")
+            logger.error(f"Cache batch write error: {e}")
             return False
+        
+        if self.local is not None:
+            self.local.delete(deletes)
+            for full_key, (serialized, ttl) in sets.items():
+                self.local.set(full_key, serialized, min(ttl, settings.cache_local_ttl))
+        return True
+    
+    async def set_many(self, items: Dict[str, Any], ttl: Optional[int] = None) -> bool:
+        """Сохранить несколько значений одним pipeline (SETEX на каждый ключ)"""
+        async with self.pipeline() as pipe:
+            for key, value in items.items():
+                pipe.set(key, value, ttl)
+        return pipe.result
+    
+    async def set(self, key: str, value: Any, ttl: Optional[int] = None) -> bool:
+        """Сохранить значение в кеш"""
+        return await self.set_many({key: value}, ttl)
     
     async def delete(self, key: str) -> bool:
         """Удалить значение из кеша"""
@@ -98,12 +340,149 @@ class CacheManager:
         
         try:
             full_key = self._make_key(key)
-            result = await self.redis_client.delete(full_key)
+            if self.local is not None:
+                self.local.delete([full_key])
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                pipe.delete(full_key)
+                await self._publish({"keys": [full_key]}, pipe)
+                result, *_ = await pipe.execute()
             return bool(result)
         except Exception as e:
             logger.error(f"Cache delete error: {e}")
             return False
     
+    # --- защита от одновременного пересчета (stampede) ---
+    
+    async def get_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[Any]],
+        ttl: Optional[int] = None,
+        stale_ttl: Optional[int] = None,
+        beta: Optional[float] = None
+    ) -> Any:
+        """
+        Значение из кеша или результат compute(), вычисленный один раз на все процессы.
+        
+        - промах: вычисляет владелец короткой блокировки в Redis, остальные ждут результат;
+        - XFetch: незадолго до истечения запись с вероятностью, растущей к концу TTL
+          и пропорциональной времени вычисления (beta), пересчитывается в фоне;
+        - stale-while-revalidate: еще stale_ttl секунд после истечения отдается старое
+          значение, а новое считается в фоне.
+        Ключ должен читаться и писаться только через get_or_compute.
+        """
+        if not self.enabled or not self.redis_client:
+            return await compute()
+        
+        ttl = ttl or settings.cache_ttl
+        stale_ttl = settings.cache_stale_ttl if stale_ttl is None else stale_ttl
+        beta = settings.cache_xfetch_beta if beta is None else beta
+        
+        entry = await self.get(key)
+        if isinstance(entry, dict) and entry.get(_ENTRY_MARKER):
+            now = time.time()
+            expires = entry["expires"]
+            if now >= expires:
+                if now < expires + stale_ttl:
+                    self.stale_served += 1
+                    self._refresh_in_background(key, compute, ttl, stale_ttl)
+                    return entry["value"]
+            else:
+                # XFetch: -log(U) > 0, чем дольше вычисление, тем раньше начинаем
+                if now - entry["delta"] * beta * math.log(1.0 - random.random()) >= expires:
+                    self.early_refreshes += 1
+                    self._refresh_in_background(key, compute, ttl, stale_ttl)
+                return entry["value"]
+        
+        task = self._computing.get(key)
+        if task is None:
+            task = self._start_compute(key, self._compute_locked(key, compute, ttl, stale_ttl))
+        return await asyncio.shield(task)
+    
+    def _start_compute(self, key: str, coroutine) -> asyncio.Task:
+        # Вычисление идет отдельной задачей: отмена запроса не отменяет его для остальных
+        task = asyncio.create_task(coroutine)
+        self._computing[key] = task
+        task.add_done_callback(lambda done: self._finish_compute(self._computing, key, done))
+        return task
+    
+    @staticmethod
+    def _finish_compute(tasks: Dict[str, asyncio.Task], key: str, task: asyncio.Task):
+        if tasks.get(key) is task:
+            del tasks[key]
+    
+    def _refresh_in_background(self, key: str, compute, ttl: int, stale_ttl: int):
+        if key in self._refreshing or key in self._computing:
+            return
+        task = asyncio.create_task(self._refresh(key, compute, ttl, stale_ttl))
+        self._refreshing[key] = task
+        task.add_done_callback(lambda done: self._finish_compute(self._refreshing, key, done))
+    
+    async def _refresh(self, key: str, compute, ttl: int, stale_ttl: int):
+        """Фоновый пересчет; если его уже делает другой процесс — ничего не делаем"""
+        token = await self._acquire_lock(key)
+        if token is None:
+            return None
+        try:
+            return await self._compute_and_store(key, compute, ttl, stale_ttl)
+        except Exception as e:
+            logger.error(f"Background refresh error for {key}: {e}")
+        finally:
+            await self._release_lock(key, token)
+    
+    async def _acquire_lock(self, key: str) -> Optional[str]:
+        token = uuid.uuid4().hex
+        try:
+            acquired = await self.redis_client.set(
+                self._make_key(f"lock:{key}"), token, nx=True, ex=settings.cache_lock_ttl
+            )
+        except Exception as e:
+            logger.error(f"Cache lock error: {e}")
+            return ""  # Redis недоступен — считаем без блокировки
+        return token if acquired else None
+    
+    async def _release_lock(self, key: str, token: str):
+        if not token:
+            return
+        try:
+            await self.redis_client.eval(RELEASE_LOCK_SCRIPT, 1, self._make_key(f"lock:{key}"), token)
+        except Exception as e:
+            logger.error(f"Cache unlock error: {e}")
+    
+    async def _compute_and_store(self, key: str, compute, ttl: int, stale_ttl: int) -> Any:
+        started = time.time()
+        value = await compute()
+        self.computes += 1
+        finished = time.time()
+        await self.set(key, {
+            _ENTRY_MARKER: 1,
+            "value": value,
+            "delta": round(finished - started, 3),
+            "expires": finished + ttl
+        }, ttl=ttl + stale_ttl)
+        return value
+    
+    async def _compute_locked(self, key: str, compute, ttl: int, stale_ttl: int) -> Any:
+        """Промах: считает владелец блокировки, остальные опрашивают кеш"""
+        deadline = time.monotonic() + settings.cache_lock_ttl
+        while True:
+            token = await self._acquire_lock(key)
+            if token is not None:
+                try:
+                    return await self._compute_and_store(key, compute, ttl, stale_ttl)
+                finally:
+                    await self._release_lock(key, token)
+            
+            # Считает другой процесс: ждем его результат
+            self.lock_waits += 1
+            await asyncio.sleep(settings.cache_lock_poll_interval)
+            entry = await self.get(key, use_local=False)
+            if isinstance(entry, dict) and entry.get(_ENTRY_MARKER):
+                return entry["value"]
+            if time.monotonic() > deadline:
+                # Чужое вычисление зависло дольше TTL блокировки — считаем сами
+                return await self._compute_and_store(key, compute, ttl, stale_ttl)
+    
     async def clear_pattern(self, pattern: str) -> int:
         """Удалить все ключи по паттерну"""
         if not self.enabled or not self.redis_client:
@@ -117,10 +496,15 @@ class CacheManager:
             async for key in self.redis_client.scan_iter(match=full_pattern):
                 keys.append(key)
             
-            if keys:
-                return await self.redis_client.delete(*keys)
+            deleted = await self.redis_client.delete(*keys) if keys else 0
             
-            return 0
+            # L1 сбрасывается после Redis (как в _execute_batch): иначе читатель
+            # между шагами снова заполнит L1 старым значением из Redis
+            if self.local is not None:
+                self.local.delete_pattern(full_pattern)
+                await self._publish({"patterns": [full_pattern]})
+            
+            return deleted
         except Exception as e:
             logger.error(f"Cache clear pattern error: {e}")
             return 0
@@ -147,4 +531,54 @@ class CacheManager:
             return await self.redis_client.ttl(full_key)
         except Exception as e:
             logger.error(f"Cache TTL error: {e}")
-            return -1
\ No newline at end of file
+            return -1
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Попадания по уровням кеша"""
+        lookups = self.l1_hits + self.l2_hits + self.misses
+        redis_lookups = self.l2_hits + self.misses
+        stats = {
+            "l1_hits": self.l1_hits,
+            "l2_hits": self.l2_hits,
+            "misses": self.misses,
+            "decode_errors": self.decode_errors,
+            "computes": self.computes,
+            "lock_waits": self.lock_waits,
+            "early_refreshes": self.early_refreshes,
+            "stale_served": self.stale_served,
+            "l1_hit_ratio": round(self.l1_hits / lookups, 4) if lookups else 0.0,
+            "l2_hit_ratio": round(self.l2_hits / redis_lookups, 4) if redis_lookups else 0.0,
+            "hit_ratio": round((self.l1_hits + self.l2_hits) / lookups, 4) if lookups else 0.0,
+        }
+        if self.local is not None:
+            stats["l1"] = self.local.get_stats()
+        return stats
+
+class CachePipeline:
+    """Буфер записей для CacheManager.pipeline(); result — успех выполнения"""
+    def __init__(self, manager: CacheManager):
+        self._manager = manager
+        self._sets: Dict[str, Tuple[bytes, int]] = {}
+        self._deletes: List[str] = []
+        self.result = False
+    
+    def set(self, key: str, value: Any, ttl: Optional[int] = None):
+        full_key = self._manager._make_key(key)
+        try:
+            # Сериализуем значение (JSON-типы, крупные значения сжимаются)
+            self._sets[full_key] = (serializer.dumps(value), ttl or settings.cache_ttl)
+        except serializer.SerializationError as e:
+            logger.error(f"Cache set error for {key}: {e}")
+    
+    def delete(self, key: str):
+        full_key = self._manager._make_key(key)
+        self._sets.pop(full_key, None)
+        self._deletes.append(full_key)
+    
+    async def __aenter__(self) -> "CachePipeline":
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.result = await self._manager._execute_batch(self._sets, self._deletes)
+        return False
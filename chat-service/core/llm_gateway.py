@@ -0,0 +1,198 @@
+import asyncio
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Optional, AsyncIterator, Tuple
+import logging
+
+from fastapi import HTTPException
+from langchain_openai import ChatOpenAI
+
+from config import settings
+from core.metrics import LLM_LATENCY, LLM_TOKENS
+from app.token_budget import TokenCounter
+
+logger = logging.getLogger(__name__)
+
+def openai_client_kwargs() -> Dict[str, Any]:
+    """Параметры клиента OpenAI: при llm_backend=stub запросы идут в локальную заглушку"""
+    if settings.llm_backend == "stub":
+        return {"openai_api_base": settings.llm_stub_url}
+    return {}
+
+class LLMOverloadedError(HTTPException):
+    """Очередь к модели переполнена: отвечаем 429 с Retry-After"""
+    def __init__(self, model_name: str, retry_after: int):
+        super().__init__(
+            status_code=429,
+            detail=f"LLM {model_name} is overloaded, retry later",
+            headers={"Retry-After": str(retry_after)}
+        )
+        self.retry_after = retry_after
+
+class _ModelLimiter:
+    """Ограничитель параллельных вызовов одной модели с ограниченной очередью ожидания"""
+    def __init__(self, max_concurrency: int, max_queue: int):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.in_flight = 0
+        self.waiting = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.wait_time = 0.0
+        self.call_time = 0.0
+
+    @property
+    def is_full(self) -> bool:
+        return self.in_flight + self.waiting >= self.max_concurrency + self.max_queue
+
+    def retry_after(self) -> int:
+        """Оценка времени до освобождения места в очереди"""
+        avg_call = self.call_time / self.completed if self.completed else 0.0
+        estimate = avg_call * (self.waiting + 1) / self.max_concurrency
+        return min(max(settings.llm_retry_after, math.ceil(estimate)), 60)
+
+    def as_dict(self) -> Dict[str, Any]:
+        finished = self.completed + self.failed
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "avg_wait": round(self.wait_time / finished, 4) if finished else 0.0,
+            "avg_latency": round(self.call_time / finished, 4) if finished else 0.0,
+        }
+
+class LLMGateway:
+    """
+    Общий для приложения доступ к LLM. Клиенты ChatOpenAI создаются один раз
+    на (модель, temperature) и переиспользуют HTTP-соединения; число одновременных
+    вызовов каждой модели ограничено, лишние запросы ждут в ограниченной очереди,
+    а при ее переполнении сразу получают 429.
+    """
+    def __init__(self, max_concurrency: Optional[int] = None, max_queue: Optional[int] = None,
+                 queue_timeout: Optional[float] = None):
+        self.max_concurrency = max_concurrency or settings.llm_max_concurrency
+        self.max_queue = max_queue if max_queue is not None else settings.llm_max_queue
+        self.queue_timeout = queue_timeout or settings.llm_queue_timeout
+        self._clients: Dict[Tuple[str, float], ChatOpenAI] = {}
+        self._limiters: Dict[str, _ModelLimiter] = {}
+        self._token_counters: Dict[str, TokenCounter] = {}
+
+    def get_llm(self, temperature: Optional[float] = None, model_name: Optional[str] = None) -> ChatOpenAI:
+        """Переиспользуемый клиент модели"""
+        model_name = model_name or settings.openai_model
+        temperature = settings.openai_temperature if temperature is None else temperature
+        key = (model_name, temperature)
+        if key not in self._clients:
+            self._clients[key] = ChatOpenAI(
+                openai_api_key=settings.openai_api_key,
+                temperature=temperature,
+                model_name=model_name,
+                max_retries=settings.llm_max_retries,
+                **openai_client_kwargs()
+            )
+        return self._clients[key]
+
+    def _limiter(self, model_name: str) -> _ModelLimiter:
+        if model_name not in self._limiters:
+            self._limiters[model_name] = _ModelLimiter(self.max_concurrency, self.max_queue)
+        return self._limiters[model_name]
+
+    def check_admission(self, model_name: Optional[str] = None):
+        """Бросает LLMOverloadedError, если очередь модели заполнена (для потоковых ответов)"""
+        model_name = model_name or settings.openai_model
+        limiter = self._limiter(model_name)
+        if limiter.is_full:
+            limiter.rejected += 1
+            raise LLMOverloadedError(model_name, limiter.retry_after())
+
+    @asynccontextmanager
+    async def slot(self, model_name: Optional[str] = None):
+        """Место для одного вызова модели: ждет в очереди или сразу отказывает"""
+        model_name = model_name or settings.openai_model
+        limiter = self._limiter(model_name)
+        self.check_admission(model_name)
+
+        limiter.waiting += 1
+        started = time.perf_counter()
+        # wait_for может потерять место, если таймаут совпал с получением семафора:
+        # при таймауте уже полученное место возвращается явно
+        acquired = False
+        try:
+            async with asyncio.timeout(self.queue_timeout):
+                await limiter.semaphore.acquire()
+                acquired = True
+        except TimeoutError:
+            if acquired:
+                limiter.semaphore.release()
+            limiter.rejected += 1
+            raise LLMOverloadedError(model_name, limiter.retry_after())
+        finally:
+            limiter.waiting -= 1
+            limiter.wait_time += time.perf_counter() - started
+
+        limiter.in_flight += 1
+        call_started = time.perf_counter()
+        try:
+            yield
+            limiter.completed += 1
+        except Exception:
+            limiter.failed += 1
+            raise
+        finally:
+            limiter.call_time += time.perf_counter() - call_started
+            limiter.in_flight -= 1
+            limiter.semaphore.release()
+
+    async def ainvoke(self, prompt: Any, temperature: Optional[float] = None,
+                      model_name: Optional[str] = None):
+        """Один вызов модели через лимитер"""
+        llm = self.get_llm(temperature, model_name)
+        async with self.slot(llm.model_name):
+            started = time.perf_counter()
+            response = await llm.ainvoke(prompt)
+            LLM_LATENCY.observe(time.perf_counter() - started, model=llm.model_name, mode="invoke")
+        self._record_tokens(llm.model_name, prompt, response)
+        return response
+
+    async def astream(self, prompt: Any, temperature: Optional[float] = None,
+                      model_name: Optional[str] = None) -> AsyncIterator[Any]:
+        """Потоковый вызов; место в лимитере занято до конца генерации"""
+        llm = self.get_llm(temperature, model_name)
+        chunks = 0
+        async with self.slot(llm.model_name):
+            started = time.perf_counter()
+            async for chunk in llm.astream(prompt):
+                if chunk.content:
+                    chunks += 1
+                yield chunk
+            LLM_LATENCY.observe(time.perf_counter() - started, model=llm.model_name, mode="stream")
+        # Usage в потоке не приходит: промпт оцениваем, ответ — по числу фрагментов (~1 токен)
+        LLM_TOKENS.inc(self._estimate_tokens(llm.model_name, prompt), model=llm.model_name, type="prompt")
+        LLM_TOKENS.inc(chunks, model=llm.model_name, type="completion")
+
+    def _estimate_tokens(self, model_name: str, prompt: Any) -> int:
+        if model_name not in self._token_counters:
+            self._token_counters[model_name] = TokenCounter(model_name)
+        return self._token_counters[model_name].count(prompt if isinstance(prompt, str) else str(prompt))
+
+    def _record_tokens(self, model_name: str, prompt: Any, response: Any):
+        """Токены из usage ответа OpenAI; если его нет — оценка"""
+        usage = (getattr(response, "response_metadata", None) or {}).get("token_usage") or {}
+        prompt_tokens = usage.get("prompt_tokens")
+        completion_tokens = usage.get("completion_tokens")
+        if prompt_tokens is None:
+            prompt_tokens = self._estimate_tokens(model_name, prompt)
+        if completion_tokens is None:
+            completion_tokens = self._estimate_tokens(model_name, getattr(response, "content", ""))
+        LLM_TOKENS.inc(prompt_tokens, model=model_name, type="prompt")
+        LLM_TOKENS.inc(completion_tokens, model=model_name, type="completion")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {model: limiter.as_dict() for model, limiter in self._limiters.items()}
@@ -0,0 +1,75 @@
+import time
+import fnmatch
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+
+# Примерные накладные расходы на запись (ключ, кортеж, узел OrderedDict)
+_ENTRY_OVERHEAD = 100
+
+class LocalCache:
+    """
+    In-process LRU-кеш с TTL, ограниченный числом записей и суммарным размером.
+    Хранит сериализованные байты: у каждого читателя своя копия объекта,
+    а размер записи известен точно.
+    """
+    def __init__(self, max_entries: int, max_bytes: int, max_item_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_item_bytes = max_item_bytes
+        # key -> (срок жизни, данные, размер)
+        self._items: "OrderedDict[str, tuple]" = OrderedDict()
+        self.size_bytes = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, key: str) -> Optional[bytes]:
+        item = self._items.get(key)
+        if item is None:
+            return None
+        expires_at, data, _ = item
+        if expires_at < time.monotonic():
+            self._remove(key)
+            return None
+        self._items.move_to_end(key)
+        return data
+
+    def set(self, key: str, data: bytes, ttl: float):
+        size = len(data) + len(key) + _ENTRY_OVERHEAD
+        self._remove(key)
+        if ttl <= 0 or size > self.max_item_bytes:
+            return
+        self._items[key] = (time.monotonic() + ttl, data, size)
+        self.size_bytes += size
+        while self._items and (len(self._items) > self.max_entries or self.size_bytes > self.max_bytes):
+            oldest = next(iter(self._items))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key: str) -> bool:
+        item = self._items.pop(key, None)
+        if item is None:
+            return False
+        self.size_bytes -= item[2]
+        return True
+
+    def delete(self, keys: Iterable[str]) -> int:
+        return sum(self._remove(key) for key in keys)
+
+    def delete_pattern(self, pattern: str) -> int:
+        """Удаляет ключи по glob-паттерну (синтаксис как у Redis SCAN MATCH)"""
+        return self.delete([key for key in self._items if fnmatch.fnmatchcase(key, pattern)])
+
+    def clear(self):
+        self._items.clear()
+        self.size_bytes = 0
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._items),
+            "bytes": self.size_bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+        }
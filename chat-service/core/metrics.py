@@ -0,0 +1,161 @@
+import bisect
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Границы корзин гистограмм задержек (секунды)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _label_str(names: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            return {"/".join(key) or "total": value for key, value in self._values.items()}
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_label_str(self.labels, key)} {value}")
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # labels -> (счетчики по корзинам + +Inf, сумма, количество)
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def _quantile(self, counts: List[int], total: int, q: float) -> Optional[float]:
+        """Оценка квантиля по корзинам (верхняя граница корзины)"""
+        rank = q * total
+        seen = 0
+        for bound, count in zip(self.buckets, counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return None  # в корзине +Inf
+
+    def snapshot(self) -> Dict[str, Dict[str, Optional[float]]]:
+        with self._lock:
+            result = {}
+            for key, (counts, total_sum, total) in self._series.items():
+                result["/".join(key) or "total"] = {
+                    "count": total,
+                    "avg": round(total_sum / total, 4) if total else 0.0,
+                    "p50": self._quantile(counts, total, 0.5),
+                    "p95": self._quantile(counts, total, 0.95),
+                    "p99": self._quantile(counts, total, 0.99),
+                }
+            return result
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total_sum, total) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    bucket_labels = _label_str(self.labels, key, 'le="%s"' % bound)
+                    lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+                bucket_labels = _label_str(self.labels, key, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {total}")
+                lines.append(f"{self.name}_sum{_label_str(self.labels, key)} {total_sum}")
+                lines.append(f"{self.name}_count{_label_str(self.labels, key)} {total}")
+        return lines
+
+class MetricsRegistry:
+    """
+    Метрики процесса без внешних зависимостей: счетчики и гистограммы
+    обновляются в местах вызова, мгновенные значения (очереди, размеры индексов)
+    собираются в момент запроса и передаются в render() как gauges.
+    """
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+
+    def counter(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Counter:
+        return self._metrics.setdefault(name, Counter(name, documentation, labels))
+
+    def histogram(self, name: str, documentation: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._metrics.setdefault(name, Histogram(name, documentation, labels, buckets))
+
+    def snapshot(self) -> Dict[str, Dict]:
+        return {name: metric.snapshot() for name, metric in self._metrics.items()}
+
+    def render(self, gauges: Optional[List[Tuple[str, str, Dict[str, str], float]]] = None) -> str:
+        """Текстовый формат Prometheus; gauges — (имя, описание, метки, значение)"""
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+
+        # Строки одной метрики должны идти подряд
+        families: Dict[str, Tuple[str, List[str]]] = {}
+        for name, documentation, labels, value in gauges or []:
+            names = tuple(labels)
+            samples = families.setdefault(name, (documentation, []))[1]
+            samples.append(f"{name}{_label_str(names, tuple(labels[n] for n in names))} {value}")
+        for name, (documentation, samples) in families.items():
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry()
+
+CACHE_REQUESTS = metrics.counter(
+    "chat_cache_requests_total", "Cache lookups by namespace and result (l1_hit, l2_hit, miss)",
+    ["namespace", "result"]
+)
+CACHE_LATENCY = metrics.histogram(
+    "chat_cache_latency_seconds", "Redis round-trip time of cache operations", ["namespace", "op"]
+)
+EMBEDDING_LATENCY = metrics.histogram(
+    "chat_embedding_latency_seconds", "Embedding call latency", ["op"]
+)
+EMBEDDING_TEXTS = metrics.counter(
+    "chat_embedding_texts_total", "Texts embedded", ["op"]
+)
+VECTOR_SEARCH_LATENCY = metrics.histogram(
+    "chat_vector_search_latency_seconds", "FAISS index search latency (without embedding)", ["collection"]
+)
+LLM_LATENCY = metrics.histogram(
+    "chat_llm_latency_seconds", "LLM call latency (full generation)", ["model", "mode"]
+)
+LLM_TOKENS = metrics.counter(
+    "chat_llm_tokens_total", "LLM tokens by type (prompt, completion)", ["model", "type"]
+)
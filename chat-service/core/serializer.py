@@ -0,0 +1,53 @@
+from typing import Any
+
+import orjson
+import zstandard
+
+from config import settings
+
+# Формат значения в кеше: [версия формата][кодек][данные].
+# Данные — JSON (orjson): только типы JSON, без исполнения кода при чтении,
+# поэтому значения можно безопасно читать из других сервисов.
+FORMAT_VERSION = 1
+CODEC_NONE = 0
+CODEC_ZSTD = 1
+
+_DUMPS_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+# Кеш вызывается из event loop; объекты zstd не используются из нескольких потоков
+_compressor = zstandard.ZstdCompressor(level=3)
+_decompressor = zstandard.ZstdDecompressor()
+
+class SerializationError(ValueError):
+    """Значение не в формате кеша (устаревший формат или чужие данные)"""
+
+def dumps(value: Any) -> bytes:
+    """Сериализует значение; крупные значения сжимаются zstd"""
+    try:
+        payload = orjson.dumps(value, option=_DUMPS_OPTIONS)
+    except TypeError as e:
+        raise SerializationError(f"Value is not serializable: {e}") from e
+
+    codec = CODEC_NONE
+    if len(payload) >= settings.cache_compress_threshold:
+        compressed = _compressor.compress(payload)
+        if len(compressed) < len(payload):
+            payload, codec = compressed, CODEC_ZSTD
+    return bytes((FORMAT_VERSION, codec)) + payload
+
+def loads(data: bytes) -> Any:
+    """Десериализует значение, записанное dumps()"""
+    if len(data) < 2 or data[0] != FORMAT_VERSION:
+        raise SerializationError("Unknown cache format version")
+
+    codec = data[1]
+    payload = data[2:]
+    if codec == CODEC_ZSTD:
+        payload = _decompressor.decompress(payload)
+    elif codec != CODEC_NONE:
+        raise SerializationError(f"Unknown cache codec: {codec}")
+
+    try:
+        return orjson.loads(payload)
+    except orjson.JSONDecodeError as e:
+        raise SerializationError(f"Corrupted cache value: {e}") from e
@@ -0,0 +1,227 @@
+import json
+import time
+import asyncio
+from collections import OrderedDict
+from typing import List, Dict, Optional, Tuple
+import logging
+
+from redis.exceptions import WatchError
+
+from config import settings
+from core.cache_manager import CacheManager
+
+logger = logging.getLogger(__name__)
+
+_DELETED_MARKER = b"__deleted__"
+# Попытки удаления при конкурентном изменении списка
+_DELETE_ATTEMPTS = 5
+
+class ChatSessionStore:
+    """
+    История чатов в Redis: по списку на сессию, ограниченному LTRIM,
+    с TTL для неактивных сессий. Запись идет одним pipeline (RPUSH + LTRIM + EXPIRE).
+    Рядом хранится сводка ранних реплик, которые не помещаются в бюджет промпта.
+
+    Перед Redis стоит небольшой in-process write-through кеш горячих сессий (LRU).
+    Его записи живут chat_history_local_ttl секунд, чтобы изменения из других
+    воркеров подхватывались быстро. Если Redis недоступен, этот кеш
+    становится основным хранилищем (записи живут chat_history_ttl).
+    """
+    def __init__(
+        self,
+        cache_manager: Optional[CacheManager],
+        namespace: str = "default",
+        max_messages: Optional[int] = None,
+        ttl: Optional[int] = None,
+        local_sessions: Optional[int] = None,
+        local_ttl: Optional[int] = None
+    ):
+        self.cache_manager = cache_manager
+        self.namespace = namespace
+        self.max_messages = max_messages or settings.chat_history_max_messages
+        self.ttl = ttl or settings.chat_history_ttl
+        self.local_sessions = local_sessions or settings.chat_history_local_sessions
+        self.local_ttl = local_ttl or settings.chat_history_local_ttl
+        # session_id -> (срок жизни, сообщения)
+        self._local: "OrderedDict[str, tuple]" = OrderedDict()
+        # Сводки сессий, если Redis недоступен
+        self._local_summaries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = asyncio.Lock()
+
+    @property
+    def _redis(self):
+        if self.cache_manager and self.cache_manager.enabled and self.cache_manager.redis_client:
+            return self.cache_manager.redis_client
+        return None
+
+    def _key(self, session_id: str) -> str:
+        return self.cache_manager._make_key(f"history:{self.namespace}:{session_id}")
+
+    def _summary_key(self, session_id: str) -> str:
+        return self.cache_manager._make_key(f"history_summary:{self.namespace}:{session_id}")
+
+    # --- локальный кеш ---
+
+    def _local_get(self, session_id: str) -> Optional[List[Dict]]:
+        item = self._local.get(session_id)
+        if item is None:
+            return None
+        expires_at, messages = item
+        if expires_at < time.monotonic():
+            del self._local[session_id]
+            return None
+        self._local.move_to_end(session_id)
+        return messages
+
+    def _local_put(self, session_id: str, messages: List[Dict]):
+        lifetime = self.local_ttl if self._redis else self.ttl
+        self._local[session_id] = (time.monotonic() + lifetime, messages[-self.max_messages:])
+        self._local.move_to_end(session_id)
+        while len(self._local) > self.local_sessions:
+            self._local.popitem(last=False)
+
+    # --- публичный API ---
+
+    async def get(self, session_id: str) -> List[Dict]:
+        """Сообщения сессии (от старых к новым)"""
+        messages = self._local_get(session_id)
+        if messages is not None:
+            return list(messages)
+
+        redis_client = self._redis
+        if not redis_client:
+            return []
+
+        try:
+            raw = await redis_client.lrange(self._key(session_id), 0, -1)
+        except Exception as e:
+            logger.error(f"Session history get error: {e}")
+            return []
+
+        messages = [message for _, message in self._decode(raw)]
+        self._local_put(session_id, messages)
+        return list(messages)
+
+    @staticmethod
+    def _decode(raw: List[bytes]) -> List[Tuple[int, Dict]]:
+        """Пары (позиция в списке Redis, сообщение) без удаленных и битых элементов"""
+        messages = []
+        for position, item in enumerate(raw):
+            if item == _DELETED_MARKER:
+                continue
+            try:
+                messages.append((position, json.loads(item)))
+            except ValueError:
+                continue
+        return messages
+
+    async def append(self, session_id: str, *entries: Dict):
+        """Добавляет сообщения в конец истории, обрезая ее до max_messages"""
+        if not entries:
+            return
+
+        redis_client = self._redis
+        if redis_client:
+            key = self._key(session_id)
+            try:
+                async with redis_client.pipeline(transaction=False) as pipe:
+                    pipe.rpush(key, *[json.dumps(entry, ensure_ascii=False) for entry in entries])
+                    pipe.ltrim(key, -self.max_messages, -1)
+                    pipe.expire(key, self.ttl)
+                    pipe.expire(self._summary_key(session_id), self.ttl)
+                    await pipe.execute()
+            except Exception as e:
+                logger.error(f"Session history append error: {e}")
+
+        # Write-through: обновляем только уже закешированную сессию,
+        # иначе следующий get загрузит ее из Redis целиком
+        messages = self._local_get(session_id)
+        if messages is not None or not redis_client:
+            self._local_put(session_id, (messages or []) + list(entries))
+
+    async def delete_message(self, session_id: str, index: int) -> bool:
+        """Удаляет сообщение по индексу"""
+        async with self._lock:
+            redis_client = self._redis
+            if not redis_client:
+                messages = await self.get(session_id)
+                if index < 0 or index >= len(messages):
+                    return False
+                messages.pop(index)
+                self._local_put(session_id, messages)
+                return True
+
+            # Индекс проверяется по актуальному списку в Redis (не по локальной копии):
+            # WATCH откатывает удаление, если другой воркер успел изменить список
+            key = self._key(session_id)
+            try:
+                async with redis_client.pipeline(transaction=True) as pipe:
+                    for _ in range(_DELETE_ATTEMPTS):
+                        try:
+                            await pipe.watch(key)
+                            messages = self._decode(await pipe.lrange(key, 0, -1))
+                            if index < 0 or index >= len(messages):
+                                await pipe.unwatch()
+                                return False
+                            position = messages[index][0]
+                            # Удаление по позиции: помечаем элемент и удаляем метку
+                            pipe.multi()
+                            pipe.lset(key, position, _DELETED_MARKER)
+                            pipe.lrem(key, 1, _DELETED_MARKER)
+                            await pipe.execute()
+                            break
+                        except WatchError:
+                            continue
+                    else:
+                        logger.error(f"Session history delete conflict: {session_id}")
+                        return False
+            except Exception as e:
+                logger.error(f"Session history delete error: {e}")
+                return False
+
+            del messages[index]
+            self._local_put(session_id, [message for _, message in messages])
+            return True
+
+    async def get_summary(self, session_id: str) -> Optional[Dict]:
+        """Сводка ранних реплик сессии: {"text": ..., "until": время последней учтенной реплики}"""
+        redis_client = self._redis
+        if not redis_client:
+            return self._local_summaries.get(session_id)
+
+        try:
+            raw = await redis_client.get(self._summary_key(session_id))
+            return json.loads(raw) if raw else None
+        except Exception as e:
+            logger.error(f"Session summary get error: {e}")
+            return None
+
+    async def set_summary(self, session_id: str, summary: Dict):
+        """Сохраняет сводку с тем же TTL, что и история"""
+        redis_client = self._redis
+        if not redis_client:
+            self._local_summaries[session_id] = summary
+            self._local_summaries.move_to_end(session_id)
+            while len(self._local_summaries) > self.local_sessions:
+                self._local_summaries.popitem(last=False)
+            return
+
+        try:
+            await redis_client.set(
+                self._summary_key(session_id),
+                json.dumps(summary, ensure_ascii=False),
+                ex=self.ttl
+            )
+        except Exception as e:
+            logger.error(f"Session summary set error: {e}")
+
+    async def clear(self, session_id: str):
+        """Очищает историю сессии"""
+        self._local.pop(session_id, None)
+        self._local_summaries.pop(session_id, None)
+        redis_client = self._redis
+        if redis_client:
+            try:
+                await redis_client.delete(self._key(session_id), self._summary_key(session_id))
+            except Exception as e:
+                logger.error(f"Session history clear error: {e}")
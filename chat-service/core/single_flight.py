@@ -0,0 +1,114 @@
+import asyncio
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional
+import logging
+
+from config import settings
+from core.cache_manager import CacheManager, RELEASE_LOCK_SCRIPT
+
+logger = logging.getLogger(__name__)
+
+class SingleFlight:
+    """
+    Объединение одинаковых одновременных вычислений (single-flight).
+    Внутри процесса повторные вызовы ждут задачу первого; между процессами
+    вычисляет тот, кто взял короткую блокировку в Redis, остальные опрашивают
+    результат через load() (обычно кеш ответа), пока блокировка жива.
+    """
+    def __init__(
+        self,
+        cache_manager: Optional[CacheManager] = None,
+        lock_ttl: Optional[int] = None,
+        poll_interval: Optional[float] = None
+    ):
+        self.cache_manager = cache_manager
+        self.lock_ttl = lock_ttl or settings.single_flight_lock_ttl
+        self.poll_interval = poll_interval or settings.single_flight_poll_interval
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.remote_hits = 0
+
+    @property
+    def _redis(self):
+        if self.cache_manager and self.cache_manager.enabled and self.cache_manager.redis_client:
+            return self.cache_manager.redis_client
+        return None
+
+    def pending(self, key: str) -> Optional[asyncio.Task]:
+        """Текущее вычисление по ключу в этом процессе (если есть)"""
+        return self._inflight.get(key)
+
+    async def do(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[Any]],
+        load: Optional[Callable[[], Awaitable[Any]]] = None
+    ) -> Any:
+        """
+        Выполняет compute() один раз на ключ. load() должен вернуть результат,
+        опубликованный вычислившим процессом (или None, если его еще нет).
+        """
+        task = self._inflight.get(key)
+        if task is None:
+            # Вычисление идет отдельной задачей: отключение первого клиента не отменяет его для остальных
+            task = asyncio.create_task(self._lead(key, compute, load))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _finish(self, key: str, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled() and task.exception() is not None:
+            logger.debug(f"Single-flight computation failed for {key}: {task.exception()}")
+
+    async def _lead(self, key: str, compute, load) -> Any:
+        redis_client = self._redis
+        if not redis_client or load is None:
+            self.leaders += 1
+            return await compute()
+
+        lock_key = self.cache_manager._make_key(f"flight:{key}")
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + self.lock_ttl
+        while True:
+            try:
+                acquired = await redis_client.set(lock_key, token, nx=True, ex=self.lock_ttl)
+            except Exception as e:
+                logger.error(f"Single-flight lock error: {e}")
+                acquired = True
+                token = None
+
+            if acquired:
+                self.leaders += 1
+                try:
+                    return await compute()
+                finally:
+                    if token:
+                        try:
+                            await redis_client.eval(RELEASE_LOCK_SCRIPT, 1, lock_key, token)
+                        except Exception as e:
+                            logger.error(f"Single-flight unlock error: {e}")
+
+            # Вычисляет другой процесс: ждем его результат
+            await asyncio.sleep(self.poll_interval)
+            result = await load()
+            if result is not None:
+                self.remote_hits += 1
+                return result
+            if time.monotonic() > deadline:
+                # Чужое вычисление зависло дольше TTL блокировки — считаем сами
+                self.leaders += 1
+                return await compute()
+
+    def get_stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": len(self._inflight),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "remote_hits": self.remote_hits,
+        }
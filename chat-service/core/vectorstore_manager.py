@@ -1,6 +1,7 @@
 import hashlib
 import json
 import asyncio
+import time
 import pickle
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
@@ -14,23 +15,38 @@ import logging
 
 from config import settings
 from core.cache_manager import CacheManager
+from core.metrics import VECTOR_SEARCH_LATENCY
+from data_management.document_processor import INDEXABLE_EXTENSIONS
 
 logger = logging.getLogger(__name__)
 
 class VectorstoreManager:
-    def __init__(self, data_folder: str, index_folder: str, embeddings):
+    def __init__(self, data_folder: str, index_folder: str, embeddings, processor=None,
+                 cache_manager: Optional[CacheManager] = None):
         self.data_folder = Path(data_folder)
         self.index_folder = Path(index_folder)
         self.embeddings = embeddings
-        self.cache = CacheManager()
+        # Общий AsyncDocumentProcessor приложения (создается в lifespan)
+        self.processor = processor
+        # Общий CacheManager приложения; без него кеш поиска не подключен к Redis
+        self.cache = cache_manager or CacheManager()
         self.vectorstore: Optional[FAISS] = None
+        # Имя коллекции и поколение индекса (хеш папки, из которой он построен)
+        self.collection = self.index_folder.name
+        self.generation = ""
         self._lock = asyncio.Lock()
+        # Количество чанков по файлам, считается лениво и сбрасывается при изменении индекса
+        self._chunk_counts: Optional[Dict[str, int]] = None
+        # Число файлов в папке данных для статистики: (поколение, время подсчета, число)
+        self._document_count: Optional[Tuple[str, float, int]] = None
         
         # Создаем директории
         self.index_folder.mkdir(parents=True, exist_ok=True)
         
     async def initialize(self):
         """Асинхронная инициализация векторного хранилища"""
+        # Индекс перестроил другой процесс — перечитываем его с диска
+        self.cache.add_generation_listener(self._on_remote_generation)
         async with self._lock:
             if await self.should_rebuild_index():
                 logger.info(f"Rebuilding index for {self.data_folder}")
@@ -46,7 +62,7 @@ class VectorstoreManager:
         # Собираем информацию о файлах асинхронно
         tasks = []
         for file_path in self.data_folder.glob("**/*"):
-            if file_path.is_file() and file_path.suffix.lower() in ['.pdf', '.docx', '.txt']:
+            if file_path.is_file() and file_path.suffix.lower() in INDEXABLE_EXTENSIONS:
                 tasks.append(self._get_file_info(file_path))
         
         if tasks:
@@ -94,21 +110,29 @@ class VectorstoreManager:
         """Асинхронно пересоздает векторный индекс"""
         from core.async_processor import AsyncDocumentProcessor
         
-        processor = AsyncDocumentProcessor()
+        # Без общего сервиса (например, в скриптах) создаем временный
+        processor = self.processor
+        owns_processor = processor is None
+        if owns_processor:
+            processor = AsyncDocumentProcessor()
         
         # Обрабатываем документы асинхронно
         all_chunks = []
         file_paths = list(self.data_folder.glob("**/*"))
-        valid_files = [f for f in file_paths if f.suffix.lower() in ['.pdf', '.docx', '.txt']]
+        valid_files = [f for f in file_paths if f.is_file() and f.suffix.lower() in INDEXABLE_EXTENSIONS]
         
         logger.info(f"Processing {len(valid_files)} documents")
         
-        # Обрабатываем батчами для оптимизации памяти
-        batch_size = 10
-        for i in range(0, len(valid_files), batch_size):
-            batch = valid_files[i:i + batch_size]
-            batch_chunks = await processor.process_documents_batch(batch)
-            all_chunks.extend(batch_chunks)
+        try:
+            # Обрабатываем батчами для оптимизации памяти
+            batch_size = 10
+            for i in range(0, len(valid_files), batch_size):
+                batch = valid_files[i:i + batch_size]
+                batch_chunks = await processor.process_documents_batch(batch)
+                all_chunks.extend(batch_chunks)
+        finally:
+            if owns_processor:
+                await processor.shutdown()
         
         if all_chunks:
             # Создаем документы для LangChain
@@ -123,6 +147,7 @@ class VectorstoreManager:
             # Создаем векторное хранилище
             logger.info(f"Creating vectorstore with {len(documents)} chunks")
             self.vectorstore = await self._create_vectorstore_async(documents)
+            self._chunk_counts = None
             
             # Сохраняем индекс
             await self.save_index()
@@ -130,15 +155,19 @@ class VectorstoreManager:
             # Сохраняем хеш
             current_hash = await self.get_folder_hash()
             await self.save_folder_hash(current_hash)
+            self.generation = current_hash
             
             # Очищаем кеш
             await self.cache.delete("folder_hash_" + str(self.data_folder))
+            await self.cache.publish_generation(self.collection, self.generation)
         else:
             logger.warning("No documents to index")
             # Создаем пустое хранилище
             self.vectorstore = await self._create_vectorstore_async([
                 Document(page_content="Empty index", metadata={})
             ])
+            self._chunk_counts = None
+            self.generation = "empty"
     
     async def _create_vectorstore_async(self, documents: List[Document]) -> FAISS:
         """Асинхронно создает векторное хранилище"""
@@ -184,42 +213,83 @@ class VectorstoreManager:
                     allow_dangerous_deserialization=True
                 )
             )
+            self._chunk_counts = None
+            self.generation = await self._read_folder_hash()
             logger.info(f"Index loaded from {self.index_folder}")
         except Exception as e:
             logger.error(f"Failed to load index: {e}")
             await self.rebuild_index()
     
+    async def _on_remote_generation(self, collection: str, generation: str):
+        if collection != self.collection or generation == self.generation:
+            return
+        async with self._lock:
+            if generation != self.generation:
+                logger.info(f"Index {self.collection} changed in another process, reloading")
+                await self.load_index()
+    
+    async def _read_folder_hash(self) -> str:
+        """Хеш папки, из которой построен сохраненный индекс"""
+        hash_file = self.index_folder / "folder_hash.txt"
+        if not hash_file.exists():
+            return ""
+        async with aiofiles.open(hash_file, 'r') as f:
+            return (await f.read()).strip()
+    
     async def save_folder_hash(self, hash_value: str):
         """Сохраняет хеш папки"""
         hash_file = self.index_folder / "folder_hash.txt"
         async with aiofiles.open(hash_file, 'w') as f:
             await f.write(hash_value)
     
-    async def search(self, query: str, k: int = 5) -> List[Document]:
-        """Асинхронный поиск с кешированием"""
+    async def search(self, query: str, k: int = 5, query_vector: Optional[List[float]] = None) -> List[Document]:
+        """Асинхронный поиск с кешированием (query_vector — уже посчитанный эмбеддинг запроса)"""
         if not self.vectorstore:
             return []
         
-        # Проверяем кеш
-        cache_key = f"search_{hashlib.md5(query.encode()).hexdigest()}_{k}"
-        cached_result = await self.cache.get(cache_key)
-        if cached_result:
-            logger.debug(f"Cache hit for query: {query[:50]}...")
-            return cached_result
-        
-        # Выполняем поиск
         loop = asyncio.get_event_loop()
-        results = await loop.run_in_executor(
-            None,
-            self.vectorstore.similarity_search,
-            query,
-            k
-        )
         
-        # Кешируем результат
-        await self.cache.set(cache_key, results, ttl=settings.cache_ttl)
+        async def search_ids():
+            return await loop.run_in_executor(None, self._search_ids, query, k, query_vector)
         
-        return results
+        # Ключ включает коллекцию: кеш общий для преподавательского и студенческого индексов.
+        # В кеше только пары (id чанка, score); тексты берутся из docstore индекса.
+        # Популярный запрос после истечения считается один раз (get_or_compute).
+        # Поколение индекса в ключе: после перестроения id чанков другие, старые записи не читаются
+        query_hash = hashlib.md5(query.encode()).hexdigest()
+        cache_key = f"search_{self.collection}_{self.generation}_{query_hash}_{k}"
+        hits = await self.cache.get_or_compute(cache_key, search_ids, ttl=settings.cache_ttl)
+        docs = self._rehydrate(hits)
+        if docs is None:
+            # Индекс перестроен во время поиска — ищем заново
+            docs = self._rehydrate(await search_ids()) or []
+        return docs
+    
+    def _search_ids(self, query: str, k: int,
+                    query_vector: Optional[List[float]] = None) -> List[Tuple[str, float]]:
+        """kNN по индексу: пары (id чанка в docstore, cosine), как similarity_search"""
+        vectorstore = self.vectorstore
+        if query_vector is None:
+            query_vector = self.embeddings.embed_query(query)
+        vector = np.asarray([query_vector], dtype=np.float32)
+        started = time.perf_counter()
+        distances, indices = vectorstore.index.search(vector, k)
+        VECTOR_SEARCH_LATENCY.observe(time.perf_counter() - started, collection=self.collection)
+        return [
+            (vectorstore.index_to_docstore_id[idx], round(1.0 - float(distance) / 2.0, 6))
+            for distance, idx in zip(distances[0], indices[0])
+            if idx != -1
+        ]
+    
+    def _rehydrate(self, hits: List) -> Optional[List[Document]]:
+        """Документы по id из docstore; None, если какого-то чанка уже нет в индексе"""
+        docs = []
+        for doc_id, _ in hits:
+            doc = self.vectorstore.docstore.search(doc_id)
+            if not isinstance(doc, Document):
+                return None
+            docs.append(doc)
+        return docs
     
     async def add_documents(self, documents: List[Document]):
         """Асинхронно добавляет документы в индекс"""
@@ -235,6 +305,7 @@ class VectorstoreManager:
                 self.vectorstore.add_documents,
                 documents
             )
+            self._chunk_counts = None
             
             # Сохраняем обновленный индекс
             await self.save_index()
@@ -242,6 +313,130 @@ class VectorstoreManager:
             # Обновляем хеш
             current_hash = await self.get_folder_hash()
             await self.save_folder_hash(current_hash)
+            self.generation = current_hash
             
             # Очищаем кеш поиска
-            await self.cache.clear_pattern("search_*")
\ No newline at end of file
+            await self.cache.clear_pattern(f"search_{self.collection}_*")
+            await self.cache.publish_generation(self.collection, self.generation)
+    
+    def document_count(self) -> int:
+        """Число файлов в папке данных; пересчитывается при смене поколения или раз в stats_folder_ttl"""
+        cached = self._document_count
+        now = time.monotonic()
+        if cached and cached[0] == self.generation and now - cached[1] < settings.stats_folder_ttl:
+            return cached[2]
+        count = len(list(self.data_folder.glob("**/*"))) if self.data_folder.exists() else 0
+        self._document_count = (self.generation, now, count)
+        return count
+    
+    def get_stats(self) -> Dict:
+        """Размер и поколение индекса коллекции"""
+        stats = {
+            "collection": self.collection,
+            "generation": self.generation,
+            "documents": self.document_count(),
+            "vectors": 0,
+            "chunks": 0,
+            "index_bytes": sum(
+                path.stat().st_size for path in (self.index_folder / "index.faiss", self.index_folder / "index.pkl")
+                if path.exists()
+            ),
+        }
+        if self.vectorstore:
+            stats["vectors"] = self.vectorstore.index.ntotal
+            stats["chunks"] = len(self.vectorstore.docstore._dict)
+        return stats
+    
+    def _chunk_counts_by_file(self) -> Dict[str, int]:
+        """Количество чанков каждого файла в индексе"""
+        if self._chunk_counts is None:
+            counts: Dict[str, int] = {}
+            for doc in self.vectorstore.docstore._dict.values():
+                file_name = doc.metadata.get("file_name")
+                if file_name:
+                    counts[file_name] = counts.get(file_name, 0) + 1
+            self._chunk_counts = counts
+        return self._chunk_counts
+    
+    def _knn_batch(self, vectors: np.ndarray, k: int) -> List[List[Tuple[Document, float]]]:
+        """Батчевый kNN по FAISS-индексу: для каждого вектора k пар (чанк, cosine)"""
+        started = time.perf_counter()
+        distances, indices = self.vectorstore.index.search(vectors, k)
+        VECTOR_SEARCH_LATENCY.observe(time.perf_counter() - started, collection=self.collection)
+        results = []
+        for row_distances, row_indices in zip(distances, indices):
+            hits = []
+            for distance, idx in zip(row_distances, row_indices):
+                if idx == -1:
+                    continue
+                doc = self.vectorstore.docstore.search(self.vectorstore.index_to_docstore_id[idx])
+                if not isinstance(doc, Document):
+                    continue
+                # Эмбеддинги нормированы, IndexFlatL2 возвращает квадрат расстояния
+                hits.append((doc, 1.0 - float(distance) / 2.0))
+            results.append(hits)
+        return results
+    
+    async def find_overlapping_documents(
+        self,
+        chunk_texts: List[str],
+        k: int = 3,
+        threshold: float = 0.85,
+        limit: int = 5
+    ) -> List[Dict]:
+        """
+        Поиск частичных дубликатов на уровне чанков: все чанки загруженного файла
+        эмбеддятся одним батчем и ищутся в индексе коллекции одним батчевым kNN.
+        Для каждого файла коллекции считается доля чанков загрузки, чье лучшее
+        совпадение (>= threshold) пришлось на этот файл, и доля его собственных чанков,
+        которые были задеты.
+        """
+        if not self.vectorstore or not chunk_texts:
+            return []
+        
+        loop = asyncio.get_event_loop()
+        vectors = await loop.run_in_executor(None, self.embeddings.embed_documents, chunk_texts)
+        vectors = np.asarray(vectors, dtype=np.float32)
+        hits = await loop.run_in_executor(None, self._knn_batch, vectors, k)
+        
+        per_file: Dict[str, Dict] = {}
+        for chunk_hits in hits:
+            matched = [(doc, score) for doc, score in chunk_hits if score >= threshold]
+            if not matched:
+                continue
+            
+            for doc, _ in matched:
+                file_name = doc.metadata.get("file_name")
+                if file_name:
+                    entry = per_file.setdefault(file_name, {
+                        "matched_chunks": 0, "score_sum": 0.0, "hit_chunks": set()
+                    })
+                    entry["hit_chunks"].add(doc.metadata.get("chunk_id"))
+            
+            # Чанк загрузки засчитывается файлу его лучшего совпадения
+            best_doc, best_score = matched[0]
+            best_file = best_doc.metadata.get("file_name")
+            if best_file:
+                per_file[best_file]["matched_chunks"] += 1
+                per_file[best_file]["score_sum"] += best_score
+        
+        chunk_counts = self._chunk_counts_by_file()
+        total = len(chunk_texts)
+        results = []
+        for file_name, entry in per_file.items():
+            if not entry["matched_chunks"]:
+                continue
+            coverage = entry["matched_chunks"] / total
+            file_chunks = chunk_counts.get(file_name, 0)
+            results.append({
+                "file": file_name,
+                "similarity": round(coverage * 100, 2),
+                "coverage": round(coverage, 4),
+                "matched_chunks": entry["matched_chunks"],
+                "total_chunks": total,
+                "avg_similarity": round(entry["score_sum"] / entry["matched_chunks"], 4),
+                "document_overlap": round(len(entry["hit_chunks"]) / file_chunks, 4) if file_chunks else 0.0
+            })
+        
+        results.sort(key=lambda item: (item["coverage"], item["avg_similarity"]), reverse=True)
+        return results[:limit]
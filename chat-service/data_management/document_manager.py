@@ -1,5 +1,4 @@
 import os
-import json
 import shutil
 import hashlib
 from datetime import datetime
@@ -7,39 +6,44 @@ from pathlib import Path
 import logging
 from typing import List, Dict, Any, Optional
 
+from data_management.document_processor import (
+    extract_document_text,
+    create_chunks_by_sentence,
+    INDEXABLE_EXTENSIONS
+)
+from data_management.similarity_index import MinHashLSHIndex
+from data_management.document_store import create_document_store, DuplicateDocumentError
+from config import settings
+
 logger = logging.getLogger(__name__)
 
 class DocumentManager:
-    def __init__(self, data_folder: str, metadata_file: str = "document_metadata.json"):
+    def __init__(self, data_folder: str, metadata_file: str = "document_metadata.json",
+                 similarity_index_file: str = "minhash_index.json",
+                 backend: Optional[str] = None):
         self.data_folder = Path(data_folder)
         self.metadata_file = self.data_folder / metadata_file
         self.ensure_metadata_exists()
+        # Хранилище каталога: SQLite (по умолчанию) или legacy JSON
+        self.store = create_document_store(
+            backend or settings.document_store_backend,
+            self.data_folder,
+            metadata_file
+        )
+        # Индекс почти-дубликатов (MinHash + LSH), обновляется при add/delete
+        self.similarity_index = MinHashLSHIndex(self.data_folder / similarity_index_file)
     
     def ensure_metadata_exists(self):
-        """Создает структуру метаданных если не существует"""
+        """Создает папку данных (файлы хранилища создаются самим store)"""
         self.data_folder.mkdir(parents=True, exist_ok=True)
-        
-        if not self.metadata_file.exists():
-            initial_metadata = {"documents": []}
-            with open(self.metadata_file, 'w', encoding='utf-8') as f:
-                json.dump(initial_metadata, f, ensure_ascii=False, indent=2)
     
     def load_metadata(self) -> Dict[str, Any]:
-        """Загружает метаданные"""
-        try:
-            with open(self.metadata_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except Exception as e:
-            logger.error(f"Error loading metadata: {e}")
-            return {"documents": []}
+        """Загружает метаданные (все документы, включая удаленные)"""
+        return {"documents": self.store.list_all()}
     
     def save_metadata(self, metadata: Dict[str, Any]):
-        """Сохраняет метаданные"""
-        try:
-            with open(self.metadata_file, 'w', encoding='utf-8') as f:
-                json.dump(metadata, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            logger.error(f"Error saving metadata: {e}")
+        """Полностью перезаписывает каталог"""
+        self.store.replace_all(metadata.get("documents", []))
     
     def calculate_hash(self, file_path: str) -> str:
         """Вычисляет хеш файла"""
@@ -49,10 +53,18 @@ class DocumentManager:
                 hash_md5.update(chunk)
         return hash_md5.hexdigest()
     
+    def make_stored_filename(self, filename: str) -> str:
+        """Имя файла в data folder: <timestamp>_<original>"""
+        timestamp = datetime.now().isoformat()
+        return f"{timestamp.replace(':', '-')}_{Path(filename).name}"
+    
+    def find_active_by_hash(self, file_hash: str) -> Optional[Dict[str, Any]]:
+        """Ищет активный документ с таким же содержимым"""
+        return self.store.find_active_by_hash(file_hash)
+    
     def add_document(self, file_path: str, title: Optional[str] = None, 
                     description: str = "", tags: Optional[List[str]] = None) -> Dict[str, Any]:
-        """Добавляет документ в систему"""
-        metadata = self.load_metadata()
+        """Добавляет документ в систему (копирует файл в data folder)"""
         file_path = Path(file_path)
         filename = file_path.name
         
@@ -60,101 +72,185 @@ class DocumentManager:
         file_hash = self.calculate_hash(str(file_path))
         
         # Проверяем дубликаты
-        for existing_doc in metadata["documents"]:
-            if existing_doc.get("file_hash") == file_hash and existing_doc.get("status") == "active":
-                logger.info(f"Document with same content already exists: {existing_doc['id']}")
-                return existing_doc
-        
-        # Создаем новый документ
-        doc_id = self.generate_id()
-        timestamp = datetime.now().isoformat()
+        existing_doc = self.find_active_by_hash(file_hash)
+        if existing_doc:
+            logger.info(f"Document with same content already exists: {existing_doc['id']}")
+            return existing_doc
         
         # Копируем файл в data folder
-        new_filename = f"{timestamp.replace(':', '-')}_{filename}"
+        new_filename = self.make_stored_filename(filename)
         dest_path = self.data_folder / new_filename
         shutil.copy2(file_path, dest_path)
         
+        return self._append_document(
+            filename, new_filename, file_hash, file_path.stat().st_size,
+            title, description, tags
+        )
+    
+    def register_stored_document(self, stored_filename: str, original_filename: str, file_hash: str,
+                                 file_size: int, title: Optional[str] = None, description: str = "",
+                                 tags: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        Регистрирует файл, уже записанный в data folder (например, потоковой загрузкой),
+        без повторного чтения и копирования. Дубликат по хешу удаляется с диска.
+        """
+        existing_doc = self.find_active_by_hash(file_hash)
+        if existing_doc:
+            logger.info(f"Document with same content already exists: {existing_doc['id']}")
+            (self.data_folder / stored_filename).unlink(missing_ok=True)
+            return existing_doc
+        
+        return self._append_document(
+            original_filename, stored_filename, file_hash, file_size,
+            title, description, tags
+        )
+    
+    def _append_document(self, filename: str, stored_filename: str,
+                         file_hash: str, file_size: int, title: Optional[str],
+                         description: str, tags: Optional[List[str]]) -> Dict[str, Any]:
+        """Создает запись о документе в хранилище"""
+        doc_id = self.generate_id()
+        timestamp = datetime.now().isoformat()
+        
         new_doc = {
             "id": doc_id,
             "original_filename": filename,
-            "stored_filename": new_filename,
+            "stored_filename": stored_filename,
             "title": title or filename,
             "description": description,
             "tags": tags or [],
             "upload_date": timestamp,
             "file_hash": file_hash,
-            "file_size": file_path.stat().st_size,
+            "file_size": file_size,
             "status": "active"
         }
         
-        metadata["documents"].append(new_doc)
-        self.save_metadata(metadata)
+        try:
+            self.store.insert(new_doc)
+        except DuplicateDocumentError as e:
+            # Тот же файл параллельно зарегистрировал другой запрос
+            logger.info(str(e))
+            (self.data_folder / stored_filename).unlink(missing_ok=True)
+            return e.existing
+        
+        self._index_content(stored_filename, doc_id)
+        self.similarity_index.save()
         
         logger.info(f"Document added: {doc_id} - {filename}")
         return new_doc
     
     def delete_document_by_id(self, doc_id: str):
         """Помечает документ как удаленный"""
-        metadata = self.load_metadata()
-        
-        for doc in metadata["documents"]:
-            if doc["id"] == doc_id:
-                doc["status"] = "deleted"
-                doc["deleted_date"] = datetime.now().isoformat()
-                
-                # Опционально: удаляем физический файл
-                file_path = self.data_folder / doc["stored_filename"]
-                if file_path.exists():
-                    file_path.unlink()
-                
-                logger.info(f"Document deleted: {doc_id}")
-                break
-        
-        self.save_metadata(metadata)
+        doc = self.store.mark_deleted(doc_id, datetime.now().isoformat())
+        if not doc:
+            return
+        
+        # Опционально: удаляем физический файл
+        file_path = self.data_folder / doc["stored_filename"]
+        if file_path.exists():
+            file_path.unlink()
+        
+        if self.similarity_index.remove(doc["stored_filename"]):
+            self.similarity_index.save()
+        self.store.remove_chunks(doc["stored_filename"])
+        
+        logger.info(f"Document deleted: {doc_id}")
+    
+    def _index_content(self, stored_filename: str, doc_id: Optional[str] = None) -> bool:
+        """
+        Извлекает текст файла один раз и обновляет по нему индекс почти-дубликатов
+        (без сохранения) и полнотекстовый индекс чанков
+        """
+        try:
+            text = extract_document_text(str(self.data_folder / stored_filename))
+        except Exception as e:
+            logger.error(f"Error extracting text for content index {stored_filename}: {e}")
+            return False
+        
+        if self.store.supports_full_text and text and text.strip():
+            chunks = create_chunks_by_sentence(text, {}, settings.chunk_size, 1, 0)
+            self.store.index_chunks(stored_filename, doc_id, [chunk["text"] for chunk in chunks])
+        
+        signature = self.similarity_index.signature(text or "")
+        if signature is None:
+            return False
+        self.similarity_index.add(stored_filename, signature, doc_id=doc_id)
+        return True
+    
+    def sync_content_indexes(self) -> int:
+        """
+        Приводит индекс почти-дубликатов и полнотекстовый индекс в соответствие с папкой:
+        индексирует файлы, которых в них нет (например, положенные в data folder вручную),
+        и убирает удаленные. Возвращает количество изменений; при отсутствии изменений ничего не читает.
+        """
+        # Тот же рекурсивный обход, что и у векторного индекса; ключ — путь относительно папки
+        on_disk = {
+            p.relative_to(self.data_folder).as_posix() for p in self.data_folder.glob("**/*")
+            if p.is_file() and p.suffix.lower() in INDEXABLE_EXTENSIONS
+        }
+        similarity_keys = set(self.similarity_index.keys())
+        content_keys = self.store.indexed_content_keys()
+        
+        changes = 0
+        for stale in similarity_keys - on_disk:
+            self.similarity_index.remove(stale)
+            changes += 1
+        
+        missing = on_disk - similarity_keys
+        if content_keys is not None:
+            for stale in content_keys - on_disk:
+                self.store.remove_chunks(stale)
+                changes += 1
+            missing |= on_disk - content_keys
+        
+        if missing:
+            doc_ids = {doc["stored_filename"]: doc["id"] for doc in self.get_active_documents()}
+            for name in missing:
+                if self._index_content(name, doc_ids.get(name)):
+                    changes += 1
+        
+        if changes:
+            self.similarity_index.save()
+            logger.info(f"Content indexes synced for {self.data_folder}: {changes} changes")
+        return changes
+    
+    def find_near_duplicates(self, text: str, threshold: float = 0.5, limit: int = 3) -> List[Dict[str, Any]]:
+        """Ищет почти-дубликаты текста через LSH-индекс коллекции"""
+        signature = self.similarity_index.signature(text)
+        if signature is None:
+            return []
+        
+        return [
+            {
+                "file": key,
+                "document_id": info.get("doc_id"),
+                "similarity": round(score * 100, 2)
+            }
+            for key, score, info in self.similarity_index.query(signature, threshold)[:limit]
+        ]
     
     def get_active_documents(self) -> List[Dict[str, Any]]:
         """Возвращает список активных документов"""
-        metadata = self.load_metadata()
-        return [doc for doc in metadata["documents"] if doc.get("status") == "active"]
+        return self.store.list_active()
     
     def get_document_by_id(self, doc_id: str) -> Optional[Dict[str, Any]]:
         """Получает документ по ID"""
-        metadata = self.load_metadata()
-        for doc in metadata["documents"]:
-            if doc["id"] == doc_id:
-                return doc
-        return None
+        return self.store.get(doc_id)
     
     def generate_id(self) -> str:
         """Генерирует уникальный ID"""
         return f"doc_{datetime.now().strftime('%Y%m%d%H%M%S')}_{os.urandom(4).hex()}"
     
-    def search_documents(self, query: str) -> List[Dict[str, Any]]:
-        """Поиск документов по названию и тегам"""
-        query_lower = query.lower()
-        results = []
-        
-        for doc in self.get_active_documents():
-            # Поиск в названии
-            if query_lower in doc["title"].lower():
-                results.append(doc)
-                continue
-            
-            # Поиск в тегах
-            if any(query_lower in tag.lower() for tag in doc.get("tags", [])):
-                results.append(doc)
-                continue
-            
-            # Поиск в описании
-            if query_lower in doc.get("description", "").lower():
-                results.append(doc)
-        
-        return results
+    def search_documents(self, query: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """
+        Ранжированный поиск по названию, тегам, описанию и тексту документов
+        (FTS5 в SQLite-хранилище, подстрочный поиск по каталогу в JSON-хранилище)
+        """
+        return self.store.search(query, limit)
     
     def get_statistics(self) -> Dict[str, Any]:
         """Возвращает статистику по документам"""
-        metadata = self.load_metadata()
-        active_docs = [doc for doc in metadata["documents"] if doc.get("status") == "active"]
+        active_docs = self.store.list_active()
         
         total_size = sum(doc.get("file_size", 0) for doc in active_docs)
         
@@ -23,6 +23,11 @@ POPPLER_PATH = os.getenv('POPPLER_PATH', None)
 if TESSERACT_CMD != 'tesseract':
     pytesseract.pytesseract.tesseract_cmd = TESSERACT_CMD
 
+# Форматы, которые попадают в векторный индекс
+INDEXABLE_EXTENSIONS = ('.pdf', '.docx', '.txt', '.xlsx', '.pptx')
+# Форматы, которые разбиваются на чанки по строкам таблиц / слайдам
+TABULAR_EXTENSIONS = ('.xlsx', '.pptx')
+
 
 def extract_text_from_docx(file_path):
     """Извлечение текста (включая таблицы) из файла DOCX."""
@@ -144,6 +149,165 @@ def extract_text_from_txt(file_path):
         logger.error(f"Error processing TXT {file_path}: {e}")
         return "", {}
 
+def _format_cell(value):
+    """Приводит значение ячейки к компактной строке."""
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return str(value).strip()
+
+def _render_row(header, values):
+    """Строка таблицы в виде 'Заголовок: значение | ...' (или просто значения без заголовка)."""
+    parts = []
+    for idx, value in enumerate(values):
+        if not value:
+            continue
+        name = header[idx] if header and idx < len(header) and header[idx] else ""
+        parts.append(f"{name}: {value}" if name else value)
+    return " | ".join(parts)
+
+def _make_chunk(file_metadata, idx, text, extra):
+    return {
+        "id": f"{file_metadata.get('file_name', 'unknown')}-chunk-{idx}",
+        "text": text,
+        "metadata": {**file_metadata, **extra, "chunk_id": idx, "token_count": len(text.split())}
+    }
+
+def create_chunks_from_xlsx(file_path, file_metadata, target_chunk_size=512):
+    """
+    Потоково читает XLSX (openpyxl read_only) и собирает строки в чанки.
+    Первая непустая строка листа считается заголовком и повторяется в каждом чанке листа,
+    а каждая строка записывается как пары 'колонка: значение', чтобы чанк был понятен без соседей.
+    """
+    import openpyxl
+
+    chunks = []
+    wb = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        for sheet in wb.worksheets:
+            header = None
+            header_line = ""
+            rows, size, row_start = [], 0, None
+            sheet_chunks_start = len(chunks)
+
+            def flush(row_end):
+                nonlocal rows, size, row_start
+                if rows:
+                    text = f"Лист: {sheet.title}\n" + (header_line + "\n" if header_line else "") + "\n".join(rows)
+                    chunks.append(_make_chunk(file_metadata, len(chunks), text, {
+                        "content_type": "table",
+                        "sheet": sheet.title,
+                        "row_start": row_start,
+                        "row_end": row_end
+                    }))
+                rows, size, row_start = [], 0, None
+
+            row_number = 0
+            for row_number, row in enumerate(sheet.iter_rows(values_only=True), start=1):
+                values = [_format_cell(v) for v in row]
+                if not any(values):
+                    continue
+                if header is None:
+                    header = values
+                    header_line = " | ".join(v for v in values if v)
+                    continue
+
+                line = _render_row(header, values)
+                line_size = len(line.split())
+                if size + line_size > target_chunk_size and rows:
+                    flush(row_number - 1)
+                if row_start is None:
+                    row_start = row_number
+                rows.append(line)
+                size += line_size
+
+            # Лист без строк данных: сохраняем хотя бы заголовок
+            if header is not None and not rows and sheet_chunks_start == len(chunks):
+                rows, row_start, header_line = [header_line], 1, ""
+            flush(row_number)
+    finally:
+        wb.close()
+
+    return chunks
+
+def create_chunks_from_pptx(file_path, file_metadata, target_chunk_size=512):
+    """
+    Извлекает текст слайдов (включая таблицы) и объединяет соседние слайды в чанки.
+    Слайд не разрывается между чанками.
+    """
+    from pptx import Presentation
+
+    prs = Presentation(file_path)
+    chunks = []
+    parts, size, slide_start = [], 0, None
+
+    def flush(slide_end):
+        nonlocal parts, size, slide_start
+        if parts:
+            chunks.append(_make_chunk(file_metadata, len(chunks), "\n\n".join(parts), {
+                "content_type": "slides",
+                "slide_start": slide_start,
+                "slide_end": slide_end
+            }))
+        parts, size, slide_start = [], 0, None
+
+    slide_number = 0
+    for slide_number, slide in enumerate(prs.slides, start=1):
+        lines = []
+        for shape in slide.shapes:
+            if getattr(shape, "has_table", False) and shape.has_table:
+                table_rows = [[_format_cell(cell.text) for cell in row.cells] for row in shape.table.rows]
+                header = table_rows[0] if table_rows else None
+                if header:
+                    lines.append(" | ".join(v for v in header if v))
+                lines.extend(filter(None, (_render_row(header, r) for r in table_rows[1:])))
+            elif hasattr(shape, "text") and shape.text.strip():
+                lines.append(shape.text.strip())
+        if not lines:
+            continue
+
+        text = f"Слайд {slide_number}:\n" + "\n".join(lines)
+        text_size = len(text.split())
+        if size + text_size > target_chunk_size and parts:
+            flush(slide_number - 1)
+        if slide_start is None:
+            slide_start = slide_number
+        parts.append(text)
+        size += text_size
+    flush(slide_number)
+
+    return chunks
+
+def create_tabular_chunks(file_path, file_metadata, target_chunk_size=512):
+    """Чанки для табличных форматов (XLSX/PPTX)."""
+    ext = os.path.splitext(file_path)[1].lower()
+    try:
+        if ext == '.xlsx':
+            return create_chunks_from_xlsx(file_path, {**file_metadata, "file_type": "xlsx"}, target_chunk_size)
+        if ext == '.pptx':
+            return create_chunks_from_pptx(file_path, {**file_metadata, "file_type": "pptx"}, target_chunk_size)
+    except Exception as e:
+        logger.error(f"Error processing {ext.upper()[1:]} {file_path}: {e}")
+    return []
+
+def extract_document_text(file_path, min_words_per_page=50):
+    """Полный текст документа любого индексируемого формата (для дедупликации)."""
+    ext = os.path.splitext(file_path)[1].lower()
+    file_metadata = {"file_name": os.path.basename(file_path), "file_path": str(file_path)}
+
+    if ext in TABULAR_EXTENSIONS:
+        return "\n".join(chunk["text"] for chunk in create_tabular_chunks(file_path, file_metadata))
+    if ext == '.docx':
+        return extract_text_from_docx(file_path)
+    if ext == '.pdf':
+        return extract_text_from_pdf(file_path, min_words_per_page)[0]
+    if ext == '.txt':
+        return extract_text_from_txt(file_path)[0]
+    return ""
+
 def split_text_into_sentences(text):
     """Split text into sentences using razdel."""
     return [s.text for s in sentenize(text)]
@@ -207,7 +371,9 @@ def process_document(file_path, min_words_per_page=50, target_chunk_size=512, mi
     file_metadata = {"file_name": os.path.basename(file_path), "file_path": file_path}
     text, meta = "", {}
 
-    if file_extension == '.docx':
+    if file_extension in TABULAR_EXTENSIONS:
+        return create_tabular_chunks(file_path, file_metadata, target_chunk_size)
+    elif file_extension == '.docx':
         text = extract_text_from_docx(file_path)
         meta = {"file_type": "docx"}
     elif file_extension == '.pdf':
@@ -239,7 +405,7 @@ def process_document_folder(
     
     for root, _, files in os.walk(folder_path):
         for file in files:
-            if file.lower().endswith(('.pdf', '.docx', '.txt')):
+            if file.lower().endswith(INDEXABLE_EXTENSIONS):
                 file_path = os.path.join(root, file)
                 doc_chunks = process_document(
                     file_path,
@@ -0,0 +1,491 @@
+import re
+import json
+import sqlite3
+import threading
+from pathlib import Path
+import logging
+from typing import List, Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+_QUERY_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+def _fold(text: str) -> str:
+    """ё -> е: unicode61 не снимает диакритику с кириллицы"""
+    return text.replace("ё", "е").replace("Ё", "Е")
+
+def _fold_sql(column: str) -> str:
+    return f"replace(replace({column}, 'ё', 'е'), 'Ё', 'Е')"
+
+def _substring_search(documents: List[Dict[str, Any]], query: str, limit: int) -> List[Dict[str, Any]]:
+    """Подстрочный поиск по названию, тегам и описанию (без FTS)"""
+    query_lower = query.lower()
+    results = []
+    for doc in documents:
+        if (
+            query_lower in doc.get("title", "").lower()
+            or any(query_lower in tag.lower() for tag in doc.get("tags", []))
+            or query_lower in doc.get("description", "").lower()
+        ):
+            results.append({**doc, "score": 1.0, "snippets": []})
+    return results[:limit]
+
+class DuplicateDocumentError(Exception):
+    """Активный документ с таким же хешем уже существует"""
+    def __init__(self, existing: Dict[str, Any]):
+        self.existing = existing
+        super().__init__(f"Document with same content already exists: {existing['id']}")
+
+class JsonDocumentStore:
+    """Исходное хранилище: весь каталог в одном JSON-файле, перечитывается на каждую операцию"""
+
+    def __init__(self, metadata_file: Path):
+        self.metadata_file = Path(metadata_file)
+        self._lock = threading.Lock()
+        if not self.metadata_file.exists():
+            self._save({"documents": []})
+
+    def _load(self) -> Dict[str, Any]:
+        try:
+            with open(self.metadata_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            logger.error(f"Error loading metadata: {e}")
+            return {"documents": []}
+
+    def _save(self, metadata: Dict[str, Any]):
+        try:
+            with open(self.metadata_file, 'w', encoding='utf-8') as f:
+                json.dump(metadata, f, ensure_ascii=False, indent=2)
+        except Exception as e:
+            logger.error(f"Error saving metadata: {e}")
+
+    def list_all(self) -> List[Dict[str, Any]]:
+        return self._load()["documents"]
+
+    def list_active(self) -> List[Dict[str, Any]]:
+        return [doc for doc in self.list_all() if doc.get("status") == "active"]
+
+    def get(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        for doc in self.list_all():
+            if doc["id"] == doc_id:
+                return doc
+        return None
+
+    def find_active_by_hash(self, file_hash: str) -> Optional[Dict[str, Any]]:
+        for doc in self.list_all():
+            if doc.get("file_hash") == file_hash and doc.get("status") == "active":
+                return doc
+        return None
+
+    def insert(self, doc: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            metadata = self._load()
+            for existing in metadata["documents"]:
+                if existing.get("file_hash") == doc["file_hash"] and existing.get("status") == "active":
+                    raise DuplicateDocumentError(existing)
+            metadata["documents"].append(doc)
+            self._save(metadata)
+        return doc
+
+    def mark_deleted(self, doc_id: str, deleted_date: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            metadata = self._load()
+            for doc in metadata["documents"]:
+                if doc["id"] == doc_id:
+                    doc["status"] = "deleted"
+                    doc["deleted_date"] = deleted_date
+                    self._save(metadata)
+                    return doc
+        return None
+
+    def replace_all(self, documents: List[Dict[str, Any]]):
+        with self._lock:
+            self._save({"documents": documents})
+
+    # Полнотекстовый индекс не поддерживается: поиск только по полям каталога
+    supports_full_text = False
+
+    def indexed_content_keys(self) -> Optional[set]:
+        return None
+
+    def index_chunks(self, doc_key: str, doc_id: Optional[str], chunks: List[str]):
+        pass
+
+    def remove_chunks(self, doc_key: str):
+        pass
+
+    def search(self, query: str, limit: int = 20) -> List[Dict[str, Any]]:
+        return _substring_search(self.list_active(), query, limit)
+
+class SqliteDocumentStore:
+    """
+    Каталог документов в SQLite (WAL) с индексами по id, file_hash и status.
+    Уникальный частичный индекс по file_hash среди активных документов делает
+    дедупликацию атомарной: параллельная загрузка того же файла получает DuplicateDocumentError.
+    При первом запуске каталог однократно импортируется из legacy JSON.
+
+    Полнотекстовый поиск: FTS5 с токенизатором unicode61 (кириллица, включая казахские буквы,
+    приводится к нижнему регистру, диакритика снимается) по полям каталога (external content,
+    синхронизируется триггерами) и по тексту чанков документов.
+    """
+    _FTS_VERSION = "1"
+    # Веса bm25 для колонок documents_fts: title, tags, description, original_filename
+    _CATALOG_WEIGHTS = (10.0, 5.0, 2.0, 3.0)
+    _CATALOG_BOOST = 1.5
+    _COLUMNS = (
+        "id", "original_filename", "stored_filename", "title", "description", "tags",
+        "upload_date", "file_hash", "file_size", "status", "deleted_date"
+    )
+
+    def __init__(self, db_file: Path, legacy_json_file: Optional[Path] = None):
+        self.db_file = Path(db_file)
+        self._local = threading.local()
+        self.supports_full_text = False
+        self._init_schema()
+        self._init_full_text()
+        if legacy_json_file is not None:
+            self._migrate_from_json(Path(legacy_json_file))
+
+    def _connect(self) -> sqlite3.Connection:
+        """Соединение на поток: sqlite3-соединения нельзя делить между потоками"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        conn = self._connect()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS documents (
+                id TEXT PRIMARY KEY,
+                original_filename TEXT NOT NULL,
+                stored_filename TEXT NOT NULL,
+                title TEXT,
+                description TEXT DEFAULT '',
+                tags TEXT DEFAULT '[]',
+                upload_date TEXT NOT NULL,
+                file_hash TEXT,
+                file_size INTEGER DEFAULT 0,
+                status TEXT NOT NULL DEFAULT 'active',
+                deleted_date TEXT,
+                extra TEXT DEFAULT '{}'
+            );
+            CREATE INDEX IF NOT EXISTS idx_documents_status_upload
+                ON documents (status, upload_date);
+            CREATE INDEX IF NOT EXISTS idx_documents_file_hash
+                ON documents (file_hash);
+            CREATE UNIQUE INDEX IF NOT EXISTS uq_documents_active_hash
+                ON documents (file_hash) WHERE status = 'active';
+            CREATE TABLE IF NOT EXISTS store_meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+        """)
+
+    def _init_full_text(self):
+        """Создает FTS5-таблицы и триггеры; без FTS5 в сборке SQLite поиск деградирует до подстрок"""
+        conn = self._connect()
+        try:
+            fts_columns = ("title", "tags", "description", "original_filename")
+            folded = ", ".join(_fold_sql(f"{{row}}.{column}") for column in fts_columns)
+            conn.executescript(f"""
+                CREATE VIEW IF NOT EXISTS documents_fts_source AS
+                    SELECT rowid AS doc_rowid, {", ".join(f"{_fold_sql(c)} AS {c}" for c in fts_columns)}
+                    FROM documents;
+                CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(
+                    title, tags, description, original_filename,
+                    content='documents_fts_source', content_rowid='doc_rowid',
+                    tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+                );
+                CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(
+                    text, doc_key UNINDEXED, doc_id UNINDEXED, chunk_id UNINDEXED,
+                    tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+                );
+                CREATE TABLE IF NOT EXISTS content_index (
+                    doc_key TEXT PRIMARY KEY,
+                    doc_id TEXT,
+                    chunk_count INTEGER NOT NULL DEFAULT 0
+                );
+                CREATE TRIGGER IF NOT EXISTS documents_fts_ai AFTER INSERT ON documents BEGIN
+                    INSERT INTO documents_fts (rowid, title, tags, description, original_filename)
+                    VALUES (new.rowid, {folded.format(row="new")});
+                END;
+                CREATE TRIGGER IF NOT EXISTS documents_fts_ad AFTER DELETE ON documents BEGIN
+                    INSERT INTO documents_fts (documents_fts, rowid, title, tags, description, original_filename)
+                    VALUES ('delete', old.rowid, {folded.format(row="old")});
+                END;
+                CREATE TRIGGER IF NOT EXISTS documents_fts_au AFTER UPDATE ON documents BEGIN
+                    INSERT INTO documents_fts (documents_fts, rowid, title, tags, description, original_filename)
+                    VALUES ('delete', old.rowid, {folded.format(row="old")});
+                    INSERT INTO documents_fts (rowid, title, tags, description, original_filename)
+                    VALUES (new.rowid, {folded.format(row="new")});
+                END;
+            """)
+        except sqlite3.OperationalError as e:
+            logger.warning(f"FTS5 is not available, full-text search disabled: {e}")
+            return
+
+        # Каталог, созданный до появления FTS, индексируется один раз
+        row = conn.execute("SELECT value FROM store_meta WHERE key = 'fts_version'").fetchone()
+        if not row or row["value"] != self._FTS_VERSION:
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.execute("INSERT INTO documents_fts (documents_fts) VALUES ('rebuild')")
+                conn.execute(
+                    "INSERT OR REPLACE INTO store_meta (key, value) VALUES ('fts_version', ?)",
+                    (self._FTS_VERSION,)
+                )
+        self.supports_full_text = True
+
+    def _migrate_from_json(self, json_file: Path):
+        """Однократный импорт document_metadata.json (сам файл не удаляется)"""
+        conn = self._connect()
+        if conn.execute("SELECT 1 FROM store_meta WHERE key = 'json_migrated'").fetchone():
+            return
+
+        documents = []
+        if json_file.exists():
+            try:
+                with open(json_file, 'r', encoding='utf-8') as f:
+                    documents = json.load(f).get("documents", [])
+            except Exception as e:
+                logger.error(f"Error reading legacy metadata {json_file}: {e}")
+                return
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Другой воркер мог выполнить миграцию, пока мы ждали блокировку
+            if conn.execute("SELECT 1 FROM store_meta WHERE key = 'json_migrated'").fetchone():
+                conn.execute("ROLLBACK")
+                return
+            imported = 0
+            for doc in documents:
+                # Старые дубликаты активных хешей импортируются как удаленные
+                if doc.get("status") == "active" and conn.execute(
+                    "SELECT 1 FROM documents WHERE file_hash = ? AND status = 'active'",
+                    (doc.get("file_hash"),)
+                ).fetchone():
+                    doc = {**doc, "status": "deleted"}
+                conn.execute(self._insert_sql(or_ignore=True), self._to_row(doc))
+                imported += 1
+            conn.execute(
+                "INSERT INTO store_meta (key, value) VALUES ('json_migrated', ?)",
+                (str(json_file),)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if imported:
+            logger.info(f"Migrated {imported} documents from {json_file} to {self.db_file}")
+
+    def _insert_sql(self, or_ignore: bool = False) -> str:
+        columns = self._COLUMNS + ("extra",)
+        verb = "INSERT OR IGNORE" if or_ignore else "INSERT"
+        return f"{verb} INTO documents ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+
+    def _to_row(self, doc: Dict[str, Any]) -> tuple:
+        extra = {k: v for k, v in doc.items() if k not in self._COLUMNS}
+        values = []
+        for column in self._COLUMNS:
+            value = doc.get(column)
+            if column == "tags":
+                value = json.dumps(value or [], ensure_ascii=False)
+            elif column == "description":
+                value = value or ""
+            elif column == "file_size":
+                value = value or 0
+            elif column == "status":
+                value = value or "active"
+            values.append(value)
+        values.append(json.dumps(extra, ensure_ascii=False))
+        return tuple(values)
+
+    def _from_row(self, row: sqlite3.Row) -> Dict[str, Any]:
+        doc = {column: row[column] for column in self._COLUMNS}
+        doc["tags"] = json.loads(doc["tags"] or "[]")
+        if doc["deleted_date"] is None:
+            del doc["deleted_date"]
+        doc.update(json.loads(row["extra"] or "{}"))
+        return doc
+
+    def list_all(self) -> List[Dict[str, Any]]:
+        rows = self._connect().execute("SELECT * FROM documents ORDER BY upload_date").fetchall()
+        return [self._from_row(row) for row in rows]
+
+    def list_active(self) -> List[Dict[str, Any]]:
+        rows = self._connect().execute(
+            "SELECT * FROM documents WHERE status = 'active' ORDER BY upload_date"
+        ).fetchall()
+        return [self._from_row(row) for row in rows]
+
+    def get(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        row = self._connect().execute("SELECT * FROM documents WHERE id = ?", (doc_id,)).fetchone()
+        return self._from_row(row) if row else None
+
+    def find_active_by_hash(self, file_hash: str) -> Optional[Dict[str, Any]]:
+        row = self._connect().execute(
+            "SELECT * FROM documents WHERE file_hash = ? AND status = 'active'", (file_hash,)
+        ).fetchone()
+        return self._from_row(row) if row else None
+
+    def insert(self, doc: Dict[str, Any]) -> Dict[str, Any]:
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.execute(self._insert_sql(), self._to_row(doc))
+        except sqlite3.IntegrityError:
+            existing = self.find_active_by_hash(doc["file_hash"])
+            if existing:
+                raise DuplicateDocumentError(existing)
+            raise
+        return doc
+
+    def mark_deleted(self, doc_id: str, deleted_date: str) -> Optional[Dict[str, Any]]:
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            cursor = conn.execute(
+                "UPDATE documents SET status = 'deleted', deleted_date = ? WHERE id = ?",
+                (deleted_date, doc_id)
+            )
+        return self.get(doc_id) if cursor.rowcount else None
+
+    def replace_all(self, documents: List[Dict[str, Any]]):
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM documents")
+            conn.executemany(self._insert_sql(), [self._to_row(doc) for doc in documents])
+
+    # --- полнотекстовый поиск ---
+
+    def indexed_content_keys(self) -> Optional[set]:
+        """Файлы, текст которых уже есть в chunks_fts (None без FTS5)"""
+        if not self.supports_full_text:
+            return None
+        rows = self._connect().execute("SELECT doc_key FROM content_index").fetchall()
+        return {row["doc_key"] for row in rows}
+
+    def index_chunks(self, doc_key: str, doc_id: Optional[str], chunks: List[str]):
+        """Заменяет текст чанков файла в полнотекстовом индексе"""
+        if not self.supports_full_text:
+            return
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM chunks_fts WHERE doc_key = ?", (doc_key,))
+            conn.executemany(
+                "INSERT INTO chunks_fts (text, doc_key, doc_id, chunk_id) VALUES (?, ?, ?, ?)",
+                [(_fold(text), doc_key, doc_id, idx) for idx, text in enumerate(chunks)]
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO content_index (doc_key, doc_id, chunk_count) VALUES (?, ?, ?)",
+                (doc_key, doc_id, len(chunks))
+            )
+
+    def remove_chunks(self, doc_key: str):
+        if not self.supports_full_text:
+            return
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM chunks_fts WHERE doc_key = ?", (doc_key,))
+            conn.execute("DELETE FROM content_index WHERE doc_key = ?", (doc_key,))
+
+    @staticmethod
+    def _build_match(query: str, operator: str) -> Optional[str]:
+        """Запрос пользователя -> выражение MATCH: каждый токен в кавычках и с префиксом"""
+        tokens = _QUERY_TOKEN_RE.findall(_fold(query))
+        if not tokens:
+            return None
+        return f" {operator} ".join(f'"{token}"*' for token in tokens)
+
+    def search(self, query: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """
+        Ранжированный поиск по каталогу и тексту документов.
+        Сначала ищутся документы со всеми словами запроса, при пустом результате — с любым.
+        Счет документа: bm25 по полям каталога (с весом) + лучший bm25 по его чанкам.
+        """
+        if not self.supports_full_text:
+            return _substring_search(self.list_active(), query, limit)
+
+        for operator in ("AND", "OR"):
+            match = self._build_match(query, operator)
+            if match is None:
+                return []
+            results = self._search_match(match, limit)
+            if results:
+                return results
+        return []
+
+    def _search_match(self, match: str, limit: int) -> List[Dict[str, Any]]:
+        conn = self._connect()
+        weights = ", ".join(str(w) for w in self._CATALOG_WEIGHTS)
+        catalog_rows = conn.execute(f"""
+            SELECT d.*, bm25(documents_fts, {weights}) AS rank
+            FROM documents_fts
+            JOIN documents d ON d.rowid = documents_fts.rowid
+            WHERE documents_fts MATCH ? AND d.status = 'active'
+            ORDER BY rank
+            LIMIT ?
+        """, (match, limit * 5)).fetchall()
+        chunk_rows = conn.execute("""
+            SELECT doc_key, doc_id, chunk_id,
+                   snippet(chunks_fts, 0, '[', ']', '…', 16) AS snippet,
+                   bm25(chunks_fts) AS rank
+            FROM chunks_fts
+            WHERE chunks_fts MATCH ?
+            ORDER BY rank
+            LIMIT ?
+        """, (match, limit * 20)).fetchall()
+
+        results: Dict[str, Dict[str, Any]] = {}
+        for row in catalog_rows:
+            doc = self._from_row(row)
+            results[doc["stored_filename"]] = {
+                **doc, "score": -row["rank"] * self._CATALOG_BOOST, "snippets": []
+            }
+
+        active_by_key = None
+        for row in chunk_rows:
+            entry = results.get(row["doc_key"])
+            if entry is None:
+                if active_by_key is None:
+                    active_by_key = {doc["stored_filename"]: doc for doc in self.list_active()}
+                doc = active_by_key.get(row["doc_key"])
+                if doc is None and row["doc_id"]:
+                    # Документ зарегистрирован, но удален — пропускаем
+                    continue
+                entry = results[row["doc_key"]] = {
+                    **(doc or {"id": None, "stored_filename": row["doc_key"], "title": row["doc_key"]}),
+                    "score": 0.0,
+                    "snippets": []
+                }
+            if not entry["snippets"]:
+                # bm25 отрицателен: чем меньше, тем релевантнее; берем лучший чанк
+                entry["score"] += -row["rank"]
+            if len(entry["snippets"]) < 3:
+                entry["snippets"].append(row["snippet"])
+
+        ranked = sorted(results.values(), key=lambda item: item["score"], reverse=True)
+        for item in ranked:
+            item["score"] = round(item["score"], 4)
+        return ranked[:limit]
+
+def create_document_store(backend: str, data_folder: Path, metadata_file: str):
+    """Фабрика хранилища каталога по имени backend ('sqlite' или 'json')"""
+    data_folder = Path(data_folder)
+    json_file = data_folder / metadata_file
+    if backend == "json":
+        return JsonDocumentStore(json_file)
+    if backend == "sqlite":
+        return SqliteDocumentStore(data_folder / "documents.sqlite3", legacy_json_file=json_file)
+    raise ValueError(f"Unknown document store backend: {backend}")
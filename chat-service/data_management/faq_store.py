@@ -0,0 +1,138 @@
+import os
+import json
+import threading
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, List, Optional, Any
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+def normalize_question(text: str) -> str:
+    """Нормализованный вопрос: нижний регистр, одинарные пробелы, без финальной пунктуации"""
+    return " ".join(text.lower().replace("ё", "е").split()).rstrip("?!. ")
+
+class FaqAnswerStore:
+    """
+    Таблица заранее вычисленных ответов на частые вопросы одной коллекции.
+    Хранится в JSON рядом с индексом; ответы действительны только для того
+    поколения индекса, для которого они посчитаны. Поиск — точное совпадение
+    нормализованного вопроса, затем ближайший вопрос по косинусу эмбеддингов.
+    Файл перечитывается, если его обновил другой процесс.
+    """
+    VERSION = 1
+
+    def __init__(self, store_file: Path, embeddings):
+        self.store_file = Path(store_file)
+        self.embeddings = embeddings
+        self._lock = threading.RLock()
+        self._mtime: Optional[float] = None
+        self.generation = ""
+        self._entries: List[Dict[str, Any]] = []
+        self._by_question: Dict[str, int] = {}
+        self._matrix: Optional[np.ndarray] = None
+
+    def _reload_if_changed(self):
+        try:
+            mtime = self.store_file.stat().st_mtime
+        except FileNotFoundError:
+            return
+        if mtime == self._mtime:
+            return
+
+        try:
+            with open(self.store_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception as e:
+            logger.error(f"Error loading FAQ answers {self.store_file}: {e}")
+            return
+
+        self._mtime = mtime
+        if data.get("version") != self.VERSION:
+            return
+        self._set_entries(data.get("generation", ""), data.get("entries", []))
+
+    def _set_entries(self, generation: str, entries: List[Dict[str, Any]]):
+        self.generation = generation
+        self._entries = entries
+        self._by_question = {normalize_question(entry["question"]): i for i, entry in enumerate(entries)}
+        if entries:
+            matrix = np.asarray([entry["embedding"] for entry in entries], dtype=np.float32)
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            self._matrix = matrix / np.maximum(norms, 1e-12)
+        else:
+            self._matrix = None
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._reload_if_changed()
+            return len(self._entries)
+
+    def is_current(self, generation: str) -> bool:
+        """Посчитаны ли ответы для данного поколения индекса"""
+        with self._lock:
+            self._reload_if_changed()
+            return bool(self._entries) and self.generation == generation
+
+    def embed_questions(self, questions: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(questions)
+
+    def lookup_exact(self, question: str, generation: str) -> Optional[Dict[str, Any]]:
+        """Ответ на точно такой же (после нормализации) вопрос"""
+        with self._lock:
+            self._reload_if_changed()
+            if self.generation != generation:
+                return None
+            index = self._by_question.get(normalize_question(question))
+            return self._public(self._entries[index], 1.0) if index is not None else None
+
+    def lookup(self, question: str, generation: str, threshold: float,
+               vector: Optional[List[float]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Ответ на ближайший вопрос, если сходство не ниже threshold.
+        vector — уже посчитанный эмбеддинг вопроса, иначе он считается синхронно.
+        """
+        exact = self.lookup_exact(question, generation)
+        if exact or self._matrix is None or self.generation != generation:
+            return exact
+
+        if vector is None:
+            vector = self.embeddings.embed_query(question)
+        query = np.array(vector, dtype=np.float32)
+        query /= max(float(np.linalg.norm(query)), 1e-12)
+        with self._lock:
+            if self._matrix is None or self._matrix.shape[1] != query.shape[0]:
+                return None
+            scores = self._matrix @ query
+            best = int(np.argmax(scores))
+            score = float(scores[best])
+            if score < threshold:
+                return None
+            return self._public(self._entries[best], score)
+
+    @staticmethod
+    def _public(entry: Dict[str, Any], score: float) -> Dict[str, Any]:
+        return {
+            "question": entry["question"],
+            "answer": entry["answer"],
+            "sources": entry.get("sources", []),
+            "score": round(score, 4),
+        }
+
+    def replace(self, generation: str, entries: List[Dict[str, Any]]):
+        """Атомарно заменяет таблицу ответов (entries: question, answer, sources, embedding)"""
+        with self._lock:
+            data = {
+                "version": self.VERSION,
+                "generation": generation,
+                "created": datetime.now().isoformat(),
+                "entries": entries,
+            }
+            tmp_file = self.store_file.with_name(self.store_file.name + ".tmp")
+            with open(tmp_file, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_file, self.store_file)
+            self._mtime = self.store_file.stat().st_mtime
+            self._set_entries(generation, entries)
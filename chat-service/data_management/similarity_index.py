@@ -0,0 +1,185 @@
+import os
+import re
+import json
+import zlib
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Any
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Простое число Мерсенна для универсального хеширования (a*x + b) mod p.
+# a и b берутся < 2^32, поэтому a*x + b при 32-битном x не переполняет uint64.
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+_BLOCK_SIZE = 8192  # шинглов за один проход, чтобы не раздувать матрицу
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+class MinHashLSHIndex:
+    """
+    Персистентный индекс MinHash-сигнатур с LSH-бандами для поиска почти-дубликатов.
+    Сигнатуры хранятся в JSON рядом с метаданными коллекции, банды строятся в памяти при загрузке.
+    С параметрами по умолчанию (128 перестановок, 32 банды по 4 строки) кандидатами
+    становятся документы с Jaccard примерно от 0.4.
+    """
+    VERSION = 1
+
+    def __init__(self, index_file: Path, num_perm: int = 128, bands: int = 32,
+                 shingle_size: int = 5, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.index_file = Path(index_file)
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.seed = seed
+
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, 1 << 32, size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, 1 << 32, size=num_perm, dtype=np.uint64)
+
+        self._lock = threading.RLock()
+        self._signatures: Dict[str, np.ndarray] = {}
+        self._info: Dict[str, Dict[str, Any]] = {}
+        self._buckets: List[Dict[bytes, set]] = [dict() for _ in range(bands)]
+        self._loaded = False
+
+    # --- сигнатуры ---
+
+    def shingles(self, text: str) -> set:
+        """Множество словесных k-грамм нормализованного текста"""
+        words = _WORD_RE.findall(text.lower())
+        if not words:
+            return set()
+        k = self.shingle_size
+        if len(words) <= k:
+            return {" ".join(words)}
+        return {" ".join(words[i:i + k]) for i in range(len(words) - k + 1)}
+
+    def signature(self, text: str) -> Optional[np.ndarray]:
+        """MinHash-сигнатура текста (None, если в тексте нет слов)"""
+        shingles = self.shingles(text)
+        if not shingles:
+            return None
+
+        hashes = np.fromiter(
+            (zlib.crc32(s.encode("utf-8")) for s in shingles),
+            dtype=np.uint64,
+            count=len(shingles)
+        )
+        signature = np.full(self.num_perm, _MAX_HASH, dtype=np.uint64)
+        for start in range(0, len(hashes), _BLOCK_SIZE):
+            block = hashes[start:start + _BLOCK_SIZE, None]
+            permuted = ((block * self._a + self._b) % _MERSENNE_PRIME) & _MAX_HASH
+            np.minimum(signature, permuted.min(axis=0), out=signature)
+        return signature
+
+    def jaccard(self, sig_a: np.ndarray, sig_b: np.ndarray) -> float:
+        """Оценка коэффициента Жаккара по сигнатурам"""
+        return float(np.count_nonzero(sig_a == sig_b)) / self.num_perm
+
+    def _band_keys(self, signature: np.ndarray):
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    # --- хранилище ---
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        if not self.index_file.exists():
+            return
+        try:
+            with open(self.index_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception as e:
+            logger.error(f"Error loading similarity index {self.index_file}: {e}")
+            return
+
+        params = (data.get("version"), data.get("num_perm"), data.get("bands"),
+                  data.get("shingle_size"), data.get("seed"))
+        if params != (self.VERSION, self.num_perm, self.bands, self.shingle_size, self.seed):
+            logger.info(f"Similarity index parameters changed, rebuilding {self.index_file}")
+            return
+
+        for key, entry in data.get("documents", {}).items():
+            signature = np.asarray(entry.pop("signature"), dtype=np.uint64)
+            self._insert(key, signature, entry)
+
+    def save(self):
+        """Атомарно сохраняет сигнатуры на диск"""
+        with self._lock:
+            self._ensure_loaded()
+            data = {
+                "version": self.VERSION,
+                "num_perm": self.num_perm,
+                "bands": self.bands,
+                "shingle_size": self.shingle_size,
+                "seed": self.seed,
+                "documents": {
+                    key: {**self._info[key], "signature": sig.tolist()}
+                    for key, sig in self._signatures.items()
+                }
+            }
+            tmp_file = self.index_file.with_name(self.index_file.name + ".tmp")
+            with open(tmp_file, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_file, self.index_file)
+
+    def _insert(self, key: str, signature: np.ndarray, info: Dict[str, Any]):
+        self._signatures[key] = signature
+        self._info[key] = info
+        for band, band_key in self._band_keys(signature):
+            self._buckets[band].setdefault(band_key, set()).add(key)
+
+    # --- публичный API ---
+
+    def keys(self) -> List[str]:
+        with self._lock:
+            self._ensure_loaded()
+            return list(self._signatures)
+
+    def add(self, key: str, signature: np.ndarray, **info):
+        """Добавляет (или заменяет) сигнатуру документа"""
+        with self._lock:
+            self._ensure_loaded()
+            self.remove(key)
+            self._insert(key, signature, info)
+
+    def remove(self, key: str) -> bool:
+        """Удаляет документ из индекса"""
+        with self._lock:
+            self._ensure_loaded()
+            signature = self._signatures.pop(key, None)
+            if signature is None:
+                return False
+            self._info.pop(key, None)
+            for band, band_key in self._band_keys(signature):
+                bucket = self._buckets[band].get(band_key)
+                if bucket:
+                    bucket.discard(key)
+                    if not bucket:
+                        del self._buckets[band][band_key]
+            return True
+
+    def query(self, signature: np.ndarray, threshold: float = 0.5) -> List[Tuple[str, float, Dict[str, Any]]]:
+        """Кандидаты из LSH-бакетов с оценкой Жаккара >= threshold, по убыванию"""
+        with self._lock:
+            self._ensure_loaded()
+            candidates = set()
+            for band, band_key in self._band_keys(signature):
+                candidates.update(self._buckets[band].get(band_key, ()))
+
+            results = []
+            for key in candidates:
+                score = self.jaccard(signature, self._signatures[key])
+                if score >= threshold:
+                    results.append((key, score, dict(self._info[key])))
+        results.sort(key=lambda item: item[1], reverse=True)
+        return results
@@ -7,7 +7,7 @@ import logging
 from langchain_community.vectorstores import FAISS
 from langchain.docstore.document import Document
 
-from data_management.document_processor import process_document_folder
+from data_management.document_processor import process_document_folder, INDEXABLE_EXTENSIONS
 
 logger = logging.getLogger(__name__)
 
@@ -98,7 +98,7 @@ async def calculate_folder_fingerprint(folder_path: Path) -> Dict[str, Any]:
     fingerprint = {}
     
     for file_path in folder_path.rglob("*"):
-        if file_path.is_file() and file_path.suffix.lower() in ['.pdf', '.docx', '.txt']:
+        if file_path.is_file() and file_path.suffix.lower() in INDEXABLE_EXTENSIONS:
             relative_path = file_path.relative_to(folder_path)
             stat = file_path.stat()
             
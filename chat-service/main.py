@@ -1,6 +1,6 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse
 from contextlib import asynccontextmanager
 import asyncio
 import os
@@ -18,6 +18,14 @@ logger = logging.getLogger(__name__)
 from core.vectorstore_manager import VectorstoreManager
 from core.cache_manager import CacheManager
 from core.async_processor import AsyncDocumentProcessor
+from core.session_store import ChatSessionStore
+from core.llm_gateway import LLMGateway
+from core.single_flight import SingleFlight
+from core.metrics import metrics
+from app.chat_assistant import ChatAssistant
+from app.faq_warmer import FaqWarmer
+from app.prompts import get_teacher_prompt_template, get_student_prompt_template
+from data_management.faq_store import FaqAnswerStore
 from app.embeddings import embeddings
 from config import settings
 
@@ -35,6 +43,12 @@ from typing import Optional
 teacher_vectorstore_manager: Optional[VectorstoreManager] = None
 student_vectorstore_manager: Optional[VectorstoreManager] = None
 cache_manager: Optional[CacheManager] = None
+document_processor: Optional[AsyncDocumentProcessor] = None
+chat_sessions: dict = {}
+llm_gateway: Optional[LLMGateway] = None
+single_flight: Optional[SingleFlight] = None
+faq_stores: dict = {}
+faq_warmer: Optional[FaqWarmer] = None
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -51,19 +65,43 @@ async def lifespan(app: FastAPI):
     cache_manager = CacheManager()
     await cache_manager.initialize()
     
+    # Общий шлюз к LLM (переиспользование клиентов и ограничение параллельности)
+    global llm_gateway
+    llm_gateway = LLMGateway()
+    
+    # Объединение одинаковых одновременных вопросов (в процессе и через Redis)
+    global single_flight
+    single_flight = SingleFlight(cache_manager)
+    
+    # История чатов по ролям (Redis, общая для воркеров)
+    global chat_sessions
+    chat_sessions = {
+        "teacher": ChatSessionStore(cache_manager, namespace="teacher"),
+        "student": ChatSessionStore(cache_manager, namespace="student")
+    }
+    
+    # Общий сервис обработки документов (пулы потоков и процессов)
+    global document_processor
+    document_processor = AsyncDocumentProcessor()
+    await document_processor.start()
+    
     # Инициализируем векторные хранилища асинхронно
     global teacher_vectorstore_manager, student_vectorstore_manager
     
     teacher_vectorstore_manager = VectorstoreManager(
         settings.data_folder,
         settings.indexes_folder,
-        embeddings
+        embeddings,
+        processor=document_processor,
+        cache_manager=cache_manager
     )
     
     student_vectorstore_manager = VectorstoreManager(
         settings.data_folder_stud,
         settings.indexes_folder_stud,
-        embeddings
+        embeddings,
+        processor=document_processor,
+        cache_manager=cache_manager
     )
     
     # Параллельная инициализация
@@ -72,18 +110,58 @@ async def lifespan(app: FastAPI):
         student_vectorstore_manager.initialize()
     )
     
+    # Таблицы готовых ответов на частые вопросы и их фоновый прогрев
+    global faq_stores, faq_warmer
+    faq_stores = {
+        "teacher": FaqAnswerStore(Path(settings.indexes_folder) / "faq_answers.json", embeddings),
+        "student": FaqAnswerStore(Path(settings.indexes_folder_stud) / "faq_answers.json", embeddings)
+    }
+    faq_warmer = FaqWarmer(
+        {
+            role: ChatAssistant(
+                vectorstore_manager=vectorstore,
+                prompt_template=prompt,
+                cache_manager=cache_manager,
+                llm_gateway=llm_gateway
+            )
+            for role, vectorstore, prompt in (
+                ("teacher", teacher_vectorstore_manager, get_teacher_prompt_template()),
+                ("student", student_vectorstore_manager, get_student_prompt_template())
+            )
+        },
+        faq_stores,
+        cache_manager
+    )
+    # Если индекс изменился с прошлого прогрева — пересчитываем ответы в фоне
+    for role in faq_stores:
+        faq_warmer.schedule(role)
+    
     logger.info('✅ All systems initialized')
     
     # Устанавливаем глобальные переменные для роутеров
     app.state.teacher_vectorstore = teacher_vectorstore_manager
     app.state.student_vectorstore = student_vectorstore_manager
     app.state.cache = cache_manager
+    app.state.processor = document_processor
+    app.state.chat_sessions = chat_sessions
+    app.state.llm = llm_gateway
+    app.state.single_flight = single_flight
+    app.state.faq_stores = faq_stores
+    app.state.faq_warmer = faq_warmer
     
     yield
     
     # Shutdown
     logger.info('🛑 Shutting down Chat Service...')
     
+    # Останавливаем фоновый прогрев FAQ
+    if faq_warmer:
+        await faq_warmer.shutdown()
+    
+    # Останавливаем пулы обработки документов
+    if document_processor:
+        await document_processor.shutdown()
+    
     # Закрываем соединения
     if cache_manager:
         await cache_manager.close()
@@ -111,6 +189,12 @@ async def add_context_middleware(request, call_next):
     request.state.teacher_vectorstore = teacher_vectorstore_manager
     request.state.student_vectorstore = student_vectorstore_manager
     request.state.cache = cache_manager
+    request.state.processor = document_processor
+    request.state.chat_sessions = chat_sessions
+    request.state.llm = llm_gateway
+    request.state.single_flight = single_flight
+    request.state.faq_stores = faq_stores
+    request.state.faq_warmer = faq_warmer
     
     response = await call_next(request)
     return response
@@ -156,7 +240,7 @@ async def health_check():
     if cache_manager and cache_manager.enabled:
         try:
             await cache_manager.set("health_check", "ok", ttl=10)
-            cache_ok = await cache_manager.get("health_check") == "ok"
+            cache_ok = await cache_manager.get("health_check", use_local=False) == "ok"
             health_status["components"]["cache"] = "ok" if cache_ok else "error"
         except:
             health_status["components"]["cache"] = "error"
@@ -173,26 +257,97 @@ async def health_check():
     
     return health_status
 
-@app.get("/api/stats")
-async def get_stats():
-    """Статистика сервиса"""
+def _default_executor_stats() -> dict:
+    """Очередь пула потоков по умолчанию (run_in_executor(None, ...): поиск, эмбеддинги)"""
+    executor = getattr(asyncio.get_running_loop(), "_default_executor", None)
+    if executor is None:
+        return {"queued": 0, "threads": 0}
+    return {
+        "queued": executor._work_queue.qsize(),
+        "threads": len(executor._threads),
+        "max_workers": executor._max_workers
+    }
+
+def _collect_stats() -> dict:
+    collections = {
+        role: manager.get_stats()
+        for role, manager in (("teacher", teacher_vectorstore_manager), ("student", student_vectorstore_manager))
+        if manager
+    }
     stats = {
         "cache_enabled": settings.enable_cache,
-        "documents": {
-            "teacher": len(list(Path(settings.data_folder).glob("**/*"))) if Path(settings.data_folder).exists() else 0,
-            "student": len(list(Path(settings.data_folder_stud).glob("**/*"))) if Path(settings.data_folder_stud).exists() else 0
-        }
+        # Подсчет файлов кешируется в менеджерах индексов
+        "documents": {role: collection["documents"] for role, collection in collections.items()},
+        "collections": collections,
+        "executors": {"default": _default_executor_stats()}
     }
     
     if cache_manager and cache_manager.enabled:
         # Добавляем статистику кеша если доступно
         stats["cache"] = {
             "ttl": settings.cache_ttl,
-            "connected": cache_manager.redis_client is not None
+            "connected": cache_manager.redis_client is not None,
+            **cache_manager.get_stats()
         }
     
+    if document_processor:
+        stats["document_processor"] = document_processor.get_stats()
+    
+    if llm_gateway:
+        stats["llm"] = llm_gateway.get_stats()
+    
+    if single_flight:
+        stats["single_flight"] = single_flight.get_stats()
+    
     return stats
 
+@app.get("/api/stats")
+async def get_stats():
+    """Статистика сервиса: состояние компонентов и метрики (задержки, попадания в кеш, токены)"""
+    stats = _collect_stats()
+    stats["metrics"] = metrics.snapshot()
+    return stats
+
+def _stats_gauges(stats: dict) -> list:
+    """Мгновенные значения из статистики в виде gauges Prometheus"""
+    gauges = []
+    for role, collection in stats["collections"].items():
+        for field in ("documents", "vectors", "chunks", "index_bytes"):
+            gauges.append((f"chat_index_{field}", f"Index {field} per collection",
+                           {"role": role}, collection[field]))
+        gauges.append(("chat_index_info", "Current index generation per collection",
+                       {"role": role, "generation": collection["generation"]}, 1))
+    
+    executor = stats["executors"]["default"]
+    gauges.append(("chat_executor_queued", "Tasks waiting in executor pools", {"pool": "default"}, executor["queued"]))
+    processor = stats.get("document_processor")
+    if processor:
+        gauges.append(("chat_documents_waiting", "Documents waiting for processing", {}, processor["documents_waiting"]))
+        gauges.append(("chat_documents_active", "Documents being processed", {}, processor["documents_active"]))
+        for pool in ("thread_pool", "process_pool"):
+            gauges.append(("chat_executor_queued", "Tasks waiting in executor pools",
+                           {"pool": pool}, processor[pool]["queue_depth"]))
+            gauges.append(("chat_executor_in_flight", "Tasks running in executor pools",
+                           {"pool": pool}, processor[pool]["in_flight"]))
+    
+    for model, limiter in stats.get("llm", {}).items():
+        gauges.append(("chat_llm_in_flight", "LLM calls in progress", {"model": model}, limiter["in_flight"]))
+        gauges.append(("chat_llm_waiting", "LLM calls waiting for a slot", {"model": model}, limiter["waiting"]))
+    
+    local_cache = stats.get("cache", {}).get("l1")
+    if local_cache:
+        gauges.append(("chat_cache_l1_entries", "Entries in the in-process cache", {}, local_cache["entries"]))
+        gauges.append(("chat_cache_l1_bytes", "Bytes in the in-process cache", {}, local_cache["bytes"]))
+    return gauges
+
+@app.get("/api/metrics")
+async def get_metrics():
+    """Метрики в текстовом формате Prometheus"""
+    return PlainTextResponse(
+        metrics.render(_stats_gauges(_collect_stats())),
+        media_type="text/plain; version=0.0.4"
+    )
+
 # Download endpoint
 @app.get("/api/download/{filename}")
 async def download_file(filename: str):
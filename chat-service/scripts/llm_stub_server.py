@@ -0,0 +1,177 @@
+# chat-service/scripts/llm_stub_server.py
+# Локальная заглушка OpenAI-совместимого API (chat completions + embeddings)
+# для нагрузочного тестирования без расхода кредитов OpenAI.
+#
+# Запуск:
+#   python scripts/llm_stub_server.py --port 8099 --latency 0.4 --tokens-per-second 40
+# и в .env сервиса:
+#   LLM_BACKEND=stub
+#   LLM_STUB_URL=http://localhost:8099/v1
+# Embeddings заглушки не совместимы с реальными: для теста укажите отдельные
+# INDEXES_FOLDER / INDEXES_FOLDER_STUD, чтобы индекс построился заново.
+
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import random
+import time
+import uuid
+from typing import List
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+import uvicorn
+
+WORDS = (
+    "студент документ программа поступление практика деканат расписание экзамен "
+    "заявление срок модуль тест университет магистратура бакалавриат кредит "
+    "семестр консультация требования приказ стипендия"
+).split()
+
+class StubConfig:
+    latency = 0.3             # задержка до первого токена (секунды)
+    jitter = 0.1              # случайная добавка к задержке (доля от latency)
+    tokens_per_second = 50.0  # скорость генерации
+    answer_tokens = 120       # длина ответа в токенах (словах)
+    embedding_dim = 384
+    embedding_latency = 0.02  # на один запрос embeddings
+    error_rate = 0.0          # доля ответов 500
+
+config = StubConfig()
+app = FastAPI(title="OpenAI API stub")
+
+def _first_token_delay() -> float:
+    return max(config.latency * (1 + random.uniform(-config.jitter, config.jitter)), 0.0)
+
+def _answer_words(prompt: str) -> List[str]:
+    # Ответ детерминирован по промпту: одинаковые запросы дают одинаковый текст
+    rng = random.Random(hashlib.md5(prompt.encode("utf-8")).hexdigest())
+    return [rng.choice(WORDS) for _ in range(config.answer_tokens)]
+
+def _prompt_text(body: dict) -> str:
+    return "\n".join(str(message.get("content", "")) for message in body.get("messages", []))
+
+def _usage(prompt: str, completion_tokens: int) -> dict:
+    prompt_tokens = len(prompt.split())
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+def _should_fail() -> bool:
+    return config.error_rate > 0 and random.random() < config.error_rate
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    if _should_fail():
+        return JSONResponse({"error": {"message": "stub failure", "type": "server_error"}}, status_code=500)
+
+    prompt = _prompt_text(body)
+    words = _answer_words(prompt)
+    model = body.get("model", "stub")
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    created = int(time.time())
+    token_delay = 1.0 / config.tokens_per_second if config.tokens_per_second > 0 else 0.0
+
+    if not body.get("stream"):
+        await asyncio.sleep(_first_token_delay() + token_delay * len(words))
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": " ".join(words)},
+                "finish_reason": "stop",
+            }],
+            "usage": _usage(prompt, len(words)),
+        }
+
+    async def stream():
+        def chunk(delta: dict, finish_reason=None) -> str:
+            data = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+        await asyncio.sleep(_first_token_delay())
+        yield chunk({"role": "assistant", "content": ""})
+        for index, word in enumerate(words):
+            yield chunk({"content": word if index == 0 else " " + word})
+            if token_delay:
+                await asyncio.sleep(token_delay)
+        yield chunk({}, finish_reason="stop")
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+def _embed(text: str) -> List[float]:
+    """Hashing trick по словам: похожие тексты получают близкие векторы"""
+    vector = [0.0] * config.embedding_dim
+    for word in str(text).lower().split():
+        digest = hashlib.md5(word.encode("utf-8")).digest()
+        index = int.from_bytes(digest[:4], "little") % config.embedding_dim
+        vector[index] += 1.0 if digest[4] & 1 else -1.0
+    norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+    return [value / norm for value in vector]
+
+@app.post("/v1/embeddings")
+async def embeddings(request: Request):
+    body = await request.json()
+    if _should_fail():
+        return JSONResponse({"error": {"message": "stub failure", "type": "server_error"}}, status_code=500)
+
+    inputs = body.get("input", [])
+    if not isinstance(inputs, list):
+        inputs = [inputs]
+    await asyncio.sleep(config.embedding_latency)
+    data = [
+        {"object": "embedding", "index": index, "embedding": _embed(text)}
+        for index, text in enumerate(inputs)
+    ]
+    tokens = sum(len(str(text).split()) for text in inputs)
+    return {
+        "object": "list",
+        "data": data,
+        "model": body.get("model", "stub"),
+        "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+    }
+
+@app.get("/v1/models")
+async def models():
+    return {"object": "list", "data": [{"id": "stub", "object": "model", "owned_by": "stub"}]}
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI-compatible stub server")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency", type=float, default=config.latency, help="задержка до первого токена, с")
+    parser.add_argument("--jitter", type=float, default=config.jitter, help="разброс задержки (доля)")
+    parser.add_argument("--tokens-per-second", type=float, default=config.tokens_per_second)
+    parser.add_argument("--answer-tokens", type=int, default=config.answer_tokens)
+    parser.add_argument("--embedding-dim", type=int, default=config.embedding_dim)
+    parser.add_argument("--embedding-latency", type=float, default=config.embedding_latency)
+    parser.add_argument("--error-rate", type=float, default=config.error_rate)
+    args = parser.parse_args()
+
+    config.latency = args.latency
+    config.jitter = args.jitter
+    config.tokens_per_second = args.tokens_per_second
+    config.answer_tokens = args.answer_tokens
+    config.embedding_dim = args.embedding_dim
+    config.embedding_latency = args.embedding_latency
+    config.error_rate = args.error_rate
+
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+# chat-service/scripts/load_test.py
+# Нагрузочный тест chat-service: /api/{role}/chat, /api/{role}/flowchart, /api/{role}/docs/upload.
+# Запросы отправляются с постоянной частотой (open-loop), независимо от скорости ответов.
+#
+# Пример (сервис запущен с LLM_BACKEND=stub, см. scripts/llm_stub_server.py):
+#   python scripts/load_test.py --base-url http://localhost:8000 --role student \
+#       --scenario chat=8,flowchart=1,upload=1 --rps 20 --duration 60 --repeat-ratio 0.5 --allow-writes
+#
+# Сценарий upload пишет в коллекцию роли: каждый документ регистрируется,
+# индекс перестраивается (кеши ответов и поиска сбрасываются). Поэтому он
+# требует --allow-writes и должен идти на тестовом стенде; загруженные
+# документы удаляются через DELETE /api/{role}/docs/{id} сразу после загрузки.
+
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+
+import httpx
+
+DEFAULT_QUESTIONS = [
+    "Как поступить на магистратуру?",
+    "Сколько модулей в AITU Excellence Test?",
+    "Какие документы нужны для поступления?",
+    "Как оформить производственную практику?",
+    "Когда проходит комплексное тестирование?",
+    "Какие образовательные программы есть в университете?",
+    "Как получить справку с места учебы?",
+    "Какой проходной балл на Software Engineering?",
+]
+
+WORDS = (
+    "университет студент программа практика документ приказ расписание экзамен "
+    "модуль кредит семестр деканат заявление стипендия магистратура"
+).split()
+
+class Stats:
+    """Задержки и ошибки по сценариям"""
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.statuses: Dict[str, Counter] = defaultdict(Counter)
+
+    def record(self, scenario: str, latency: float, status: Optional[int], ok: bool):
+        self.latencies[scenario].append(latency)
+        self.statuses[scenario][str(status) if status is not None else "exception"] += 1
+        if not ok:
+            self.errors[scenario] += 1
+
+def percentile(values: List[float], q: float) -> float:
+    """Перцентиль методом ближайшего ранга"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(int(round(q / 100.0 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+def parse_scenarios(value: str) -> Dict[str, float]:
+    weights = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ("chat", "flowchart", "upload"):
+            raise argparse.ArgumentTypeError(f"unknown scenario: {name}")
+        weights[name] = float(weight) if weight else 1.0
+    return weights
+
+class LoadTest:
+    def __init__(self, args):
+        self.args = args
+        self.stats = Stats()
+        self.questions = DEFAULT_QUESTIONS
+        if args.questions:
+            with open(args.questions, "r", encoding="utf-8") as f:
+                self.questions = [line.strip() for line in f if line.strip()]
+        self.scenarios = parse_scenarios(args.scenario)
+        # id документов, которые не удалось удалить после загрузки
+        self.leftover_docs: List[str] = []
+
+    def _question(self) -> str:
+        # Часть вопросов повторяется (проверка кеша и объединения запросов), остальные уникальны
+        question = random.choice(self.questions)
+        if random.random() >= self.args.repeat_ratio:
+            question = f"{question} ({uuid.uuid4().hex[:8]})"
+        return question
+
+    async def _chat(self, client: httpx.AsyncClient) -> httpx.Response:
+        return await client.post(
+            f"/api/{self.args.role}/chat",
+            json={"query": self._question(), "session_id": f"load-{uuid.uuid4().hex[:12]}"}
+        )
+
+    async def _flowchart(self, client: httpx.AsyncClient) -> httpx.Response:
+        return await client.post(
+            f"/api/{self.args.role}/flowchart",
+            json={"query": self._question()}
+        )
+
+    async def _upload(self, client: httpx.AsyncClient) -> httpx.Response:
+        words = [random.choice(WORDS) for _ in range(self.args.upload_words)]
+        content = (f"Нагрузочный тест {uuid.uuid4()}\n" + " ".join(words)).encode("utf-8")
+        return await client.post(
+            f"/api/{self.args.role}/docs/upload",
+            files={"file": (f"load_test_{uuid.uuid4().hex[:8]}.txt", content, "text/plain")}
+        )
+
+    async def _delete_uploaded(self, client: httpx.AsyncClient, response: httpx.Response):
+        """Удаляет загруженный документ (вне замера задержки загрузки)"""
+        try:
+            doc_id = response.json().get("document_id")
+        except ValueError:
+            return
+        if not doc_id:
+            return
+        try:
+            deleted = await client.delete(f"/api/{self.args.role}/docs/{doc_id}")
+            if deleted.status_code < 400:
+                return
+        except Exception:
+            pass
+        self.leftover_docs.append(doc_id)
+
+    async def _one(self, client: httpx.AsyncClient, scenario: str):
+        handler = getattr(self, f"_{scenario}")
+        started = time.perf_counter()
+        status = None
+        ok = False
+        response = None
+        try:
+            response = await handler(client)
+            status = response.status_code
+            ok = status < 400
+        except Exception:
+            pass
+        self.stats.record(scenario, time.perf_counter() - started, status, ok)
+        if scenario == "upload" and ok:
+            await self._delete_uploaded(client, response)
+
+    async def run(self) -> Dict:
+        names = list(self.scenarios)
+        weights = [self.scenarios[name] for name in names]
+        interval = 1.0 / self.args.rps
+        limits = httpx.Limits(max_connections=self.args.max_connections,
+                              max_keepalive_connections=self.args.max_connections)
+
+        async with httpx.AsyncClient(base_url=self.args.base_url, timeout=self.args.timeout,
+                                     limits=limits) as client:
+            tasks = []
+            started = time.perf_counter()
+            sent = 0
+            while True:
+                elapsed = time.perf_counter() - started
+                if elapsed >= self.args.duration:
+                    break
+                # Отправляем по расписанию, догоняя отставание
+                due = int(elapsed / interval) + 1
+                while sent < due:
+                    scenario = random.choices(names, weights)[0]
+                    tasks.append(asyncio.create_task(self._one(client, scenario)))
+                    sent += 1
+                await asyncio.sleep(max(interval - (time.perf_counter() - started) % interval, 0.001))
+            send_time = time.perf_counter() - started
+            await asyncio.gather(*tasks)
+            total_time = time.perf_counter() - started
+
+        return self.report(sent, send_time, total_time)
+
+    def report(self, sent: int, send_time: float, total_time: float) -> Dict:
+        result = {
+            "target_rps": self.args.rps,
+            "sent": sent,
+            "offered_rps": round(sent / send_time, 2) if send_time else 0.0,
+            "wall_time": round(total_time, 2),
+            "scenarios": {},
+            "leftover_docs": self.leftover_docs,
+        }
+        for scenario, latencies in sorted(self.stats.latencies.items()):
+            count = len(latencies)
+            errors = self.stats.errors[scenario]
+            result["scenarios"][scenario] = {
+                "requests": count,
+                "throughput_rps": round((count - errors) / total_time, 2) if total_time else 0.0,
+                "error_rate": round(errors / count, 4) if count else 0.0,
+                "p50": round(percentile(latencies, 50), 4),
+                "p95": round(percentile(latencies, 95), 4),
+                "p99": round(percentile(latencies, 99), 4),
+                "max": round(max(latencies), 4) if latencies else 0.0,
+                "statuses": dict(self.stats.statuses[scenario]),
+            }
+        return result
+
+def print_report(result: Dict):
+    print(f"target {result['target_rps']} rps, sent {result['sent']} "
+          f"(offered {result['offered_rps']} rps), wall time {result['wall_time']}s")
+    header = f"{'scenario':<10} {'reqs':>6} {'ok rps':>8} {'err %':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}  statuses"
+    print(header)
+    print("-" * len(header))
+    for scenario, row in result["scenarios"].items():
+        print(f"{scenario:<10} {row['requests']:>6} {row['throughput_rps']:>8} "
+              f"{row['error_rate'] * 100:>6.2f}% {row['p50']:>8.3f} {row['p95']:>8.3f} "
+              f"{row['p99']:>8.3f} {row['max']:>8.3f}  {row['statuses']}")
+    if result["leftover_docs"]:
+        print(f"WARNING: uploaded documents were not deleted: {', '.join(result['leftover_docs'])}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test for chat-service")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--role", choices=["teacher", "student"], default="student")
+    parser.add_argument("--scenario", default="chat",
+                        help="сценарии с весами, например chat=8,flowchart=1,upload=1 "
+                             "(upload изменяет коллекцию роли и перестраивает индекс, нужен --allow-writes)")
+    parser.add_argument("--allow-writes", action="store_true",
+                        help="разрешить сценарий upload: документы загружаются в коллекцию роли "
+                             "и удаляются после загрузки; только для тестового стенда")
+    parser.add_argument("--rps", type=float, default=5.0, help="целевая частота запросов")
+    parser.add_argument("--duration", type=float, default=30.0, help="длительность отправки, с")
+    parser.add_argument("--repeat-ratio", type=float, default=0.3,
+                        help="доля повторяющихся вопросов (0 — все уникальные)")
+    parser.add_argument("--questions", help="файл с вопросами, по одному на строку")
+    parser.add_argument("--upload-words", type=int, default=400)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--max-connections", type=int, default=200)
+    parser.add_argument("--json", dest="json_output", help="сохранить отчет в JSON")
+    args = parser.parse_args()
+    if "upload" in parse_scenarios(args.scenario) and not args.allow_writes:
+        parser.error("scenario upload writes to the role's document collection and rebuilds the index; "
+                     "pass --allow-writes (test environment only)")
+
+    result = asyncio.run(LoadTest(args).run())
+    print_report(result)
+    if args.json_output:
+        with open(args.json_output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
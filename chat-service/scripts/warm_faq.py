@@ -0,0 +1,62 @@
+# chat-service/scripts/warm_faq.py
+# Пакетный прогрев таблицы готовых ответов FAQ для коллекции.
+# Обычно запускается сервисом автоматически после переиндексации;
+# скрипт нужен для ручного запуска или cron.
+#
+#   python scripts/warm_faq.py --role student [--force]
+
+import os
+import sys
+import asyncio
+import argparse
+import logging
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import settings
+from core.cache_manager import CacheManager
+from core.vectorstore_manager import VectorstoreManager
+from core.llm_gateway import LLMGateway
+from app.chat_assistant import ChatAssistant
+from app.embeddings import embeddings
+from app.faq_warmer import FaqWarmer
+from app.prompts import get_teacher_prompt_template, get_student_prompt_template
+from data_management.faq_store import FaqAnswerStore
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+async def main():
+    parser = argparse.ArgumentParser(description="Warm precomputed FAQ answers")
+    parser.add_argument("--role", choices=["teacher", "student"], required=True)
+    parser.add_argument("--force", action="store_true", help="пересчитать, даже если ответы актуальны")
+    args = parser.parse_args()
+
+    if args.role == "teacher":
+        data_folder, index_folder, prompt = settings.data_folder, settings.indexes_folder, get_teacher_prompt_template()
+    else:
+        data_folder, index_folder, prompt = settings.data_folder_stud, settings.indexes_folder_stud, get_student_prompt_template()
+
+    cache_manager = CacheManager()
+    await cache_manager.initialize()
+    try:
+        vectorstore_manager = VectorstoreManager(data_folder, index_folder, embeddings, cache_manager=cache_manager)
+        await vectorstore_manager.initialize()
+
+        assistant = ChatAssistant(
+            vectorstore_manager=vectorstore_manager,
+            prompt_template=prompt,
+            cache_manager=cache_manager,
+            llm_gateway=LLMGateway()
+        )
+        store = FaqAnswerStore(Path(index_folder) / "faq_answers.json", embeddings)
+        warmer = FaqWarmer({args.role: assistant}, {args.role: store}, cache_manager)
+
+        count = await warmer.warm(args.role, force=args.force)
+        logger.info(f"FAQ answers stored: {count}")
+    finally:
+        await cache_manager.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())